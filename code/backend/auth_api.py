@@ -512,7 +512,7 @@ def require_api_key(f):
 # DashScope API 集成（添加认证保护）
 # ============================================================================
 
-from main import DashScopeClient, Config
+from main import Config, get_client, now_iso
 
 @app.route('/api/chat', methods=['POST'])
 @require_jwt_token
@@ -545,11 +545,12 @@ def chat():
             temperature = data.get('temperature', 0.7)
             max_tokens = data.get('max_tokens', 2000)
             
-            client = DashScopeClient(model=model)
+            client = get_client()
             
             task.update(30, "正在生成回答...")
             response = client.chat(
                 messages=messages,
+                model=model,
                 temperature=temperature,
                 max_tokens=max_tokens
             )
@@ -560,7 +561,7 @@ def chat():
             'success': True,
             'data': response,
             'task_id': task.id,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': now_iso()
         })
         
     except Exception as e:
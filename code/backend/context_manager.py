@@ -104,8 +104,8 @@ class ContextManager:
             return
         
         try:
-            # 获取最近的对话记录
-            conversations = self._storage.get_recent_conversations(limit=1000)
+            # 获取最近的对话记录（恢复会话需要完整的消息、系统提示词和 token 统计）
+            conversations = self._storage.get_recent_conversations(limit=1000, full=True)
             
             for conv in conversations:
                 session_id = conv.get('session_id')
@@ -285,15 +285,23 @@ class ContextManager:
                     session['token_usage']['output'] += token_count
             
             # 上下文窗口管理：检查是否超出最大消息数
+            dropped = 0
             if len(session['messages']) > self.max_messages:
                 # 保留 system prompt（如有）和最近的 max_messages 条消息
+                dropped = len(session['messages']) - self.max_messages
                 kept_messages = session['messages'][-(self.max_messages):]
                 session['messages'] = kept_messages
                 session['message_count'] = len(kept_messages)
             
-            # 持久化存储
+            # 持久化存储：只追加新消息（裁剪在 SQL 内完成），不重写整段历史
             if self._storage:
-                self._save_session(session_id)
+                conversation_id = session.get('conversation_id')
+                if not conversation_id or not self._storage.append_messages(
+                    conversation_id, [message],
+                    token_usage=session['token_usage'], drop_first=dropped
+                ):
+                    # 对话记录不存在或追加失败时整体保存
+                    self._save_session(session_id)
             
             return message
     
@@ -330,7 +338,56 @@ class ContextManager:
                 })
             
             return messages
-    
+
+    def get_messages_page(self, session_id: str, limit: int = 50,
+                          before_id: str = None) -> Dict[str, Any]:
+        """
+        分页获取会话消息（按时间正序，游标向更早的消息翻页）
+
+        Args:
+            session_id: 会话 ID
+            limit: 每页消息数
+            before_id: 游标，返回该消息之前的消息，None 表示最新一页
+
+        Returns:
+            {'messages': [...], 'next_cursor': 更早一页的游标或 None}
+
+        Raises:
+            ValueError: before_id 不属于该会话
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if not session:
+                return {'messages': [], 'next_cursor': None}
+
+            history = session['messages']
+            end = len(history)
+            if before_id is not None:
+                for index, msg in enumerate(history):
+                    if msg['id'] == before_id:
+                        end = index
+                        break
+                else:
+                    raise ValueError('before_id 不存在')
+
+            start = max(0, end - limit)
+            messages = [
+                {'id': msg['id'], 'role': msg['role'], 'content': msg['content']}
+                for msg in history[start:end]
+            ]
+
+            next_cursor = None
+            if start > 0:
+                next_cursor = history[start]['id']
+            elif session.get('system_prompt'):
+                # 已翻到最早一页，补上系统提示词
+                messages.insert(0, {
+                    'role': 'system',
+                    'content': session['system_prompt']
+                })
+
+            return {'messages': messages, 'next_cursor': next_cursor}
+
     def get_conversation_history(self, session_id: str) -> List[Dict[str, Any]]:
         """
         获取会话完整历史
@@ -365,6 +422,12 @@ class ContextManager:
             
             session['system_prompt'] = system_prompt
             session['updated_at'] = datetime.now().isoformat()
+            
+            # add_message 只追加消息，系统提示词需在此单独持久化；
+            # 尚未建档的会话会在首次保存时整体写入
+            conversation_id = session.get('conversation_id')
+            if self._storage and conversation_id:
+                self._storage.update_conversation(conversation_id, system_prompt=system_prompt)
             return True
     
     def delete_session(self, session_id: str) -> bool:
@@ -499,7 +562,7 @@ class ContextManager:
         if not self._storage:
             return []
         
-        return self._storage.search_conversations(keyword, limit=limit)
+        return self._storage.search_conversations(keyword, limit=limit, full=True)
     
     def export_history(self, session_id: str = None, format: str = 'json') -> str:
         """
@@ -17,9 +17,24 @@ import json
 import uuid
 import shutil
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from itertools import islice
+from typing import Optional, Dict, Any, List, Tuple, Iterator
 from threading import Lock
 
+# 可选：orjson 加速历史文件的读写（未安装时使用标准库 json）
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+# 导出时的角色显示名称
+ROLE_NAMES = {'user': '用户', 'assistant': '助手', 'system': '系统'}
+
+# 流式 JSON 导出使用的紧凑分隔符
+JSON_SEPARATORS = (',', ':')
+
 
 class HistoryManager:
     """对话历史管理器"""
@@ -50,13 +65,21 @@ class HistoryManager:
     def _load_from_file(self) -> List[Dict[str, Any]]:
         """从文件加载历史记录"""
         try:
+            if ORJSON_AVAILABLE:
+                with open(self.history_file, 'rb') as f:
+                    return orjson.loads(f.read())
             with open(self.history_file, 'r', encoding='utf-8') as f:
                 return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
+        except (FileNotFoundError, ValueError):
+            # json.JSONDecodeError 与 orjson.JSONDecodeError 均为 ValueError 子类
             return []
     
     def _save_to_file(self, data: List[Dict[str, Any]]) -> None:
-        """保存历史记录到文件"""
+        """保存历史记录到文件（与 json.dump(indent=2) 格式一致）"""
+        if ORJSON_AVAILABLE:
+            with open(self.history_file, 'wb') as f:
+                f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+            return
         with open(self.history_file, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
     
@@ -115,29 +138,65 @@ class HistoryManager:
             
             for conv in history:
                 if conv['id'] == conversation_id:
-                    message = {
-                        'id': str(uuid.uuid4())[:8],
-                        'role': role,
-                        'content': content,
-                        'timestamp': datetime.now().isoformat(),
-                        'token_count': token_count
-                    }
-                    
-                    conv['messages'].append(message)
-                    conv['updated_at'] = datetime.now().isoformat()
-                    
-                    # 更新 token 使用统计
-                    if token_count:
-                        if role == 'user':
-                            conv['token_usage']['input'] += token_count
-                        else:
-                            conv['token_usage']['output'] += token_count
-                    
+                    message = self._append_message(conv, role, content, token_count)
                     self._save_to_file(history)
                     return message
             
             return None
     
+    def add_messages(self, entries: List[Tuple[str, str, str, Optional[int]]]) -> int:
+        """
+        批量添加消息（只读写一次历史文件）
+        
+        Args:
+            entries: (对话 ID, 角色, 消息内容, Token 数量) 列表，按顺序追加
+            
+        Returns:
+            成功添加的消息数（对话不存在的条目会被跳过）
+        """
+        if not entries:
+            return 0
+        
+        with self.lock:
+            history = self._load_from_file()
+            conversations = {conv['id']: conv for conv in history}
+            
+            added = 0
+            for conversation_id, role, content, token_count in entries:
+                conv = conversations.get(conversation_id)
+                if conv is not None:
+                    self._append_message(conv, role, content, token_count)
+                    added += 1
+            
+            if added:
+                self._save_to_file(history)
+            return added
+    
+    @staticmethod
+    def _append_message(conv: Dict[str, Any], role: str, content: str,
+                        token_count: Optional[int]) -> Dict[str, Any]:
+        """向对话追加一条消息并更新 token 使用统计"""
+        timestamp = datetime.now().isoformat()
+        message = {
+            'id': str(uuid.uuid4())[:8],
+            'role': role,
+            'content': content,
+            'timestamp': timestamp,
+            'token_count': token_count
+        }
+        
+        conv['messages'].append(message)
+        conv['updated_at'] = timestamp
+        
+        # 更新 token 使用统计
+        if token_count:
+            if role == 'user':
+                conv['token_usage']['input'] += token_count
+            else:
+                conv['token_usage']['output'] += token_count
+        
+        return message
+    
     def get_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
         """
         获取对话详情
@@ -170,25 +229,63 @@ class HistoryManager:
         total = len(history)
         conversations = history[offset:offset + limit]
         
-        # 移除消息内容，只返回基本信息
-        preview = []
-        for conv in conversations:
-            preview.append({
-                'id': conv['id'],
-                'title': conv['title'],
-                'created_at': conv['created_at'],
-                'updated_at': conv['updated_at'],
-                'message_count': len(conv['messages']),
-                'token_usage': conv['token_usage']
-            })
-        
         return {
-            'conversations': preview,
+            'conversations': [self._to_preview(conv) for conv in conversations],
             'total': total,
             'limit': limit,
             'offset': offset
         }
     
+    def get_conversations_after(self, cursor: Optional[Tuple[str, str]] = None,
+                                limit: int = 20) -> Dict[str, Any]:
+        """
+        基于游标获取对话列表（按创建时间倒序）
+        
+        Args:
+            cursor: 上一页最后一条的 (created_at, id)，None 表示第一页
+            limit: 返回数量限制
+            
+        Returns:
+            对话列表、总数和下一页游标（没有更多数据时为 None）
+        """
+        history = self._load_from_file()
+        
+        if cursor is None:
+            candidates = iter(history)
+        else:
+            cursor = tuple(cursor)
+            candidates = (conv for conv in history
+                          if (conv['created_at'], conv['id']) < cursor)
+        
+        # 多取一条用于判断是否还有下一页
+        page = list(islice(candidates, limit + 1))
+        has_more = len(page) > limit
+        page = page[:limit]
+        
+        next_cursor = None
+        if has_more and page:
+            last = page[-1]
+            next_cursor = (last['created_at'], last['id'])
+        
+        return {
+            'conversations': [self._to_preview(conv) for conv in page],
+            'total': len(history),
+            'limit': limit,
+            'next_cursor': next_cursor
+        }
+    
+    @staticmethod
+    def _to_preview(conv: Dict[str, Any]) -> Dict[str, Any]:
+        """移除消息内容，只返回对话基本信息"""
+        return {
+            'id': conv['id'],
+            'title': conv['title'],
+            'created_at': conv['created_at'],
+            'updated_at': conv['updated_at'],
+            'message_count': len(conv['messages']),
+            'token_usage': conv['token_usage']
+        }
+    
     def delete_conversation(self, conversation_id: str) -> bool:
         """
         删除对话
@@ -250,22 +347,57 @@ class HistoryManager:
             return None
         
         if format == 'text':
-            lines = [f"# {conversation['title']}\n"]
-            lines.append(f"创建时间: {conversation['created_at']}\n")
-            lines.append(f"最后更新: {conversation['updated_at']}\n")
-            lines.append("-" * 40 + "\n")
-            
-            for msg in conversation['messages']:
-                role_name = {'user': '用户', 'assistant': '助手', 'system': '系统'}.get(
-                    msg['role'], msg['role']
-                )
-                lines.append(f"**{role_name}** ({msg['timestamp']}):\n")
-                lines.append(f"{msg['content']}\n\n")
-            
-            return ''.join(lines)
+            return ''.join(self._iter_text_export(conversation))
         else:
             return json.dumps(conversation, ensure_ascii=False, indent=2)
     
+    def iter_export(self, conversation_id: str, format: str = 'json') -> Optional[Iterator[str]]:
+        """
+        流式导出对话内容（逐条消息生成，供流式响应使用）
+        
+        Args:
+            conversation_id: 对话 ID
+            format: 导出格式 ('json' 或 'text')
+            
+        Returns:
+            内容片段迭代器，对话不存在返回 None
+        """
+        conversation = self.get_conversation(conversation_id)
+        if not conversation:
+            return None
+        
+        if format == 'text':
+            return self._iter_text_export(conversation)
+        return self._iter_json_export(conversation)
+    
+    @staticmethod
+    def _iter_text_export(conversation: Dict[str, Any]) -> Iterator[str]:
+        """按消息生成文本格式导出片段"""
+        yield (
+            f"# {conversation['title']}\n"
+            f"创建时间: {conversation['created_at']}\n"
+            f"最后更新: {conversation['updated_at']}\n"
+            + "-" * 40 + "\n"
+        )
+        
+        for msg in conversation['messages']:
+            role_name = ROLE_NAMES.get(msg['role'], msg['role'])
+            yield f"**{role_name}** ({msg['timestamp']}):\n{msg['content']}\n\n"
+    
+    @staticmethod
+    def _iter_json_export(conversation: Dict[str, Any]) -> Iterator[str]:
+        """生成 JSON 对象片段，messages 数组逐条序列化"""
+        header = {k: v for k, v in conversation.items() if k != 'messages'}
+        # 紧凑格式，与 API 其余 JSON 响应一致；去掉结尾的 '}'，接上 messages 数组
+        yield json.dumps(header, ensure_ascii=False, separators=JSON_SEPARATORS)[:-1]
+        yield ',"messages":[' if header else '"messages":['
+        
+        for index, msg in enumerate(conversation['messages']):
+            row = json.dumps(msg, ensure_ascii=False, separators=JSON_SEPARATORS)
+            yield row if index == 0 else ',' + row
+        
+        yield ']}'
+    
     def get_statistics(self) -> Dict[str, Any]:
         """
         获取统计信息
@@ -14,20 +14,67 @@ Bot 语音沟通 - 阿里云百炼大模型测试后端
 """
 
 import os
+
+# 可选：USE_GEVENT=1 时使用 gevent 协程服务，阻塞的 socket/subprocess 调用会让出执行权
+# （必须在导入其他模块之前打补丁，此时 .env 尚未加载，只能通过进程环境变量设置）
+GEVENT_ENABLED = False
+_USE_GEVENT_ENV = os.environ.get('USE_GEVENT')
+if (_USE_GEVENT_ENV or '').lower() in ('1', 'true', 'yes'):
+    try:
+        from gevent import monkey
+        monkey.patch_all()
+        GEVENT_ENABLED = True
+    except ImportError:
+        print("⚠️ 已设置 USE_GEVENT 但 gevent 未安装，使用默认多线程服务")
+        print("   安装命令: pip install gevent")
+
+# 加载 .env 文件（使用脚本所在目录，不依赖 cwd）
+# 须在读取 MAX_CONCURRENT_REQUESTS 等模块级配置之前加载，否则 .env 中的设置不生效
+try:
+    from dotenv import load_dotenv
+    _env_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
+    load_dotenv(dotenv_path=_env_path)
+except ImportError:
+    pass
+
+if _USE_GEVENT_ENV is None and os.environ.get('USE_GEVENT', '').lower() in ('1', 'true', 'yes'):
+    print("⚠️ .env 中的 USE_GEVENT 不生效（gevent 须在加载 .env 之前打补丁），请在启动命令中设置:")
+    print("   USE_GEVENT=1 python main.py --server")
+
 import sys
 import json
 import re
+import random
 import uuid
+import queue
+import atexit
 import logging
+import logging.handlers
 import threading
 import time
 import signal
+import shutil
+import struct
+import hashlib
+import base64
+import mimetypes
+import subprocess
+import statistics
+import gzip
+import zlib
+import math
+import operator
+import tempfile
 import traceback
 from datetime import datetime, timedelta
-from collections import defaultdict
-from typing import Optional, Dict, Any, List
-from functools import wraps
+from pathlib import Path
+from collections import defaultdict, deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeoutError
+from typing import Optional, Dict, Any, List, Callable, Tuple, Iterable, Iterator
+from functools import wraps, lru_cache
 from html import escape as html_escape
+from http import HTTPStatus
+from urllib.parse import unquote
 
 # #region agent log
 DEBUG_LOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '.cursor', 'debug.log')
@@ -180,9 +227,14 @@ class ConcurrentLimiter:
             return self.current_requests
 
 
+# 最大并发请求数：gevent 协程模式下单进程可同时挂起大量 IO 等待的请求，默认放宽
+MAX_CONCURRENT_REQUESTS = int(os.environ.get(
+    'MAX_CONCURRENT_REQUESTS', '200' if GEVENT_ENABLED else '10'
+))
+
 # 全局限流器和并发限制器实例
 rate_limiter = RateLimiter(max_requests=60, per_seconds=60)
-concurrent_limiter = ConcurrentLimiter(max_concurrent=10)
+concurrent_limiter = ConcurrentLimiter(max_concurrent=MAX_CONCURRENT_REQUESTS)
 
 
 def rate_limit_decorator(max_requests: int = 60, per_seconds: int = 60):
@@ -283,9 +335,10 @@ def async_timeout(seconds: int):
     注意：需在目标线程中复制 Flask 请求上下文，否则 request/g 不可用
     """
     def decorator(f):
+        from flask import copy_current_request_context, g
+        
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            from flask import copy_current_request_context, g
             request_id = getattr(g, 'request_id', None) or get_request_id()
             result = [None]
             exception = [None]
@@ -331,13 +384,39 @@ except ImportError:
     print("⚠️ psutil 未安装，资源监控功能将不可用")
     print("   安装命令: pip install psutil")
 
-# 加载 .env 文件（使用脚本所在目录，不依赖 cwd）
+# ============================================================================
+# 尝试导入 httpx 用于 HTTP/2 连接复用（可选）
+# ============================================================================
 try:
-    from dotenv import load_dotenv
-    _env_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
-    load_dotenv(dotenv_path=_env_path)
+    import httpx
+    HTTPX_AVAILABLE = True
 except ImportError:
-    pass
+    HTTPX_AVAILABLE = False
+
+# ============================================================================
+# 尝试导入 orjson 用于高性能 JSON 序列化
+# ============================================================================
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+# JSON 解析函数（优先使用 orjson，解析失败均抛出 ValueError 子类）
+json_loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+
+
+def json_dumps_bytes(data: Any) -> bytes:
+    """
+    将数据序列化为紧凑的 UTF-8 JSON 字节串
+    
+    优先使用 orjson，未安装时回退到标准库 json
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
 
 # ============================================================================
 # 结构化日志配置
@@ -346,9 +425,19 @@ except ImportError:
 class JSONFormatter(logging.Formatter):
     """JSON 格式日志格式化器"""
     
+    # 按秒缓存的 ISO 时间字符串（同一秒内的日志只拼接毫秒部分）
+    _last_sec = -1
+    _last_iso = ''
+    
     def format(self, record):
+        created = record.created
+        sec = int(created)
+        if sec != JSONFormatter._last_sec:
+            JSONFormatter._last_iso = datetime.utcfromtimestamp(sec).isoformat()
+            JSONFormatter._last_sec = sec
+        
         log_obj = {
-            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'timestamp': f"{JSONFormatter._last_iso}.{int((created - sec) * 1000):03d}Z",
             'level': record.levelname,
             'message': record.getMessage(),
             'logger': record.name,
@@ -356,29 +445,60 @@ class JSONFormatter(logging.Formatter):
             'function': record.funcName,
             'line': record.lineno,
         }
-        if hasattr(record, 'request_id') and record.request_id:
-            log_obj['request_id'] = record.request_id
-        if hasattr(record, 'extra_data') and record.extra_data:
-            log_obj['data'] = record.extra_data
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            log_obj['request_id'] = request_id
+        extra_data = getattr(record, 'extra_data', None)
+        if extra_data:
+            log_obj['data'] = extra_data
+        if ORJSON_AVAILABLE:
+            return orjson.dumps(log_obj, default=str).decode('utf-8')
         return json.dumps(log_obj)
 
 
+# 后台日志监听器（格式化与 I/O 在独立线程中完成）
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+
 def setup_logging():
-    """初始化结构化日志配置"""
+    """
+    初始化结构化日志配置
+    
+    请求线程只把日志记录放入队列，格式化和输出由后台 QueueListener 线程完成
+    """
+    global _log_listener
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
     
+    # 停止之前的监听器，避免重复初始化时多个线程重复输出
+    if _log_listener is not None:
+        _log_listener.stop()
+    
     # 清除已有处理器
     logger.handlers = []
     
-    # 控制台处理器
+    # 控制台处理器（在监听线程中执行）
     handler = logging.StreamHandler()
     handler.setFormatter(JSONFormatter())
-    logger.addHandler(handler)
+    
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    
+    _log_listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _log_listener.start()
     
     return logger
 
 
+def _stop_log_listener():
+    """退出时刷新并停止日志监听线程"""
+    if _log_listener is not None:
+        _log_listener.stop()
+
+
+atexit.register(_stop_log_listener)
+
+
 # ============================================================================
 # 资源监控模块
 # ============================================================================
@@ -485,11 +605,93 @@ class ResourceMonitor:
 resource_monitor = ResourceMonitor()
 
 
+# ============================================================================
+# 路由耗时采样
+# ============================================================================
+
+# 每个路由保留的最近耗时样本数
+PROFILE_SAMPLE_SIZE = 1000
+
+# 路由名 -> 最近耗时样本（纳秒），deque 定长追加线程安全
+_route_timings: Dict[str, deque] = {}
+
+
+def profile_route(name: str):
+    """
+    路由耗时采样装饰器
+    
+    Args:
+        name: 路由名称（用于统计分组）
+    """
+    samples = _route_timings.setdefault(name, deque(maxlen=PROFILE_SAMPLE_SIZE))
+    
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter_ns() - start)
+        return decorated_function
+    return decorator
+
+
+def get_route_profile() -> Dict[str, Dict[str, Any]]:
+    """
+    获取各路由的耗时统计
+    
+    Returns:
+        {路由名: {count, p50_ms, p95_ms, p99_ms, max_ms}}
+    """
+    result = {}
+    for name, samples in list(_route_timings.items()):
+        data = list(samples)
+        if not data:
+            result[name] = {'count': 0}
+            continue
+        if len(data) > 1:
+            cuts = statistics.quantiles(data, n=100, method='inclusive')
+            p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+        else:
+            p50 = p95 = p99 = data[0]
+        result[name] = {
+            'count': len(data),
+            'p50_ms': round(p50 / 1e6, 3),
+            'p95_ms': round(p95 / 1e6, 3),
+            'p99_ms': round(p99 / 1e6, 3),
+            'max_ms': round(max(data) / 1e6, 3)
+        }
+    return result
+
+
 def get_request_id():
     """生成请求 ID"""
     return str(uuid.uuid4())[:8]
 
 
+# 缓存的 ISO 时间字符串：(生成时的时间戳, ISO 字符串)
+_now_iso_cache = (0.0, '')
+# 缓存刷新间隔（秒）
+NOW_ISO_RESOLUTION = 0.1
+
+
+def now_iso() -> str:
+    """
+    获取当前时间的 ISO 字符串（100ms 精度缓存）
+    
+    用于响应体中的时间戳字段，避免每个请求都格式化 datetime；
+    需要精确时间的场景（如健康检查）请直接使用 datetime.now().isoformat()
+    """
+    global _now_iso_cache
+    now = time.time()
+    cached_at, value = _now_iso_cache
+    if now - cached_at >= NOW_ISO_RESOLUTION:
+        value = datetime.fromtimestamp(now).isoformat()
+        _now_iso_cache = (now, value)
+    return value
+
+
 def log_with_data(msg, level=logging.INFO, extra_data=None, request_id=None):
     """
     结构化日志输出
@@ -510,6 +712,7 @@ def log_with_data(msg, level=logging.INFO, extra_data=None, request_id=None):
 # 尝试导入 requests，如果不存在则提示安装
 try:
     import requests
+    from urllib3.util.retry import Retry
 except ImportError:
     print("❌ 缺少依赖库，请运行: pip install requests")
     sys.exit(1)
@@ -561,17 +764,121 @@ XSS_PATTERNS = [
 # 危险字符黑名单（用于文件名、ID 等）
 DANGEROUS_CHARS = re.compile(r'[<>:"/\\|?*\x00-\x1f\x7f]')
 
+# 与 DANGEROUS_CHARS 等价的删除表，str.translate 在 C 层一次扫描完成
+_SANITIZE_TABLE = str.maketrans('', '', '<>:"/\\|?*' + ''.join(map(chr, range(0x20))) + '\x7f')
+
 
 # ============================================================================
 # CSRF 防护模块
 # ============================================================================
 
-# CSRF token 存储（生产环境建议使用 Redis）
-_csrf_tokens: Dict[str, float] = {}
-
 # CSRF token 过期时间（秒）
 CSRF_TOKEN_EXPIRY = 3600  # 1小时
 
+# 尝试导入 redis，用于多进程共享 CSRF token
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+
+class InMemoryCSRFStore:
+    """CSRF token 进程内存储（单进程部署使用）"""
+    
+    def __init__(self):
+        # token -> 过期时间戳
+        self._tokens: Dict[str, float] = {}
+    
+    def setex(self, token: str, ttl: int) -> None:
+        """保存 token 并设置过期时间"""
+        self._tokens[token] = time.time() + ttl
+    
+    def exists(self, token: str) -> bool:
+        """检查 token 是否存在且未过期"""
+        expiry = self._tokens.get(token)
+        if expiry is None:
+            return False
+        
+        if time.time() > expiry:
+            # 清理过期 token
+            self._tokens.pop(token, None)
+            return False
+        
+        return True
+    
+    def expire(self, token: str, ttl: int) -> bool:
+        """刷新 token 的过期时间"""
+        if token not in self._tokens:
+            return False
+        self._tokens[token] = time.time() + ttl
+        return True
+    
+    def cleanup(self) -> int:
+        """清理所有过期的 token"""
+        current_time = time.time()
+        # 先复制快照，后台清理时请求线程仍可能写入
+        expired_tokens = [token for token, expiry in list(self._tokens.items())
+                          if current_time > expiry]
+        for token in expired_tokens:
+            self._tokens.pop(token, None)
+        return len(expired_tokens)
+
+
+class RedisCSRFStore:
+    """CSRF token Redis 存储（多 worker 共享，过期由 Redis TTL 负责）"""
+    
+    KEY_PREFIX = 'csrf:'
+    
+    def __init__(self, url: str):
+        """
+        初始化 Redis 存储
+        
+        Args:
+            url: Redis 连接地址，例如 redis://localhost:6379/0
+        """
+        self._redis = redis.Redis.from_url(url)
+        self._redis.ping()
+    
+    def setex(self, token: str, ttl: int) -> None:
+        """保存 token 并设置过期时间"""
+        self._redis.set(self.KEY_PREFIX + token, '1', ex=ttl, nx=True)
+    
+    def exists(self, token: str) -> bool:
+        """检查 token 是否存在（过期的 key 已被 Redis 自动删除）"""
+        return self._redis.exists(self.KEY_PREFIX + token) > 0
+    
+    def expire(self, token: str, ttl: int) -> bool:
+        """刷新 token 的过期时间"""
+        return bool(self._redis.expire(self.KEY_PREFIX + token, ttl))
+    
+    def cleanup(self) -> int:
+        """Redis 自动处理过期，无需手动清理"""
+        return 0
+
+
+def _create_csrf_store():
+    """
+    根据环境变量创建 CSRF token 存储
+    
+    设置 CSRF_REDIS_URL 且已安装 redis 时使用 Redis，否则回退到进程内存储
+    """
+    redis_url = os.environ.get('CSRF_REDIS_URL', '')
+    if redis_url:
+        if not REDIS_AVAILABLE:
+            print("⚠️ 已设置 CSRF_REDIS_URL 但 redis 未安装，CSRF token 使用进程内存储")
+            print("   安装命令: pip install redis")
+        else:
+            try:
+                return RedisCSRFStore(redis_url)
+            except Exception as e:
+                print(f"⚠️ 连接 Redis 失败，CSRF token 使用进程内存储: {e}")
+    return InMemoryCSRFStore()
+
+
+# CSRF token 存储
+_csrf_store = _create_csrf_store()
+
 
 class CSRFTokenManager:
     """CSRF Token 管理器"""
@@ -589,7 +896,7 @@ class CSRFTokenManager:
         """
         token = secrets.token_hex(32)
         # 存储 token 及其过期时间
-        _csrf_tokens[token] = datetime.utcnow().timestamp() + CSRF_TOKEN_EXPIRY
+        _csrf_store.setex(token, CSRF_TOKEN_EXPIRY)
         return token
     
     @staticmethod
@@ -606,18 +913,7 @@ class CSRFTokenManager:
         if not token:
             return False
         
-        # 检查 token 是否在存储中且未过期
-        expiry = _csrf_tokens.get(token)
-        if expiry is None:
-            return False
-        
-        # 检查是否过期
-        if datetime.utcnow().timestamp() > expiry:
-            # 清理过期 token
-            del _csrf_tokens[token]
-            return False
-        
-        return True
+        return _csrf_store.exists(token)
     
     @staticmethod
     def refresh_token(token: str) -> str:
@@ -630,20 +926,35 @@ class CSRFTokenManager:
         Returns:
             刷新后的 token（原 token 继续有效）
         """
-        if token in _csrf_tokens:
-            _csrf_tokens[token] = datetime.utcnow().timestamp() + CSRF_TOKEN_EXPIRY
+        if _csrf_store.expire(token, CSRF_TOKEN_EXPIRY):
             return token
         return None
     
     @staticmethod
     def cleanup_expired_tokens():
-        """清理所有过期的 token"""
-        current_time = datetime.utcnow().timestamp()
-        expired_tokens = [token for token, expiry in _csrf_tokens.items() 
-                         if current_time > expiry]
-        for token in expired_tokens:
-            del _csrf_tokens[token]
-        return len(expired_tokens)
+        """清理所有过期的 token（Redis 存储下为空操作）"""
+        return _csrf_store.cleanup()
+
+
+# CSRF 错误响应模板（预先序列化，拒绝路径上只需填入 request_id）
+_CSRF_MISSING_JSON = b'{"success":false,"error":"Missing CSRF token","request_id":%s}'
+_CSRF_INVALID_JSON = b'{"success":false,"error":"Invalid or expired CSRF token","request_id":%s}'
+
+
+def _csrf_error_response(template: bytes, status: int):
+    """
+    基于预序列化模板构建 CSRF 错误响应
+    
+    Args:
+        template: 包含 request_id 占位符的 JSON 字节模板
+        status: HTTP 状态码
+        
+    Returns:
+        Flask Response 对象
+    """
+    request_id = g.get('request_id', '')
+    body = template % json.dumps(request_id).encode()
+    return Response(body, status=status, mimetype='application/json')
 
 
 # CSRF 验证装饰器
@@ -683,18 +994,10 @@ def csrf_protected(f):
         
         # 验证 token
         if not token:
-            return jsonify({
-                'success': False,
-                'error': 'Missing CSRF token',
-                'request_id': getattr(g, 'request_id', '')
-            }), 400
+            return _csrf_error_response(_CSRF_MISSING_JSON, 400)
         
         if not CSRFTokenManager.validate_token(token):
-            return jsonify({
-                'success': False,
-                'error': 'Invalid or expired CSRF token',
-                'request_id': getattr(g, 'request_id', '')
-            }), 403
+            return _csrf_error_response(_CSRF_INVALID_JSON, 403)
         
         # Token 验证通过，继续执行原函数
         return f(*args, **kwargs)
@@ -705,6 +1008,14 @@ def csrf_protected(f):
 class InputValidator:
     """输入验证器"""
     
+    # 合法的消息角色
+    VALID_ROLES = frozenset(('user', 'assistant', 'system'))
+    VALID_ROLES_STR = 'user, assistant, system'
+    
+    # 会话 / 对话 ID 格式（同时用于 URL 转换器）
+    SESSION_ID_REGEX = r'[A-Za-z0-9_-]{1,128}'
+    CONVERSATION_ID_REGEX = r'[a-zA-Z0-9_-]+'
+    
     def __init__(self):
         self.sql_pattern = re.compile('|'.join(SQL_INJECTION_PATTERNS), re.IGNORECASE)
         self.xss_pattern = re.compile('|'.join(XSS_PATTERNS), re.IGNORECASE | re.DOTALL)
@@ -732,22 +1043,25 @@ class InputValidator:
         if not isinstance(value, str):
             raise ValueError(f"{field_name} 必须是字符串类型")
         
-        # 检查长度
-        if len(value) > max_length:
-            raise ValueError(f"{field_name} 长度不能超过 {max_length} 字符")
+        # 只做一次 strip，后续检查均基于清理后的内容
+        stripped = value.strip()
         
-        if not value.strip():
+        if not stripped:
             raise ValueError(f"{field_name} 不能为空或仅包含空白字符")
         
+        # 检查长度
+        if len(stripped) > max_length:
+            raise ValueError(f"{field_name} 长度不能超过 {max_length} 字符")
+        
         # 检测 SQL 注入
-        if self.sql_pattern.search(value):
+        if self.sql_pattern.search(stripped):
             raise ValueError(f"{field_name} 包含非法字符或SQL注入特征")
         
         # 检测 XSS 攻击（除非允许 HTML）
-        if not allow_html and self.xss_pattern.search(value):
+        if not allow_html and self.xss_pattern.search(stripped):
             raise ValueError(f"{field_name} 包含潜在的XSS攻击特征")
         
-        return value.strip()
+        return stripped
     
     def sanitize_string(self, value: str, allow_html: bool = False) -> str:
         """
@@ -768,12 +1082,30 @@ class InputValidator:
             value = html_escape(value)
         
         # 移除危险字符
-        value = DANGEROUS_CHARS.sub('', value)
+        value = value.translate(_SANITIZE_TABLE)
         
-        # 规范化空白字符
-        value = re.sub(r'\s+', ' ', value)
+        # 规范化空白字符（split/join 同时去除首尾空白）
+        return ' '.join(value.split())
+    
+    def validate_and_sanitize(self, value: Any, field_name: str = "field",
+                              max_length: int = 10000) -> str:
+        """
+        验证并清理字符串输入（validate_string + sanitize_string）
         
-        return value.strip()
+        Args:
+            value: 输入值
+            field_name: 字段名称（用于错误信息）
+            max_length: 最大长度
+            
+        Returns:
+            清理后的字符串
+            
+        Raises:
+            ValueError: 验证失败
+        """
+        return self.sanitize_string(
+            self.validate_string(value, field_name=field_name, max_length=max_length)
+        )
     
     def validate_conversation_id(self, conversation_id: str) -> str:
         """验证对话 ID 格式"""
@@ -781,7 +1113,7 @@ class InputValidator:
             raise ValueError("conversation_id 不能为空")
         
         # 验证格式：只允许字母、数字、下划线、中划线
-        if not re.match(r'^[a-zA-Z0-9_-]+$', conversation_id):
+        if not re.fullmatch(self.CONVERSATION_ID_REGEX, conversation_id):
             raise ValueError("conversation_id 格式无效，只允许字母、数字、下划线和中划线")
         
         # 检测 SQL 注入
@@ -792,18 +1124,17 @@ class InputValidator:
     
     def validate_role(self, role: str) -> str:
         """验证消息角色"""
-        valid_roles = {'user', 'assistant', 'system'}
         role = role.lower().strip()
         
-        if role not in valid_roles:
-            raise ValueError(f"无效的角色: {role}，必须是: {', '.join(valid_roles)}")
+        if role not in self.VALID_ROLES:
+            raise ValueError(f"无效的角色: {role}，必须是: {self.VALID_ROLES_STR}")
         
         return role
     
     def validate_model(self, model: str) -> str:
         """验证模型名称"""
         if model not in Config.SUPPORTED_MODELS:
-            raise ValueError(f"不支持的模型: {model}，支持的模型: {', '.join(Config.SUPPORTED_MODELS)}")
+            raise ValueError(f"不支持的模型: {model}，支持的模型: {Config.SUPPORTED_MODELS_STR}")
         return model
     
     def validate_temperature(self, temperature: Any) -> float:
@@ -853,7 +1184,7 @@ class InputValidator:
             raise ValueError("消息必须包含 content 字段")
         
         role = self.validate_role(message['role'])
-        content = self.validate_string(
+        content = self.validate_and_sanitize(
             message['content'], 
             field_name="content", 
             max_length=50000
@@ -861,7 +1192,7 @@ class InputValidator:
         
         return {
             'role': role,
-            'content': self.sanitize_string(content)
+            'content': content
         }
     
     def validate_messages(self, messages: Any) -> List[Dict[str, str]]:
@@ -886,11 +1217,12 @@ class InputValidator:
         if len(messages) > 100:
             raise ValueError("messages 列表不能超过 100 条")
         
-        validated = []
+        # 预分配结果列表，并将方法绑定到局部变量以减少循环内的属性查找
+        validated = [None] * len(messages)
+        validate_message = self.validate_message
         for i, msg in enumerate(messages):
             try:
-                validated_msg = self.validate_message(msg)
-                validated.append(validated_msg)
+                validated[i] = validate_message(msg)
             except ValueError as e:
                 raise ValueError(f"消息[{i}]验证失败: {e}")
         
@@ -917,19 +1249,34 @@ def validate_json_content_type(func):
     return wrapper
 
 
-def safe_json_response(data: Any) -> Dict[str, Any]:
-    """安全地构建 JSON 响应（自动转义敏感内容）"""
-    def sanitize(obj):
-        if isinstance(obj, str):
-            return html_escape(obj)
-        elif isinstance(obj, dict):
-            return {k: sanitize(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [sanitize(item) for item in obj]
-        else:
-            return obj
+# HTML 敏感字符在 JSON 字符串中的转义形式（JSON 解析后内容不变）
+_HTML_SAFE_JSON_REPLACEMENTS = (
+    (b'&', b'\\u0026'),
+    (b'<', b'\\u003c'),
+    (b'>', b'\\u003e'),
+    (b"'", b'\\u0027'),
+)
+
+
+def safe_json_response(data: Any, status: int = 200):
+    """
+    安全地构建 JSON 响应（序列化时转义 HTML 敏感字符）
+    
+    只做一次序列化，随后在字节层面将 & < > ' 替换为 Unicode 转义，
+    输出可以安全嵌入 HTML，同时不改变客户端解析后的数据。
     
-    return sanitize(data)
+    Args:
+        data: 响应数据
+        status: HTTP 状态码
+        
+    Returns:
+        Flask Response 对象
+    """
+    body = json_dumps_bytes(data)
+    for char, escaped in _HTML_SAFE_JSON_REPLACEMENTS:
+        if char in body:
+            body = body.replace(char, escaped)
+    return Response(body, status=status, mimetype='application/json')
 
 
 # ============================================================================
@@ -960,7 +1307,50 @@ class Config:
     # IP 限流：时间窗口（秒）
     RATE_LIMIT_PER_SECONDS: int = 60
     # 最大并发请求数
-    CONCURRENT_REQUEST_LIMIT: int = 10
+    CONCURRENT_REQUEST_LIMIT: int = MAX_CONCURRENT_REQUESTS
+    
+    # ========== HTTP 连接池配置 ==========
+    # DashScope 连接池中每个主机保持的最大连接数（并发放宽时随之增大，避免连接被反复新建丢弃）
+    HTTP_POOL_MAXSIZE: int = int(os.environ.get(
+        'HTTP_POOL_MAXSIZE', '100' if GEVENT_ENABLED else '20'
+    ))
+    
+    # 瞬时错误（连接失败、限流、网关错误）的自动重试次数与退避系数（秒）
+    HTTP_MAX_RETRIES: int = 3
+    HTTP_RETRY_BACKOFF: float = 0.5
+    
+    # 使用 HTTP/2 调用 DashScope（需安装 httpx[http2]），多个并发请求复用同一连接
+    HTTP2_ENABLED: bool = os.environ.get('DASHSCOPE_HTTP2', 'false').lower() == 'true'
+    
+    # ========== DashScope 客户端限流配置 ==========
+    # 每分钟请求数、每分钟 token 数（估算）、并发调用上限
+    # （并发上限默认取服务并发数与连接池大小中的较小者，与 gevent 模式的放宽配置一致）
+    UPSTREAM_RPM: int = 500
+    UPSTREAM_TPM: int = 500_000
+    UPSTREAM_MAX_CONCURRENCY: int = int(os.environ.get(
+        'UPSTREAM_MAX_CONCURRENCY', min(MAX_CONCURRENT_REQUESTS, HTTP_POOL_MAXSIZE)
+    ))
+    # 收到 429 时的最大重试次数
+    UPSTREAM_THROTTLE_RETRIES: int = 3
+    
+    # ========== 响应缓存配置 ==========
+    # 确定性对话（temperature=0）与文本向量的缓存条目数及有效期（秒）
+    CHAT_CACHE_SIZE: int = 256
+    EMBEDDING_CACHE_SIZE: int = 1000
+    RESPONSE_CACHE_TTL: int = 3600
+    
+    # 向量化 API 单次请求的最大文本数
+    EMBEDDING_MAX_BATCH: int = 25
+    
+    # ========== 响应压缩配置 ==========
+    # 超过该大小（字节）的 JSON/文本响应在客户端支持时使用 gzip 压缩
+    COMPRESS_MIN_SIZE: int = 1024
+    COMPRESS_LEVEL: int = 6
+    
+    # 对话语义缓存（默认关闭）：对话文本向量余弦相似度不低于阈值时复用历史回复
+    SEMANTIC_CACHE_ENABLED: bool = os.environ.get('SEMANTIC_CACHE', 'false').lower() == 'true'
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0.95'))
+    SEMANTIC_CACHE_SIZE: int = 200
     
     # 支持的模型列表
     SUPPORTED_MODELS: List[str] = [
@@ -972,14 +1362,21 @@ class Config:
         'text-embedding-v1',
         'text-embedding-v2'
     ]
+    # 模型列表的展示字符串（类加载时计算一次，用于错误信息）
+    SUPPORTED_MODELS_STR: str = ', '.join(SUPPORTED_MODELS)
+    
+    # 是否已输出过配置缺失提示
+    _config_warned: bool = False
     
     @classmethod
     def validate_config(cls) -> bool:
-        """验证配置是否完整"""
+        """验证配置是否完整（缺失提示只输出一次）"""
         if not cls.DASHSCOPE_API_KEY:
-            print("❌ 错误: 未设置 DASHSCOPE_API_KEY 环境变量")
-            print("请在 .env 文件或 shell 配置中添加:")
-            print('export DASHSCOPE_API_KEY="your_api_key_here"')
+            if not cls._config_warned:
+                cls._config_warned = True
+                print("❌ 错误: 未设置 DASHSCOPE_API_KEY 环境变量")
+                print("请在 .env 文件或 shell 配置中添加:")
+                print('export DASHSCOPE_API_KEY="your_api_key_here"')
             return False
         return True
 
@@ -988,9 +1385,257 @@ class Config:
 # DashScope API 客户端
 # ============================================================================
 
+# 需要退避重试的响应状态码（requests 路径的网关错误由 urllib3 Retry 处理）
+THROTTLE_STATUSES = frozenset((HTTPStatus.TOO_MANY_REQUESTS,))
+HTTP2_RETRY_STATUSES = THROTTLE_STATUSES | {500, 502, 503, 504}
+
+# DashScope 调用可能抛出的传输层异常
+HTTP_ERRORS = (requests.exceptions.RequestException, httpx.HTTPError) if HTTPX_AVAILABLE \
+    else (requests.exceptions.RequestException,)
+
+# 表示上游过载的传输层异常（超时、连接失败、连接中断），与 429 一样使并发上限减半
+CONGESTION_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+) + ((httpx.TransportError,) if HTTPX_AVAILABLE else ())
+
+
+class UpstreamLimiter:
+    """
+    DashScope 调用的客户端限流器
+    
+    - RPM / TPM 滑动窗口：超出配额时阻塞等待，而不是把请求发出去换回 429
+    - AIMD 并发控制：收到 429 或超时/连接错误时并发上限减半，成功时逐步加 1
+    """
+    
+    WINDOW_SECONDS = 60
+    
+    def __init__(self, rpm: int, tpm: int, max_concurrent: int):
+        """
+        初始化限流器
+        
+        Args:
+            rpm: 每分钟最大请求数
+            tpm: 每分钟最大 token 数（估算值）
+            max_concurrent: 并发上限的最大值
+        """
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrent = max_concurrent
+        self.concurrency_limit = float(max_concurrent)
+        self._in_flight = 0
+        self._window: deque = deque()  # (时间戳, token 数)
+        self._window_tokens = 0
+        self._cond = threading.Condition()
+    
+    def _wait_time(self, now: float, tokens: int) -> float:
+        """计算还需等待的秒数（调用方持有锁），0 表示可以立即发送"""
+        cutoff = now - self.WINDOW_SECONDS
+        window = self._window
+        while window and window[0][0] <= cutoff:
+            self._window_tokens -= window.popleft()[1]
+        
+        if self._in_flight >= int(self.concurrency_limit):
+            return 0.05
+        if len(window) >= self.rpm:
+            return window[0][0] - cutoff
+        if window and self._window_tokens + tokens > self.tpm:
+            return window[0][0] - cutoff
+        return 0.0
+    
+    def acquire(self, tokens: int) -> None:
+        """获取一次调用许可（阻塞直到满足配额）"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = self._wait_time(now, tokens)
+                if wait <= 0:
+                    break
+                self._cond.wait(wait)
+            self._window.append((now, tokens))
+            self._window_tokens += tokens
+            self._in_flight += 1
+    
+    def release(self, throttled: bool = False) -> None:
+        """
+        释放调用许可并调整并发上限
+        
+        Args:
+            throttled: 本次调用是否被服务端限流（429）或因超时、连接错误失败
+        """
+        with self._cond:
+            self._in_flight -= 1
+            if throttled:
+                self.concurrency_limit = max(1.0, self.concurrency_limit / 2)
+            else:
+                self.concurrency_limit = min(float(self.max_concurrent), self.concurrency_limit + 1)
+            self._cond.notify_all()
+    
+    @staticmethod
+    def estimate_tokens(payload: Dict[str, Any]) -> int:
+        """粗略估算请求消耗的 token 数（约 2 字符 1 token，加上最大输出）"""
+        data = payload.get('input', {})
+        chars = sum(len(m.get('content', '')) for m in data.get('messages', ()))
+        chars += sum(len(t) for t in data.get('texts', ()))
+        return chars // 2 + payload.get('parameters', {}).get('max_tokens', 0)
+
+
+class TTLCache:
+    """
+    线程安全的 LRU + TTL 缓存
+    
+    容量满时淘汰最久未使用的条目，条目超过 ttl 秒后视为失效。
+    缓存的值由调用方共享，取出后不应修改。
+    """
+    
+    def __init__(self, capacity: int = 1000, ttl: int = 3600):
+        """
+        初始化缓存
+        
+        Args:
+            capacity: 最大条目数
+            ttl: 条目有效期（秒）
+        """
+        self.capacity = capacity
+        self.ttl = ttl
+        self._data: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def make_key(payload: Any) -> str:
+        """根据请求内容生成稳定的缓存键（键排序后的 JSON 的 blake2b 摘要）"""
+        if ORJSON_AVAILABLE:
+            raw = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+        else:
+            raw = json.dumps(payload, sort_keys=True, ensure_ascii=False,
+                             separators=(',', ':')).encode('utf-8')
+        return hashlib.blake2b(raw, digest_size=16).hexdigest()
+    
+    def get(self, key: str) -> Any:
+        """获取缓存值，未命中或已过期返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < now:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+    
+    def set(self, key: str, value: Any) -> None:
+        """写入缓存值"""
+        expire_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (expire_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+    
+    def stats(self) -> Dict[str, Any]:
+        """获取命中率统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'capacity': self.capacity,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+
 class DashScopeClient:
     """阿里云百炼 API 客户端"""
     
+    CHAT_ENDPOINT = '/services/aigc/text-generation/generation'
+    EMBEDDING_ENDPOINT = '/services/embeddings/text-embedding/generation'
+    
+    # 响应缓存：temperature 为 0 的对话结果、以及单条文本的向量（结果确定，可安全复用）
+    _chat_cache = TTLCache(capacity=Config.CHAT_CACHE_SIZE, ttl=Config.RESPONSE_CACHE_TTL)
+    _embedding_cache = TTLCache(capacity=Config.EMBEDDING_CACHE_SIZE, ttl=Config.RESPONSE_CACHE_TTL)
+    
+    # 正在进行的对话请求（请求键 -> Future），用于合并重复的并发请求
+    _in_flight: Dict[str, Future] = {}
+    _in_flight_lock = threading.Lock()
+    
+    # 所有客户端共享的调用配额（对应同一个 API Key 的服务端限额）
+    _limiter = UpstreamLimiter(
+        rpm=Config.UPSTREAM_RPM,
+        tpm=Config.UPSTREAM_TPM,
+        max_concurrent=Config.UPSTREAM_MAX_CONCURRENCY
+    )
+    
+    # 所有客户端共享的 HTTP 会话（keep-alive 复用 TCP/TLS 连接）
+    _session: Optional[requests.Session] = None
+    _session_lock = threading.Lock()
+    
+    @classmethod
+    def _get_session(cls) -> requests.Session:
+        """获取共享的 HTTP 会话（双重检查锁延迟创建）"""
+        if cls._session is None:
+            with cls._session_lock:
+                if cls._session is None:
+                    session = requests.Session()
+                    # POST 默认不在 urllib3 重试范围内，需显式允许；
+                    # 重试耗尽后返回最后一次响应，由 raise_for_status 抛出 HTTPError。
+                    # 429 由 _make_request 处理（需要反馈给 UpstreamLimiter）。
+                    # 读超时等请求已发出后的错误不重试（read=0, other=0），
+                    # 否则会重复生成（重复计费）并叠加隐藏的等待时间
+                    retry = Retry(
+                        total=Config.HTTP_MAX_RETRIES,
+                        read=0,
+                        other=0,
+                        backoff_factor=Config.HTTP_RETRY_BACKOFF,
+                        status_forcelist=(500, 502, 503, 504),
+                        allowed_methods=frozenset(('GET', 'POST')),
+                        raise_on_status=False
+                    )
+                    adapter = requests.adapters.HTTPAdapter(
+                        pool_connections=4,
+                        pool_maxsize=Config.HTTP_POOL_MAXSIZE,
+                        max_retries=retry
+                    )
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    cls._session = session
+        return cls._session
+    
+    # HTTP/2 客户端（启用 HTTP2_ENABLED 且 httpx 可用时创建，所有客户端共享）
+    _http2_client = None
+    _http2_checked = False
+    
+    @classmethod
+    def _get_http2_client(cls):
+        """获取共享的 HTTP/2 客户端，未启用或不可用时返回 None"""
+        if not cls._http2_checked:
+            with cls._session_lock:
+                if not cls._http2_checked:
+                    if Config.HTTP2_ENABLED and not HTTPX_AVAILABLE:
+                        print("⚠️ httpx 未安装，HTTP/2 不可用，使用 requests (HTTP/1.1)")
+                        print("   安装命令: pip install 'httpx[http2]'")
+                    elif Config.HTTP2_ENABLED:
+                        try:
+                            # 显式传入 transport 时 Client 级的 http2/limits 参数不生效，须设置在 transport 上
+                            cls._http2_client = httpx.Client(
+                                transport=httpx.HTTPTransport(
+                                    http2=True,
+                                    limits=httpx.Limits(max_connections=Config.HTTP_POOL_MAXSIZE),
+                                    retries=Config.HTTP_MAX_RETRIES
+                                )
+                            )
+                        except ImportError:
+                            # httpx 已安装但缺少 h2 扩展
+                            print("⚠️ h2 未安装，HTTP/2 不可用，使用 requests (HTTP/1.1)")
+                            print("   安装命令: pip install 'httpx[http2]'")
+                    cls._http2_checked = True
+        return cls._http2_client
+    
     def __init__(self, api_key: Optional[str] = None, model: str = 'qwen-turbo'):
         """
         初始化 DashScope 客户端
@@ -1002,52 +1647,97 @@ class DashScopeClient:
         self.api_key = api_key or Config.DASHSCOPE_API_KEY
         self.model = model
         self.base_url = Config.DASHSCOPE_BASE_URL
+        # 接口地址只依赖 base_url，初始化时拼接一次
+        self._chat_url = self.base_url + self.CHAT_ENDPOINT
+        self._embedding_url = self.base_url + self.EMBEDDING_ENDPOINT
         
         if not self.api_key:
             raise ValueError("API Key 未设置，请设置 DASHSCOPE_API_KEY 环境变量")
-    
-    def _get_headers(self) -> Dict[str, str]:
-        """获取请求头"""
-        return {
+        
+        # 请求头只依赖 api_key，初始化时构建一次后复用
+        self._base_headers = {
             'Authorization': f'Bearer {self.api_key}',
             'Content-Type': 'application/json',
             'X-DashScope-Async': 'disable'  # 同步调用模式
         }
+        # 流式输出通过 SSE 返回（X-DashScope-Async 用于异步任务，与流式无关）
+        self._stream_headers = {
+            'Authorization': self._base_headers['Authorization'],
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+            # 流式响应不压缩，避免解压缓冲推迟片段到达
+            'Accept-Encoding': 'identity',
+            'X-DashScope-SSE': 'enable'
+        }
+        self._session = self._get_session()
+        self._http2 = self._get_http2_client()
     
-    def _make_request(self, endpoint: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    def _make_request(self, url: str, data: Dict[str, Any]) -> Dict[str, Any]:
         """
         发起 HTTP 请求
         
         Args:
-            endpoint: API 端点
+            url: API 完整地址
             data: 请求数据
             
         Returns:
             API 响应 (JSON)
             
         Raises:
-            RequestException: 请求失败时抛出异常
+            RequestException: 请求失败时抛出异常（HTTP/2 模式下为 httpx.HTTPError）
         """
-        url = f"{self.base_url}{endpoint}"
-        headers = self._get_headers()
+        tokens = UpstreamLimiter.estimate_tokens(data)
+        # 预先序列化请求体（重试时复用），避免 requests 内部使用标准库 json 编码
+        body = json_dumps_bytes(data)
+        
+        # HTTP/2 路径没有 urllib3 的状态码重试，网关错误也在这里重试
+        retry_statuses = HTTP2_RETRY_STATUSES if self._http2 is not None else THROTTLE_STATUSES
         
         try:
-            response = requests.post(
-                url,
-                headers=headers,
-                json=data,
-                timeout=Config.TIMEOUT
-            )
+            for attempt in range(Config.UPSTREAM_THROTTLE_RETRIES + 1):
+                self._limiter.acquire(tokens)
+                throttled = False
+                try:
+                    if self._http2 is not None:
+                        response = self._http2.post(
+                            url,
+                            headers=self._base_headers,
+                            content=body,
+                            timeout=Config.TIMEOUT
+                        )
+                    else:
+                        response = self._session.post(
+                            url,
+                            headers=self._base_headers,
+                            data=body,
+                            timeout=Config.TIMEOUT
+                        )
+                    throttled = response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+                except CONGESTION_ERRORS:
+                    # 超时/连接错误同样是过载信号，不能按成功处理而提高并发上限
+                    throttled = True
+                    raise
+                finally:
+                    self._limiter.release(throttled)
+                
+                if response.status_code not in retry_statuses \
+                        or attempt == Config.UPSTREAM_THROTTLE_RETRIES:
+                    break
+                # 被限流：指数退避加随机抖动后重试
+                time.sleep(min(30.0, 0.5 * 2 ** attempt + random.random()))
+            
             response.raise_for_status()
-            return response.json()
+            return json_loads(response.content)
             
-        except requests.exceptions.RequestException as e:
+        except HTTP_ERRORS as e:
             print(f"❌ API 请求失败: {e}")
             raise
     
     def chat(self, messages: List[Dict[str, str]], 
              max_tokens: int = 2000,
              temperature: float = 0.7,
+             *,
+             model: Optional[str] = None,
              **kwargs) -> Dict[str, Any]:
         """
         发起对话请求
@@ -1058,6 +1748,7 @@ class DashScopeClient:
                     {"role": "system", "content": "你是一个助手"},
                     {"role": "user", "content": "你好"}
                 ]
+            model: 本次请求使用的模型 (默认: 客户端的 model)
             max_tokens: 最大生成 token 数
             temperature: 温度参数 (0-2)，越低越确定
             **kwargs: 其他参数
@@ -1072,10 +1763,8 @@ class DashScopeClient:
             ... ])
             >>> print(response['output']['text'])
         """
-        endpoint = f'/services/aigc/text-generation/generation'
-        
         payload = {
-            'model': self.model,
+            'model': model or self.model,
             'input': {
                 'messages': messages
             },
@@ -1086,26 +1775,107 @@ class DashScopeClient:
             }
         }
         
-        return self._make_request(endpoint, payload)
+        # 只有 temperature 为 0 时结果确定，才使用缓存；
+        # 采样回复（temperature != 0）各不相同，不在调用方之间共享，也无需计算缓存键
+        if temperature != 0:
+            return self._make_request(self._chat_url, payload)
+        
+        cache_key = self._chat_cache_key(payload)
+        response = self._chat_cache.get(cache_key)
+        if response is not None:
+            return response
+        
+        # 完全相同的确定性请求并发进行时只发起一次上游调用
+        response = self._single_flight(cache_key, lambda: self._make_request(self._chat_url, payload))
+        self._chat_cache.set(cache_key, response)
+        return response
+    
+    @classmethod
+    def _single_flight(cls, key: str, call: Callable[[], Any]) -> Any:
+        """
+        合并相同键的并发调用：第一个调用方执行，其余调用方等待并共享结果（或异常）
+        
+        Args:
+            key: 请求键
+            call: 实际执行的调用
+            
+        Returns:
+            调用结果
+        """
+        with cls._in_flight_lock:
+            future = cls._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = cls._in_flight[key] = Future()
+        
+        if not leader:
+            # 最多等待首个调用方的完整重试预算，首个调用方卡住时不让所有等待方无限阻塞
+            wait_timeout = cls._request_budget()
+            try:
+                return future.result(timeout=wait_timeout)
+            except FutureTimeoutError:
+                raise requests.exceptions.Timeout(f'等待相同请求的结果超时（{wait_timeout:.0f} 秒）')
+        
+        try:
+            result = call()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with cls._in_flight_lock:
+                cls._in_flight.pop(key, None)
+    
+    @staticmethod
+    def _request_budget() -> float:
+        """
+        单次 _make_request 的最长耗时（秒）
+        
+        每轮限流重试包含 urllib3 的状态码重试（每次最多 Config.TIMEOUT）及其退避，
+        轮次之间另有指数退避（上限与 _make_request 一致）
+        """
+        per_attempt = (
+            (Config.HTTP_MAX_RETRIES + 1) * Config.TIMEOUT
+            + sum(min(120.0, Config.HTTP_RETRY_BACKOFF * 2 ** n) for n in range(Config.HTTP_MAX_RETRIES))
+        )
+        backoff = sum(min(30.0, 0.5 * 2 ** attempt + 1) for attempt in range(Config.UPSTREAM_THROTTLE_RETRIES))
+        return (Config.UPSTREAM_THROTTLE_RETRIES + 1) * per_attempt + backoff
+    
+    @staticmethod
+    def _chat_cache_key(payload: Dict[str, Any]) -> str:
+        """
+        生成对话缓存键
+        
+        消息先规范化（角色小写、内容去除首尾空白），
+        使仅有格式差异的等价对话命中同一缓存项
+        """
+        messages = [
+            (str(m.get('role', '')).lower(), str(m.get('content', '')).strip())
+            for m in payload['input']['messages']
+        ]
+        return TTLCache.make_key([payload['model'], payload['parameters'], messages])
     
     def chat_stream(self, messages: List[Dict[str, str]], 
                     max_tokens: int = 2000,
-                    temperature: float = 0.7) -> Any:
+                    temperature: float = 0.7,
+                    *,
+                    model: Optional[str] = None) -> Any:
         """
         流式对话请求
         
         Args:
             messages: 对话消息列表
+            model: 本次请求使用的模型 (默认: 客户端的 model)
             max_tokens: 最大生成 token 数
             temperature: 温度参数
             
         Yields:
             流式响应片段
         """
-        endpoint = f'/services/aigc/text-generation/generation'
-        
         payload = {
-            'model': self.model,
+            'model': model or self.model,
             'input': {
                 'messages': messages
             },
@@ -1116,23 +1886,76 @@ class DashScopeClient:
             }
         }
         
-        url = f"{self.base_url}{endpoint}"
-        headers = self._get_headers()
-        headers['X-DashScope-Async'] = 'enable'  # 流式需要异步模式
+        # 流式请求在整个输出期间占用一个并发名额
+        self._limiter.acquire(UpstreamLimiter.estimate_tokens(payload))
+        throttled = False
+        try:
+            if self._http2 is not None:
+                with self._http2.stream(
+                    'POST',
+                    self._chat_url,
+                    headers=self._stream_headers,
+                    content=json_dumps_bytes(payload),
+                    timeout=Config.TIMEOUT
+                ) as response:
+                    throttled = response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+                    response.raise_for_status()
+                    yield from self._iter_stream_text(
+                        line.encode('utf-8') for line in response.iter_lines()
+                    )
+            else:
+                # 客户端中途断开时（GeneratorExit）同样关闭响应，及时结束上游生成并归还连接
+                with self._session.post(
+                    self._chat_url,
+                    headers=self._stream_headers,
+                    data=json_dumps_bytes(payload),
+                    timeout=Config.TIMEOUT,
+                    stream=True
+                ) as response:
+                    throttled = response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+                    response.raise_for_status()
+                    yield from self._iter_stream_text(self._split_lines(response.iter_content(chunk_size=None)))
+        except CONGESTION_ERRORS:
+            # 超时/连接错误（含输出中途断开）同样是过载信号
+            throttled = True
+            raise
+        finally:
+            self._limiter.release(throttled)
+    
+    @staticmethod
+    def _split_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        将网络数据块切分为行
         
-        response = requests.post(
-            url,
-            headers=headers,
-            json=payload,
-            timeout=Config.TIMEOUT,
-            stream=True
-        )
+        每个数据块只做一次 split，代替 iter_lines 的逐块扫描与拼接；
+        CRLF 行尾残留的回车符是 JSON 空白字符，无需去除
+        """
+        pending = b''
+        for chunk in chunks:
+            lines = (pending + chunk).split(b'\n') if pending else chunk.split(b'\n')
+            pending = lines.pop()
+            yield from lines
+        if pending:
+            yield pending
+    
+    @staticmethod
+    def _iter_stream_text(lines: Iterable[bytes]) -> Iterator[str]:
+        """
+        从流式响应行中提取增量文本
         
-        for line in response.iter_lines():
-            if line:
-                data = json.loads(line.decode('utf-8'))
-                if data.get('output', {}).get('text'):
-                    yield data['output']['text']
+        直接解析原始字节（不做 UTF-8 解码），兼容 SSE 的 "data:" 前缀行，跳过 id/event 等元数据行；
+        不含 "text" 字段的帧无需解析
+        """
+        for line in lines:
+            if line.startswith(b'data:'):
+                line = line[5:]
+            elif not line.startswith(b'{'):
+                continue
+            if b'"text"' not in line:
+                continue
+            text = extract_text(json_loads(line))
+            if text:
+                yield text
     
     def embedding(self, texts: List[str], model: str = 'text-embedding-v1') -> Dict[str, Any]:
         """
@@ -1145,41 +1968,397 @@ class DashScopeClient:
         Returns:
             向量嵌入结果
         """
-        endpoint = f'/services/embeddings/text-embedding/generation'
-        
-        # 阿里云向量化 API 使用 'texts' 字段
-        payload = {
-            'model': model,
-            'input': {
-                'texts': texts
+        # 逐条查缓存，只请求未命中的文本；重复文本只请求一次
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        pending: Dict[str, List[int]] = {}  # 未命中文本 -> 原始位置列表（保持首次出现顺序）
+        for i, text in enumerate(texts):
+            positions = pending.get(text)
+            if positions is not None:
+                positions.append(i)
+                continue
+            vector = self._embedding_cache.get(TTLCache.make_key([model, text]))
+            if vector is None:
+                pending[text] = [i]
+            else:
+                vectors[i] = vector
+        
+        unique = list(pending)
+        total_tokens = 0
+        # 单次请求的文本数有上限，超出时分批请求
+        for start in range(0, len(unique), Config.EMBEDDING_MAX_BATCH):
+            chunk = unique[start:start + Config.EMBEDDING_MAX_BATCH]
+            # 阿里云向量化 API 使用 'texts' 字段
+            payload = {
+                'model': model,
+                'input': {
+                    'texts': chunk
+                }
             }
+            response = self._make_request(self._embedding_url, payload)
+            total_tokens += response.get('usage', {}).get('total_tokens', 0)
+            
+            for item in response['output']['embeddings']:
+                text = chunk[item['text_index']]
+                embedding = item['embedding']
+                for index in pending[text]:
+                    vectors[index] = embedding
+                self._embedding_cache.set(TTLCache.make_key([model, text]), embedding)
+        
+        # 按原始顺序合并，保持与 API 一致的返回结构
+        return {
+            'output': {
+                'embeddings': [
+                    {'text_index': i, 'embedding': vector}
+                    for i, vector in enumerate(vectors)
+                ]
+            },
+            'usage': {'total_tokens': total_tokens}
         }
+    
+    @classmethod
+    def cache_stats(cls) -> Dict[str, Dict[str, Any]]:
+        """获取响应缓存的命中率统计"""
+        return {
+            'chat': cls._chat_cache.stats(),
+            'embedding': cls._embedding_cache.stats()
+        }
+
+
+def extract_text(response: Dict[str, Any], default: Optional[str] = None) -> Optional[str]:
+    """
+    提取对话响应中的文本（output.text）
+    
+    Args:
+        response: DashScope 对话响应
+        default: 没有文本时的返回值
+        
+    Returns:
+        回复文本
+    """
+    output = response.get('output')
+    text = output.get('text') if output else None
+    return default if text is None else text
+
+
+class EmbeddingBatcher:
+    """
+    向量化请求微批处理器
+    
+    并发调用方提交的单条文本在短时间窗口内合并为一次 API 请求
+    （最多 EMBEDDING_MAX_BATCH 条），减少 HTTP 往返次数。
+    """
+    
+    def __init__(self, client: DashScopeClient, model: str = 'text-embedding-v1',
+                 max_batch: int = None, max_delay: float = 0.008):
+        """
+        初始化批处理器
+        
+        Args:
+            client: DashScope 客户端
+            model: 嵌入模型
+            max_batch: 单次请求最大文本数 (默认: Config.EMBEDDING_MAX_BATCH)
+            max_delay: 等待凑批的最长时间（秒）
+        """
+        self.client = client
+        self.model = model
+        self.max_batch = max_batch or Config.EMBEDDING_MAX_BATCH
+        self.max_delay = max_delay
+        self._queue: 'queue.SimpleQueue[tuple]' = queue.SimpleQueue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+    
+    def submit(self, text: str) -> Future:
+        """
+        提交单条文本
+        
+        Returns:
+            Future，结果为该文本的向量
+        """
+        future = Future()
+        self._queue.put((text, future))
+        return future
+    
+    def embed(self, texts: List[str], timeout: float = None) -> List[List[float]]:
+        """
+        批量获取向量（阻塞直到全部完成，顺序与输入一致）
+        
+        Args:
+            texts: 文本列表
+            timeout: 单条等待超时（秒，默认: Config.TIMEOUT）
+        """
+        futures = [self.submit(text) for text in texts]
+        return [f.result(timeout or Config.TIMEOUT) for f in futures]
+    
+    def _run(self):
+        """后台线程：收集一批文本后统一请求"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            texts = [text for text, _ in batch]
+            try:
+                response = self.client.embedding(texts, model=self.model)
+                for item in response['output']['embeddings']:
+                    batch[item['text_index']][1].set_result(item['embedding'])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+_embedding_batcher: Optional[EmbeddingBatcher] = None
+_embedding_batcher_lock = threading.Lock()
+
+
+def get_embedding_batcher() -> EmbeddingBatcher:
+    """获取全局向量化批处理器（首次调用时创建）"""
+    global _embedding_batcher
+    if _embedding_batcher is None:
+        with _embedding_batcher_lock:
+            if _embedding_batcher is None:
+                _embedding_batcher = EmbeddingBatcher(DashScopeClient())
+    return _embedding_batcher
+
+
+class SemanticCache:
+    """
+    对话语义缓存
+    
+    按 (模型, 生成参数, 系统提示词) 精确分区，分区内按对话文本向量的余弦相似度匹配，
+    相似度不低于阈值时直接复用历史回复。条目数较少，线性扫描即可，按 LRU 淘汰。
+    """
+    
+    def __init__(self, capacity: int, threshold: float, ttl: float):
+        """
+        初始化语义缓存
+        
+        Args:
+            capacity: 最大条目数
+            threshold: 命中所需的最低余弦相似度
+            ttl: 条目有效期（秒）
+        """
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        # 条目 ID -> (分区键, 单位向量, 响应, 过期时间)
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def split_messages(messages: List[Dict[str, str]]) -> Tuple[str, str]:
+        """
+        将消息拆分为系统提示词文本与对话文本（角色小写、内容去除首尾空白）
+        
+        Returns:
+            (系统提示词文本, 对话文本)
+        """
+        system, dialog = [], []
+        for m in messages:
+            role = str(m.get('role', '')).lower()
+            line = f"{role}: {str(m.get('content', '')).strip()}"
+            (system if role == 'system' else dialog).append(line)
+        return '\n'.join(system), '\n'.join(dialog)
+    
+    @staticmethod
+    def _normalize(vector: List[float]) -> List[float]:
+        """归一化为单位向量（点积即余弦相似度）"""
+        norm = math.sqrt(sum(x * x for x in vector))
+        return [x / norm for x in vector] if norm else list(vector)
+    
+    def get(self, partition: str, vector: List[float]) -> Optional[Dict[str, Any]]:
+        """
+        查找相似请求的缓存响应
+        
+        Args:
+            partition: 分区键
+            vector: 对话文本向量
+            
+        Returns:
+            缓存的响应，未命中返回 None
+        """
+        query = self._normalize(vector)
+        now = time.monotonic()
+        with self._lock:
+            candidates = [(entry_id, entry[1]) for entry_id, entry in self._entries.items()
+                          if entry[0] == partition and entry[3] >= now]
+        
+        # 相似度计算在锁外进行
+        best_id, best_score = None, self.threshold
+        for entry_id, cached in candidates:
+            score = sum(map(operator.mul, query, cached))
+            if score >= best_score:
+                best_id, best_score = entry_id, score
+        
+        with self._lock:
+            entry = self._entries.get(best_id) if best_id is not None else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return entry[2]
+    
+    def set(self, partition: str, vector: List[float], response: Dict[str, Any]) -> None:
+        """写入缓存条目（超出容量时淘汰最久未使用的条目）"""
+        entry = (partition, self._normalize(vector), response, time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+    
+    def stats(self) -> Dict[str, Any]:
+        """获取命中率统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'capacity': self.capacity,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+
+# 全局语义缓存（未启用时为 None）
+semantic_cache: Optional[SemanticCache] = SemanticCache(
+    capacity=Config.SEMANTIC_CACHE_SIZE,
+    threshold=Config.SEMANTIC_CACHE_THRESHOLD,
+    ttl=Config.RESPONSE_CACHE_TTL
+) if Config.SEMANTIC_CACHE_ENABLED else None
+
+
+# ============================================================================
+# 音频工具
+# ============================================================================
+
+def wav_header(data_size: int, sample_rate: int = 22050,
+               sample_width: int = 2, channels: int = 1) -> bytes:
+    """
+    生成 PCM 数据对应的 44 字节 WAV (RIFF) 文件头
+    
+    Args:
+        data_size: PCM 数据字节数
+        sample_rate: 采样率
+        sample_width: 采样宽度（字节）
+        channels: 声道数
         
-        return self._make_request(endpoint, payload)
+    Returns:
+        WAV 文件头字节串，直接拼接 PCM 数据即为完整 WAV 文件
+    """
+    block_align = channels * sample_width
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16, 1, channels, sample_rate,
+        sample_rate * block_align, block_align, sample_width * 8,
+        b'data', data_size
+    )
+
+
+# 流式 WAV 的占位数据长度（总长度未知时使用最大值，播放器读到流结束为止）
+STREAMING_WAV_DATA_SIZE = 0xFFFFFFFF - 36
 
 
 # ============================================================================
 # Flask Web 服务
 # ============================================================================
 
-try:
-    from flask import Flask, request, jsonify, g
-    FLASK_AVAILABLE = True
-except ImportError:
-    FLASK_AVAILABLE = False
-    print("⚠️ Flask 未安装，运行测试需要安装: pip install flask")
+# 以脚本方式运行命令行功能（--test / --chat，不带 --server）时不需要 Web 服务，
+# 跳过 Flask 及全部路由的加载以缩短启动时间；被 gunicorn 等导入时始终加载
+# （argparse 允许参数前缀缩写，如 --serv）
+WEB_ENABLED = __name__ != '__main__' or any(
+    len(arg) > 2 and '--server'.startswith(arg) for arg in sys.argv[1:]
+)
+
+FLASK_AVAILABLE = False
+if WEB_ENABLED:
+    try:
+        from flask import Flask, request, jsonify, g
+        FLASK_AVAILABLE = True
+    except ImportError:
+        print("⚠️ Flask 未安装，运行测试需要安装: pip install flask")
 
 if FLASK_AVAILABLE:
-    from flask import Flask, request, jsonify, g, make_response, Blueprint, redirect, send_from_directory
+    from flask import (Flask, request, jsonify, g, make_response, Blueprint, redirect,
+                       send_from_directory, send_file, current_app, Response)
+    from werkzeug.routing import BaseConverter, ValidationError
+    
+    # 尝试导入 DashScope SDK（ASR/TTS 功能需要）
+    try:
+        import dashscope
+        from dashscope import Files
+        from dashscope.audio.asr import Transcription
+        from dashscope.audio.tts_v2 import SpeechSynthesizer, AudioFormat
+        from dashscope.audio.tts_v2.speech_synthesizer import ResultCallback
+        DASHSCOPE_SDK_AVAILABLE = True
+    except ImportError:
+        DASHSCOPE_SDK_AVAILABLE = False
+        print("⚠️ dashscope SDK 未安装，语音识别/合成功能将不可用")
+        print("   安装命令: pip install dashscope")
+    
+    if DASHSCOPE_SDK_AVAILABLE:
+        class AudioCallback(ResultCallback):
+            """
+            TTS 合成回调（在 SDK 线程中执行，不能访问 g）
+            
+            Args:
+                on_chunk: 收到 PCM 片段时调用
+                on_done: 合成结束（完成或出错）时调用
+                request_id: 请求 ID，提供时记录连接与合成日志
+            """
+            
+            def __init__(self, on_chunk: Callable[[bytes], Any],
+                         on_done: Optional[Callable[[], Any]] = None,
+                         request_id: Optional[str] = None):
+                super().__init__()
+                self._on_chunk = on_chunk
+                self._on_done = on_done
+                self._request_id = request_id
+            
+            def on_open(self):
+                if self._request_id:
+                    log_with_data("TTS WebSocket connected", request_id=self._request_id)
+            
+            def on_complete(self):
+                if self._request_id:
+                    log_with_data("TTS synthesis complete", request_id=self._request_id)
+                if self._on_done:
+                    self._on_done()
+            
+            def on_error(self, message: str):
+                if self._request_id:
+                    log_with_data(f"TTS error: {message}", 
+                                 level=logging.ERROR, request_id=self._request_id)
+                if self._on_done:
+                    self._on_done()
+            
+            def on_close(self):
+                if self._request_id:
+                    log_with_data("TTS WebSocket closed", request_id=self._request_id)
+            
+            def on_data(self, data: bytes) -> None:
+                self._on_chunk(data)
     
     # 导入历史管理器
-    from history_manager import get_history_manager
+    from history_manager import HistoryManager, get_history_manager
     
     # 导入唤醒事件存储
     from sqlite_storage import get_wake_storage
     
     # 导入上下文管理器
-    from context_manager import get_context_manager
+    from context_manager import ContextManager, get_context_manager
     
     # 导入任务管理器
     from task_manager import register_task_routes
@@ -1193,17 +2372,115 @@ if FLASK_AVAILABLE:
     # 临时音频文件目录
     TEMP_AUDIO_DIR = '/tmp/dashscope_asr_audio'
     os.makedirs(TEMP_AUDIO_DIR, exist_ok=True)
+    TEMP_AUDIO_PATH = Path(TEMP_AUDIO_DIR)
+    
+    # ASR 上传音频写入临时文件时的分块大小（字节）
+    ASR_UPLOAD_CHUNK_SIZE = 64 * 1024
+    
+    # OpenClaw TTS 音频文件目录（通过 URL 返回时使用）
+    TTS_AUDIO_DIR = os.path.join(TEMP_AUDIO_DIR, 'tts')
+    os.makedirs(TTS_AUDIO_DIR, exist_ok=True)
+    
+    # TTS 音频文件保留时间（秒）
+    TTS_AUDIO_MAX_AGE = 600
+    
+    # 流式 TTS 等待单个音频片段的超时（秒）
+    TTS_CHUNK_TIMEOUT = 30
     
-    # 全局客户端实例
+    def _cleanup_tts_audio_files():
+        """定期清理过期的 TTS 音频文件"""
+        while True:
+            time.sleep(60)
+            expire_before = time.time() - TTS_AUDIO_MAX_AGE
+            try:
+                with os.scandir(TTS_AUDIO_DIR) as entries:
+                    for entry in entries:
+                        if entry.is_file() and entry.stat().st_mtime < expire_before:
+                            os.remove(entry.path)
+            except OSError:
+                pass
+    
+    threading.Thread(target=_cleanup_tts_audio_files, daemon=True).start()
+    
+    # CSRF 过期 token 清理间隔（秒）
+    CSRF_CLEANUP_INTERVAL = 300
+    
+    def _cleanup_csrf_tokens():
+        """定期清理过期的 CSRF token（不占用请求线程）"""
+        while True:
+            time.sleep(CSRF_CLEANUP_INTERVAL)
+            try:
+                cleaned = CSRFTokenManager.cleanup_expired_tokens()
+                if cleaned > 0:
+                    log_with_data(f"Cleaned {cleaned} expired CSRF tokens")
+            except Exception as e:
+                log_with_data(f"CSRF token cleanup failed: {e}", level=logging.WARNING)
+    
+    threading.Thread(target=_cleanup_csrf_tokens, daemon=True).start()
+    
+    # 全局共享的客户端实例（模型在调用时指定，底层共享 HTTP 连接池）
     _client: Optional[DashScopeClient] = None
+    _client_lock = threading.Lock()
     
     def get_client() -> DashScopeClient:
-        """获取或创建客户端实例"""
+        """获取全局客户端实例（双重检查锁延迟创建）"""
         global _client
         if _client is None:
-            _client = DashScopeClient()
+            with _client_lock:
+                if _client is None:
+                    _client = DashScopeClient(model=Config.DEFAULT_MODEL)
         return _client
     
+    def _err(message: str, status: int) -> Response:
+        """
+        构建统一格式的错误响应
+        
+        Args:
+            message: 错误信息
+            status: HTTP 状态码
+            
+        Returns:
+            Flask Response 对象
+        """
+        body = current_app.json.dumps({
+            'success': False,
+            'error': message,
+            'request_id': g.request_id
+        })
+        return current_app.response_class(body, status=status, mimetype='application/json')
+    
+    def _ok(data: Any, status: int = 200) -> Response:
+        """
+        构建统一格式的成功响应
+        
+        Args:
+            data: 响应数据
+            status: HTTP 状态码
+            
+        Returns:
+            Flask Response 对象
+        """
+        body = current_app.json.dumps({
+            'success': True,
+            'data': data,
+            'request_id': g.request_id
+        })
+        return current_app.response_class(body, status=status, mimetype='application/json')
+    
+    def _cm() -> ContextManager:
+        """获取上下文管理器（在当前请求的 g 上缓存）"""
+        cm = getattr(g, '_cm', None)
+        if cm is None:
+            cm = g._cm = get_context_manager()
+        return cm
+    
+    def _hm() -> HistoryManager:
+        """获取历史管理器（在当前请求的 g 上缓存）"""
+        hm = getattr(g, '_hm', None)
+        if hm is None:
+            hm = g._hm = get_history_manager()
+        return hm
+    
     @v1_bp.before_request
     def before_request():
         """请求前置处理：生成请求 ID"""
@@ -1239,54 +2516,112 @@ if FLASK_AVAILABLE:
         '..', '..', 'wait_types.json'
     )
     
+    # 等待语音类型
+    WAIT_AUDIO_TYPES = frozenset(('confirm', 'waiting', 'completed'))
+    # 各类型对应的子目录（启动时计算一次）
+    WAIT_AUDIO_TYPE_DIRS = {t: os.path.join(WAIT_AUDIO_DIR, t) for t in WAIT_AUDIO_TYPES}
+    
+    # 等待语音文件的浏览器缓存时间（秒）
+    WAIT_AUDIO_MAX_AGE = 3600
+    
+    @lru_cache(maxsize=1)
+    def _load_wait_types_cached(mtime_ns: int) -> Dict[str, Any]:
+        """按文件修改时间缓存的类型映射读取（mtime 变化时自动失效）"""
+        with open(WAIT_TYPES_JSON, 'rb') as f:
+            return json_loads(f.read())
+    
     def load_wait_types():
         """加载等待语音类型映射"""
         try:
-            if os.path.exists(WAIT_TYPES_JSON):
-                with open(WAIT_TYPES_JSON, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+            return _load_wait_types_cached(os.stat(WAIT_TYPES_JSON).st_mtime_ns)
+        except FileNotFoundError:
+            pass
         except Exception as e:
             log_with_data(f"Failed to load wait types: {e}", 
                          level=logging.WARNING, request_id=g.request_id)
         return {'confirm': [], 'waiting': [], 'completed': []}
     
+    @lru_cache(maxsize=16)
+    def _scan_wait_audio_dir(base_dir: str, mtime_ns: int, audio_type: Optional[str]) -> tuple:
+        """
+        扫描目录中的 WAV 文件（按目录修改时间缓存，增删文件后自动失效）
+        
+        Args:
+            base_dir: 扫描目录
+            mtime_ns: 目录修改时间（仅作为缓存键）
+            audio_type: 类型 (confirm/waiting/completed)，主目录时为 None
+        """
+        url_prefix = '/api/v1/wait-audio/file/'
+        if base_dir != WAIT_AUDIO_DIR:
+            url_prefix += f'{audio_type}/'
+        
+        files = []
+        with os.scandir(base_dir) as entries:
+            for entry in entries:
+                filename = entry.name
+                # 只对后缀做大小写折叠，避免为整个文件名分配新字符串
+                if filename[-4:].lower() == '.wav' and entry.is_file():
+                    files.append({
+                        'filename': filename,
+                        # 移除扩展名作为文本描述
+                        'text': filename.rsplit('.', 1)[0],
+                        'audioUrl': url_prefix + filename,
+                        'type': audio_type or 'mixed'
+                    })
+        return tuple(files)
+    
+    def _get_wait_audio_entries(audio_type: str = None) -> tuple:
+        """
+        获取等待语音文件条目（直接返回缓存的元组，调用方不应修改）
+        
+        Args:
+            audio_type: 类型过滤 (confirm/waiting/completed)，None 则获取所有
+        """
+        # 如果指定了类型，从对应子目录获取；子目录不存在时回退到主目录
+        if audio_type and audio_type in WAIT_AUDIO_TYPES:
+            type_dir = WAIT_AUDIO_TYPE_DIRS[audio_type]
+            try:
+                return _scan_wait_audio_dir(type_dir, os.stat(type_dir).st_mtime_ns, audio_type)
+            except FileNotFoundError:
+                pass
+        
+        try:
+            mtime_ns = os.stat(WAIT_AUDIO_DIR).st_mtime_ns
+        except FileNotFoundError:
+            return ()
+        # 主目录下的 URL 不含类型前缀
+        return _scan_wait_audio_dir(WAIT_AUDIO_DIR, mtime_ns, audio_type or None)
+    
     def get_wait_audio_files(audio_type: str = None):
         """获取等待语音文件列表
         
         Args:
             audio_type: 类型过滤 (confirm/waiting/completed)，None 则获取所有
         """
-        if not os.path.exists(WAIT_AUDIO_DIR):
-            return []
-        
-        # 如果指定了类型，从对应子目录获取
-        if audio_type and audio_type in ['confirm', 'waiting', 'completed']:
-            type_dir = os.path.join(WAIT_AUDIO_DIR, audio_type)
-            if os.path.exists(type_dir):
-                base_dir = type_dir
-            else:
-                # 子目录不存在时回退到主目录
-                base_dir = WAIT_AUDIO_DIR
-        else:
-            base_dir = WAIT_AUDIO_DIR
+        return list(_get_wait_audio_entries(audio_type))
+    
+    @lru_cache(maxsize=16)
+    def _build_wait_audio_index(dir_path: str, mtime_ns: int) -> Dict[str, str]:
+        """构建目录的文件名索引 {小写文件名: 完整路径}（按目录修改时间缓存）"""
+        with os.scandir(dir_path) as entries:
+            return {entry.name.lower(): entry.path for entry in entries if entry.is_file()}
+    
+    def _find_wait_audio_file(dir_path: str, filename: str) -> Optional[str]:
+        """
+        在目录中查找文件（忽略大小写）
         
-        files = []
-        for filename in os.listdir(base_dir):
-            if filename.lower().endswith('.wav'):
-                # 移除扩展名作为文本描述
-                text = filename.rsplit('.', 1)[0]
-                # 确定实际路径
-                if base_dir != WAIT_AUDIO_DIR:
-                    audio_url = f'/api/v1/wait-audio/file/{audio_type}/{filename}'
-                else:
-                    audio_url = f'/api/v1/wait-audio/file/{filename}'
-                files.append({
-                    'filename': filename,
-                    'text': text,
-                    'audioUrl': audio_url,
-                    'type': audio_type or 'mixed'
-                })
-        return files
+        Args:
+            dir_path: 目录路径
+            filename: 文件名
+            
+        Returns:
+            文件完整路径，未找到返回 None
+        """
+        try:
+            index = _build_wait_audio_index(dir_path, os.stat(dir_path).st_mtime_ns)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return index.get(filename.lower())
     
     def _get_random_wait_audio(audio_type: str = None):
         """随机获取一个等待语音
@@ -1294,71 +2629,53 @@ if FLASK_AVAILABLE:
         Args:
             audio_type: 类型过滤 (confirm/waiting/completed)，None 则从所有类型随机选择
         """
-        if audio_type and audio_type in ['confirm', 'waiting', 'completed']:
+        # 直接在缓存的条目上随机取一个，不复制整个列表
+        if audio_type and audio_type in WAIT_AUDIO_TYPES:
             # 从指定类型获取
-            files = get_wait_audio_files(audio_type)
+            files = _get_wait_audio_entries(audio_type)
         else:
             # 从所有类型中先随机选择一个类型，再随机获取一个音频
             wait_types = load_wait_types()
-            valid_types = [t for t in ['confirm', 'waiting', 'completed'] if wait_types.get(t)]
+            valid_types = [t for t in WAIT_AUDIO_TYPES if wait_types.get(t)]
             if not valid_types:
-                files = get_wait_audio_files()
+                files = _get_wait_audio_entries()
             else:
-                import random
                 selected_type = random.choice(valid_types)
-                files = get_wait_audio_files(selected_type)
+                files = _get_wait_audio_entries(selected_type)
         
         if not files:
             return None
-        import random
         return random.choice(files)
     
     @v1_bp.route('/api/v1/wait-audio/file/<path:filename>', methods=['GET'])
+    @profile_route('serve_wait_audio')
     def serve_wait_audio(filename):
         """提供等待语音文件访问"""
-        from urllib.parse import unquote
-        from flask import send_file
-        import mimetypes
-        
         # URL 解码文件名
         filename = unquote(filename)
         
         # 安全检查：防止目录遍历
         if '..' in filename:
-            return jsonify({
-                'success': False,
-                'error': '无效的文件名',
-                'request_id': g.request_id
-            }), 400
+            return _err('无效的文件名', 400)
         
         # 检查是否在子目录中
         file_path = None
         if '/' in filename:
             parts = filename.split('/')
-            if len(parts) == 2 and parts[0] in ['confirm', 'waiting', 'completed']:
-                subdir = parts[0]
-                sub_filename = parts[1]
-                sub_dir = os.path.join(WAIT_AUDIO_DIR, subdir)
-                if os.path.exists(sub_dir):
-                    # 在目录中查找匹配的文件（忽略大小写）
-                    for f in os.listdir(sub_dir):
-                        if f.lower() == sub_filename.lower():
-                            file_path = os.path.join(sub_dir, f)
-                            break
+            if len(parts) == 2 and parts[0] in WAIT_AUDIO_TYPES:
+                file_path = _find_wait_audio_file(WAIT_AUDIO_TYPE_DIRS[parts[0]], parts[1])
         else:
             # 主目录查找
-            if os.path.exists(WAIT_AUDIO_DIR):
-                for f in os.listdir(WAIT_AUDIO_DIR):
-                    if f.lower() == filename.lower():
-                        file_path = os.path.join(WAIT_AUDIO_DIR, f)
-                        break
+            file_path = _find_wait_audio_file(WAIT_AUDIO_DIR, filename)
         
         if file_path and os.path.exists(file_path):
             # 自动检测 MIME 类型
             mime_type, _ = mimetypes.guess_type(file_path)
             if mime_type is None:
                 mime_type = 'audio/wav'
-            return send_file(file_path, mimetype=mime_type)
+            # 等待语音为静态资源：启用条件请求（ETag/Last-Modified）并允许浏览器缓存
+            return send_file(file_path, mimetype=mime_type, conditional=True,
+                             max_age=WAIT_AUDIO_MAX_AGE)
         
         return 'File not found', 404
     
@@ -1391,7 +2708,7 @@ if FLASK_AVAILABLE:
         audio_type = request.args.get('type')
         
         # 验证 type 参数
-        if audio_type and audio_type not in ['confirm', 'waiting', 'completed']:
+        if audio_type and audio_type not in WAIT_AUDIO_TYPES:
             return jsonify({
                 'code': 400,
                 'error': '无效的 type 参数，支持的值: confirm, waiting, completed',
@@ -1465,7 +2782,7 @@ if FLASK_AVAILABLE:
         
         # 获取上下文统计
         try:
-            context_manager = get_context_manager()
+            context_manager = _cm()
             context_stats = context_manager.get_statistics()
         except Exception:
             context_stats = {}
@@ -1523,24 +2840,38 @@ if FLASK_AVAILABLE:
         client_ip = request.remote_addr or 'unknown'
         current_requests = rate_limiter.get_request_count(client_ip)
         
+        return _ok({
+            'config': {
+                'max_requests_per_minute': rate_limiter.max_requests,
+                'time_window_seconds': rate_limiter.per_seconds,
+                'max_concurrent_requests': concurrent_limiter.max_concurrent
+            },
+            'current_ip': {
+                'ip': client_ip,
+                'requests_in_window': current_requests,
+                'remaining_requests': max(0, rate_limiter.max_requests - current_requests)
+            },
+            'server_status': {
+                'current_concurrent_requests': concurrent_limiter.get_current_count(),
+                'max_concurrent_requests': concurrent_limiter.max_concurrent
+            }
+        })
+    
+    @v1_bp.route('/api/v1/profiling', methods=['GET'])
+    def profiling():
+        """
+        路由耗时统计
+        
+        GET /api/v1/profiling
+        
+        Returns:
+            JSON 包含各路由最近请求的 p50/p95/p99 耗时（毫秒）及响应缓存命中率
+        """
         return jsonify({
             'success': True,
-            'data': {
-                'config': {
-                    'max_requests_per_minute': rate_limiter.max_requests,
-                    'time_window_seconds': rate_limiter.per_seconds,
-                    'max_concurrent_requests': concurrent_limiter.max_concurrent
-                },
-                'current_ip': {
-                    'ip': client_ip,
-                    'requests_in_window': current_requests,
-                    'remaining_requests': max(0, rate_limiter.max_requests - current_requests)
-                },
-                'server_status': {
-                    'current_concurrent_requests': concurrent_limiter.get_current_count(),
-                    'max_concurrent_requests': concurrent_limiter.max_concurrent
-                }
-            },
+            'routes': get_route_profile(),
+            'response_cache': DashScopeClient.cache_stats(),
+            'semantic_cache': semantic_cache.stats() if semantic_cache is not None else None,
             'request_id': g.request_id
         })
     
@@ -1607,16 +2938,9 @@ if FLASK_AVAILABLE:
         """
         log_with_data("CSRF token requested", request_id=g.request_id)
         
-        # 生成新的 CSRF token
+        # 生成新的 CSRF token（过期 token 由后台线程定期清理）
         token = CSRFTokenManager.generate_token()
         
-        # 定期清理过期 token（有一定概率执行）
-        if secrets.randbelow(100) == 0:  # 1% 概率
-            cleaned = CSRFTokenManager.cleanup_expired_tokens()
-            if cleaned > 0:
-                log_with_data(f"Cleaned {cleaned} expired CSRF tokens", 
-                             request_id=g.request_id)
-        
         return jsonify({
             'success': True,
             'csrf_token': token,
@@ -1624,8 +2948,128 @@ if FLASK_AVAILABLE:
             'request_id': g.request_id
         })
     
+    # 对话接口参数校验表：(字段名, 默认值, 校验方法)
+    CHAT_PARAM_VALIDATORS = (
+        ('model', Config.DEFAULT_MODEL, validator.validate_model),
+        ('temperature', 0.7, validator.validate_temperature),
+        ('max_tokens', 2000, validator.validate_max_tokens),
+    )
+    
+    def _validate_chat_request(data: Dict[str, Any]) -> Tuple[List[Dict[str, str]], Dict[str, Any], Optional[str]]:
+        """
+        校验对话请求体
+        
+        Args:
+            data: 请求 JSON（已确认包含 messages）
+            
+        Returns:
+            (清理后的 messages, model/temperature/max_tokens 参数, conversation_id)
+            
+        Raises:
+            ValueError: 参数不合法
+        """
+        try:
+            messages = validator.validate_messages(data['messages'])
+        except ValueError as e:
+            raise ValueError(f'消息验证失败: {e}') from e
+        
+        params = {name: validate(data.get(name, default))
+                  for name, default, validate in CHAT_PARAM_VALIDATORS}
+        
+        conversation_id = data.get('conversation_id')
+        if conversation_id:
+            conversation_id = validator.validate_conversation_id(conversation_id)
+        
+        return messages, params, conversation_id
+    
+    class HistoryWriter:
+        """
+        对话历史后台写入器
+        
+        对话接口产生的历史消息放入队列，由后台线程写入，不占用请求线程；
+        短时间窗口内的多次写入合并为一次历史文件读写。
+        """
+        
+        def __init__(self, max_delay: float = 0.05):
+            """
+            初始化写入器并启动后台线程
+            
+            Args:
+                max_delay: 收到第一批消息后等待合并的最长时间（秒）
+            """
+            self.max_delay = max_delay
+            self._queue: queue.SimpleQueue = queue.SimpleQueue()
+            self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+            self._thread.start()
+            # 进程退出前写入队列中剩余的消息
+            atexit.register(self.close)
+        
+        def submit(self, entries: List[Tuple[str, str, str, Optional[int]]]) -> None:
+            """提交待写入的消息（格式同 HistoryManager.add_messages）"""
+            self._queue.put(entries)
+        
+        def close(self, timeout: float = 5.0) -> None:
+            """停止后台线程（队列中已提交的消息会先写入）"""
+            self._queue.put(None)
+            self._thread.join(timeout)
+        
+        def _run(self):
+            """后台线程：收集一批消息后统一写入"""
+            stopping = False
+            while not stopping:
+                item = self._queue.get()
+                if item is None:
+                    break
+                entries = list(item)
+                
+                deadline = time.monotonic() + self.max_delay
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    entries.extend(item)
+                
+                try:
+                    get_history_manager().add_messages(entries)
+                    _invalidate_conversation_list()
+                except Exception as e:
+                    log_with_data(f"History write failed: {e}", level=logging.ERROR,
+                                 extra_data={'count': len(entries)})
+    
+    _history_writer: Optional[HistoryWriter] = None
+    _history_writer_lock = threading.Lock()
+    
+    def get_history_writer() -> HistoryWriter:
+        """获取全局历史写入器（首次调用时创建，多进程部署时在 worker 进程内启动线程）"""
+        global _history_writer
+        if _history_writer is None:
+            with _history_writer_lock:
+                if _history_writer is None:
+                    _history_writer = HistoryWriter()
+        return _history_writer
+    
+    def _save_chat_history(conversation_id: str, messages: List[Dict[str, str]],
+                           assistant_text: str, input_tokens: Optional[int],
+                           output_tokens: Optional[int]) -> None:
+        """将首条用户消息和助手回复提交到后台写入对话历史"""
+        entries = []
+        for msg in messages:
+            if msg['role'] == 'user':
+                entries.append((conversation_id, 'user', msg['content'], input_tokens))
+                break
+        entries.append((conversation_id, 'assistant', assistant_text, output_tokens))
+        get_history_writer().submit(entries)
+    
     @v1_bp.route('/api/v1/chat', methods=['POST'])
     @v1_bp.route('/api/v1/chat/<path:api_key>', methods=['POST'])
+    @profile_route('chat')
     @validate_json_content_type
     def chat(api_key=None):
         """
@@ -1653,7 +3097,7 @@ if FLASK_AVAILABLE:
             data = request.get_json()
             
             # 参数验证
-            if not data or 'messages' not in data:
+            if not isinstance(data, dict) or 'messages' not in data:
                 log_with_data("Missing required parameter: messages", 
                              level=logging.WARNING, request_id=request_id)
                 return jsonify({
@@ -1661,98 +3105,63 @@ if FLASK_AVAILABLE:
                     'request_id': request_id
                 }), 400
             
-            # ========== 输入验证开始 ==========
-            # 验证并清理 messages
             try:
-                messages = validator.validate_messages(data['messages'])
+                messages, params, conversation_id = _validate_chat_request(data)
             except ValueError as e:
-                log_with_data(f"Messages validation failed: {e}", 
+                log_with_data(f"Chat validation failed: {e}", 
                              level=logging.WARNING, request_id=request_id)
-                return jsonify({
-                    'error': f'消息验证失败: {e}',
-                    'request_id': request_id
-                }), 400
-            
-            # 验证 model 参数
-            model = data.get('model', Config.DEFAULT_MODEL)
-            try:
-                model = validator.validate_model(model)
-            except ValueError as e:
                 return jsonify({
                     'error': str(e),
                     'request_id': request_id
                 }), 400
+            model = params['model']
+            temperature = params['temperature']
+            max_tokens = params['max_tokens']
             
-            # 验证 temperature 参数
-            temperature = data.get('temperature', 0.7)
-            try:
-                temperature = validator.validate_temperature(temperature)
-            except ValueError as e:
-                return jsonify({
-                    'error': str(e),
-                    'request_id': request_id
-                }), 400
+            log_with_data("Calling DashScope API", request_id=request_id,
+                         extra_data={'model': model, 'temperature': temperature})
             
-            # 验证 max_tokens 参数
-            max_tokens = data.get('max_tokens', 2000)
-            try:
-                max_tokens = validator.validate_max_tokens(max_tokens)
-            except ValueError as e:
-                return jsonify({
-                    'error': str(e),
-                    'request_id': request_id
-                }), 400
+            client = get_client()
             
-            # 验证 conversation_id（如果有）
-            conversation_id = data.get('conversation_id')
-            if conversation_id:
+            # 语义缓存：相似对话直接复用历史回复
+            response = None
+            query_vector = None
+            if semantic_cache is not None:
+                system_text, dialog_text = SemanticCache.split_messages(messages)
+                partition = TTLCache.make_key([model, temperature, max_tokens, system_text])
                 try:
-                    conversation_id = validator.validate_conversation_id(conversation_id)
-                except ValueError as e:
-                    return jsonify({
-                        'error': str(e),
-                        'request_id': request_id
-                    }), 400
-            # ========== 输入验证结束 ==========
-            
-            log_with_data("Calling DashScope API", request_id=request_id,
-                         extra_data={'model': model, 'temperature': temperature})
+                    # 经微批处理器合并并发请求的向量化调用
+                    query_vector = get_embedding_batcher().embed([dialog_text])[0]
+                except Exception as e:
+                    # 向量化失败不影响对话，跳过缓存
+                    log_with_data(f"Semantic cache embedding failed: {e}",
+                                 level=logging.WARNING, request_id=request_id)
+                else:
+                    response = semantic_cache.get(partition, query_vector)
+                    if response is not None:
+                        log_with_data("Semantic cache hit", request_id=request_id)
             
-            # 创建客户端并调用 API
-            client = DashScopeClient(model=model)
-            response = client.chat(
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
+            if response is None:
+                # 使用全局客户端调用 API（按请求指定模型）
+                response = client.chat(
+                    messages=messages,
+                    model=model,
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )
+                if query_vector is not None:
+                    semantic_cache.set(partition, query_vector, response)
             
             # 提取响应内容
-            output = response.get('output', {})
-            assistant_text = output.get('text', '')
+            assistant_text = extract_text(response, '')
             usage = response.get('usage', {})
             input_tokens = usage.get('input_tokens', 0)
             output_tokens = usage.get('output_tokens', 0)
             
             # 保存到历史记录（如果有 conversation_id）
             if conversation_id:
-                history_manager = get_history_manager()
-                # 添加用户消息
-                for msg in messages:
-                    if msg['role'] == 'user':
-                        history_manager.add_message(
-                            conversation_id=conversation_id,
-                            role='user',
-                            content=msg['content'],
-                            token_count=input_tokens
-                        )
-                        break
-                # 添加助手回复
-                history_manager.add_message(
-                    conversation_id=conversation_id,
-                    role='assistant',
-                    content=assistant_text,
-                    token_count=output_tokens
-                )
+                _save_chat_history(conversation_id, messages, assistant_text,
+                                   input_tokens, output_tokens)
             
             log_with_data("Chat response generated", request_id=request_id,
                          extra_data={'model': model, 'success': True})
@@ -1761,7 +3170,7 @@ if FLASK_AVAILABLE:
                 'success': True,
                 'data': response,
                 'conversation_id': conversation_id,
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': now_iso(),
                 'request_id': request_id
             })
             
@@ -1775,29 +3184,166 @@ if FLASK_AVAILABLE:
                 'request_id': request_id
             }), 500
     
+    # SSE 响应头：禁止缓存，并关闭反向代理（nginx）的响应缓冲
+    SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    
+    def _sse_event(data: Any, event: str = None) -> bytes:
+        """编码一条 SSE 事件"""
+        frame = b'data: ' + json_dumps_bytes(data) + b'\n\n'
+        if event:
+            frame = f'event: {event}\n'.encode() + frame
+        return frame
+    
+    @v1_bp.route('/api/v1/chat/stream', methods=['POST'])
+    @validate_json_content_type
+    def chat_stream():
+        """
+        流式对话接口（Server-Sent Events）
+        
+        POST /api/v1/chat/stream
+        请求体与 /api/v1/chat 相同。
+        
+        响应为 text/event-stream，每个增量片段一条事件：
+            data: {"text": "..."}
+        结束时发送 event: done（携带完整回复），出错时发送 event: error。
+        """
+        request_id = g.request_id
+        data = request.get_json()
+        if not isinstance(data, dict) or 'messages' not in data:
+            return _err('Missing required parameter: messages', 400)
+        
+        try:
+            messages, params, conversation_id = _validate_chat_request(data)
+        except ValueError as e:
+            return _err(str(e), 400)
+        
+        log_with_data("Chat stream started", request_id=request_id,
+                     extra_data={'model': params['model']})
+        client = get_client()
+        
+        def generate():
+            parts = []
+            try:
+                for text in client.chat_stream(messages, **params):
+                    parts.append(text)
+                    yield _sse_event({'text': text})
+            except Exception as e:
+                log_with_data(f"Chat stream error: {e}", level=logging.ERROR,
+                             request_id=request_id,
+                             extra_data={'error_type': type(e).__name__})
+                yield _sse_event({'error': str(e), 'request_id': request_id}, event='error')
+                return
+            
+            reply = ''.join(parts)
+            if conversation_id:
+                _save_chat_history(conversation_id, messages, reply, None, None)
+            yield _sse_event({'text': reply, 'conversation_id': conversation_id,
+                              'request_id': request_id}, event='done')
+        
+        return Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+    
+    # 模型列表与配置在运行期间不变，启动时序列化一次；
+    # 去掉结尾的 '}'，每次请求只拼接 request_id
+    _MODELS_BODY_PREFIX = json_dumps_bytes({
+        'models': Config.SUPPORTED_MODELS,
+        'default': Config.DEFAULT_MODEL
+    })[:-1] + b',"request_id":'
+    _CONFIG_BODY_PREFIX = json_dumps_bytes({
+        'api_key_configured': bool(Config.DASHSCOPE_API_KEY),
+        'base_url': Config.DASHSCOPE_BASE_URL,
+        'default_model': Config.DEFAULT_MODEL,
+        'supported_models': Config.SUPPORTED_MODELS
+    })[:-1] + b',"request_id":'
+    
+    # 静态数据允许浏览器缓存；响应体含每次请求的 request_id，不允许共享缓存（代理/CDN）
+    STATIC_CACHE_HEADERS = {'Cache-Control': 'private, max-age=300'}
+    
+    def _static_json(prefix: bytes) -> Response:
+        """用预序列化的响应体构建 JSON 响应"""
+        body = prefix + json_dumps_bytes(g.request_id) + b'}'
+        return Response(body, mimetype='application/json', headers=STATIC_CACHE_HEADERS)
+    
     @v1_bp.route('/api/v1/models', methods=['GET'])
     def list_models():
         """获取支持的模型列表"""
         log_with_data("Models list requested", request_id=g.request_id)
-        return jsonify({
-            'models': Config.SUPPORTED_MODELS,
-            'default': Config.DEFAULT_MODEL,
-            'request_id': g.request_id
-        })
+        return _static_json(_MODELS_BODY_PREFIX)
     
     @v1_bp.route('/api/v1/config', methods=['GET'])
     def get_config():
         """获取当前配置（不包含敏感信息）"""
         log_with_data("Config requested", request_id=g.request_id)
-        return jsonify({
-            'api_key_configured': bool(Config.DASHSCOPE_API_KEY),
-            'base_url': Config.DASHSCOPE_BASE_URL,
-            'default_model': Config.DEFAULT_MODEL,
-            'supported_models': Config.SUPPORTED_MODELS,
-            'request_id': g.request_id
-        })
+        return _static_json(_CONFIG_BODY_PREFIX)
+    
+    # ========== OpenClaw 调用 ==========
+    
+    # OpenClaw 后台线程池（TTS 总结与合成器初始化并行执行）
+    _openclaw_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='openclaw')
+    
+    # OpenClaw 可执行文件路径（启动时解析一次，避免每次调用都搜索 PATH）
+    OPENCLAW_BIN = os.environ.get('OPENCLAW_BIN') or shutil.which('openclaw') or 'openclaw'
+    
+    # 同时运行的 OpenClaw 子进程上限（高并发时排队，避免进程和连接数失控）
+    OPENCLAW_MAX_CONCURRENCY = int(os.environ.get('OPENCLAW_MAX_CONCURRENCY', '8'))
+    _openclaw_semaphore = threading.BoundedSemaphore(OPENCLAW_MAX_CONCURRENCY)
+    
+    def _parse_openclaw_output(output: str) -> str:
+        """
+        解析 OpenClaw 输出，兼容 {"reply": "..."} 形式的 JSON 输出
+        
+        Args:
+            output: OpenClaw 标准输出
+            
+        Returns:
+            回复文本
+        """
+        reply = output.strip()
+        if reply.startswith('{'):
+            try:
+                reply = json_loads(reply).get('reply', reply)
+            except ValueError:
+                pass
+        return reply
+    
+    def _run_openclaw_agent(prompt: str, session_id: str,
+                            agent_timeout: int, timeout: int) -> tuple:
+        """
+        运行 OpenClaw agent
+        
+        Args:
+            prompt: 发送给 agent 的消息
+            session_id: OpenClaw 会话 ID
+            agent_timeout: agent 内部超时（秒）
+            timeout: 子进程超时（秒）
+            
+        Returns:
+            (是否成功, 回复文本, 错误信息)
+            
+        Raises:
+            subprocess.TimeoutExpired: 子进程超时
+        """
+        cmd = [
+            OPENCLAW_BIN, 'agent',
+            '--message', prompt,
+            '--session-id', session_id,
+            '--local',
+            '--timeout', str(agent_timeout)
+        ]
+        
+        with _openclaw_semaphore:
+            result = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                timeout=timeout
+            )
+        
+        if result.returncode != 0:
+            return False, '', result.stderr.strip()
+        return True, _parse_openclaw_output(result.stdout), ''
     
     @v1_bp.route('/api/v1/openclaw/chat', methods=['POST'])
+    @profile_route('openclaw_chat')
     @async_timeout(LONG_TIMEOUT)  # 对话接口使用更长超时
     def openclaw_chat():
         """
@@ -1810,39 +3356,33 @@ if FLASK_AVAILABLE:
             message: 用户消息
             session_label: 会话标签 (默认: voice-chat)
             need_tts: 是否需要 TTS (默认: true)
+            tts_audio_url: 是否以 URL 形式返回 TTS 音频 (默认: false，返回 base64 data URI)
             conversation_id: 对话 ID（可选，用于多轮对话上下文管理）
             system_prompt: 系统提示词（可选，创建新会话时使用）
         
         Returns:
             JSON 包含 AI 回复和 TTS 音频 URL
         """
-        import subprocess
-        import shlex
-        import urllib.request
-        from dashscope.audio.tts_v2 import SpeechSynthesizer, AudioFormat
-        from dashscope.audio.tts_v2.speech_synthesizer import ResultCallback
-        from io import BytesIO
-        import wave
-        
         try:
             data = request.get_json()
             if not data or 'message' not in data:
-                return jsonify({
-                    'success': False,
-                    'error': '缺少消息内容',
-                    'request_id': g.request_id
-                }), 400
+                return _err('缺少消息内容', 400)
             
             message = data['message']
             session_label = data.get('session_label', 'voice-chat')
             need_tts = data.get('need_tts', True)
+            if need_tts and not DASHSCOPE_SDK_AVAILABLE:
+                log_with_data("dashscope SDK not installed, skipping TTS",
+                             level=logging.WARNING, request_id=g.request_id)
+                need_tts = False
+            tts_as_url = bool(data.get('tts_audio_url', False))
             
             # ========== 多轮对话上下文管理 ==========
             conversation_id = data.get('conversation_id')
             system_prompt = data.get('system_prompt')
             
             # 获取上下文管理器
-            context_manager = get_context_manager()
+            context_manager = _cm()
             
             # 如果没有 conversation_id，创建一个新的
             if not conversation_id:
@@ -1899,37 +3439,12 @@ if FLASK_AVAILABLE:
 
 请用简短、友好的中文回复。"""
             
-            cmd = [
-                'openclaw', 'agent',
-                '--message', task_prompt,
-                '--session-id', session_label,
-                '--local',
-                '--timeout', '60'
-            ]
-            
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=90
+            ok, reply, error = _run_openclaw_agent(
+                task_prompt, session_label, agent_timeout=60, timeout=90
             )
             
-            if result.returncode != 0:
-                return jsonify({
-                    'success': False,
-                    'error': result.stderr.strip() or 'OpenClaw 执行失败',
-                    'request_id': g.request_id
-                }), 500
-            
-            # 提取 AI 回复
-            reply = result.stdout.strip()
-            if reply.startswith('{') and '"reply"' in reply:
-                import json as json_module
-                try:
-                    data = json_module.loads(reply)
-                    reply = data.get('reply', reply)
-                except:
-                    pass
+            if not ok:
+                return _err(error or 'OpenClaw 执行失败', 500)
             
             log_with_data(f"AI reply: {reply[:100]}...", request_id=g.request_id)
             
@@ -1959,32 +3474,25 @@ if FLASK_AVAILABLE:
 
 只返回总结后的文字，不要其他内容。"""
                 
-                summarize_cmd = [
-                    'openclaw', 'agent',
-                    '--message', summarize_prompt,
-                    '--session-id', f'{session_label}-tts-summary',
-                    '--local',
-                    '--timeout', '30'
-                ]
+                # 在后台线程运行总结子进程，同时在当前线程初始化 TTS 合成器
+                summary_future = _openclaw_executor.submit(
+                    _run_openclaw_agent, summarize_prompt, f'{session_label}-tts-summary',
+                    agent_timeout=30, timeout=45
+                )
+                
+                # 收集音频数据
+                audio_chunks = []
                 
-                summary_result = subprocess.run(
-                    summarize_cmd,
-                    capture_output=True,
-                    text=True,
-                    timeout=45
+                synthesizer = SpeechSynthesizer(
+                    model='cosyvoice-v3-flash',
+                    voice='longhuhu_v3',
+                    format=AudioFormat.PCM_22050HZ_MONO_16BIT,
+                    callback=AudioCallback(audio_chunks.append)
                 )
                 
-                if summary_result.returncode == 0:
-                    summary = summary_result.stdout.strip()
-                    # 清理 JSON 格式
-                    if summary.startswith('{') and '"reply"' in summary:
-                        try:
-                            import json as json_module
-                            data = json_module.loads(summary)
-                            summary = data.get('reply', summary)
-                        except:
-                            pass
-                    
+                summary_ok, summary, summary_error = summary_future.result()
+                
+                if summary_ok:
                     # 如果总结太长或为空，使用原回复
                     if not summary or len(summary) > 200:
                         summary = reply[:200]
@@ -1994,62 +3502,32 @@ if FLASK_AVAILABLE:
                     # ========== 步骤 3: 使用总结内容生成 TTS ==========
                     log_with_data("Generating TTS audio...", request_id=g.request_id)
                     
-                    # 在应用上下文中生成 TTS
-                    from flask import current_app
-                    request_id_for_log = g.request_id  # 保存到局部变量
+                    synthesizer.streaming_call(summary)
+                    synthesizer.streaming_complete()
                     
-                    with current_app.app_context():
-                        # 收集音频数据
-                        audio_chunks = []
-                        
-                        class AudioCallback(ResultCallback):
-                            def on_open(self):
-                                # 不调用 log_with_data，避免上下文问题
-                                pass
-                            
-                            def on_complete(self):
-                                pass
-                            
-                            def on_error(self, message: str):
-                                pass
-                            
-                            def on_close(self):
-                                pass
-                            
-                            def on_data(self, data: bytes) -> None:
-                                audio_chunks.append(data)
-                        
-                        synthesizer = SpeechSynthesizer(
-                            model='cosyvoice-v3-flash',
-                            voice='longhuhu_v3',
-                            format=AudioFormat.PCM_22050HZ_MONO_16BIT,
-                            callback=AudioCallback()
-                        )
-                        
-                        synthesizer.streaming_call(summary)
-                        synthesizer.streaming_complete()
-                        
-                        audio_data = b''.join(audio_chunks)
+                    audio_size = sum(map(len, audio_chunks))
                     
-                    if len(audio_data) > 0:
-                        # 创建 WAV 文件
-                        wav_buffer = BytesIO()
-                        with wave.open(wav_buffer, 'wb') as wav_file:
-                            wav_file.setnchannels(1)
-                            wav_file.setsampwidth(2)
-                            wav_file.setframerate(22050)
-                            wav_file.writeframes(audio_data)
-                        
-                        wav_data = wav_buffer.getvalue()
+                    if audio_size > 0:
+                        # 手动生成 WAV 头，与 PCM 片段直接拼接（避免 wave/BytesIO 的多次复制）
+                        header = wav_header(audio_size)
                         
                         response_data['tts_summary'] = summary
-                        response_data['tts_audio'] = 'data:audio/wav;base64,' + \
-                            __import__('base64').b64encode(wav_data).decode('ascii')
+                        if tts_as_url:
+                            # 写入临时文件，由客户端通过 URL 获取，避免 base64 膨胀
+                            audio_id = uuid.uuid4().hex
+                            with open(os.path.join(TTS_AUDIO_DIR, f'{audio_id}.wav'), 'wb') as f:
+                                f.write(header)
+                                f.writelines(audio_chunks)
+                            response_data['tts_audio_url'] = f'/api/v1/tts/audio/{audio_id}.wav'
+                        else:
+                            wav_data = b''.join([header, *audio_chunks])
+                            response_data['tts_audio'] = 'data:audio/wav;base64,' + \
+                                base64.b64encode(wav_data).decode('ascii')
                     else:
                         log_with_data("TTS audio is empty", 
                                      level=logging.WARNING, request_id=g.request_id)
                 else:
-                    log_with_data(f"Summarize failed: {summary_result.stderr}", 
+                    log_with_data(f"Summarize failed: {summary_error}", 
                                  level=logging.ERROR, request_id=g.request_id)
             
             return jsonify(response_data)
@@ -2057,19 +3535,11 @@ if FLASK_AVAILABLE:
         except subprocess.TimeoutExpired:
             log_with_data("OpenClaw timeout", 
                          level=logging.ERROR, request_id=g.request_id)
-            return jsonify({
-                'success': False,
-                'error': 'OpenClaw 会话超时',
-                'request_id': g.request_id
-            }), 504
+            return _err('OpenClaw 会话超时', 504)
         except Exception as e:
             log_with_data(f"OpenClaw chat error: {str(e)}", 
                          level=logging.ERROR, request_id=g.request_id)
-            return jsonify({
-                'success': False,
-                'error': str(e),
-                'request_id': g.request_id
-            }), 500
+            return _err(str(e), 500)
     
     # ========== 多轮对话上下文管理 API ==========
     
@@ -2083,17 +3553,13 @@ if FLASK_AVAILABLE:
         Returns:
             JSON 包含所有会话列表
         """
-        context_manager = get_context_manager()
+        context_manager = _cm()
         sessions = context_manager.get_all_sessions()
         stats = context_manager.get_statistics()
         
-        return jsonify({
-            'success': True,
-            'data': {
-                'sessions': sessions,
-                'statistics': stats
-            },
-            'request_id': g.request_id
+        return _ok({
+            'sessions': sessions,
+            'statistics': stats
         })
     
     @v1_bp.route('/api/v1/context/sessions', methods=['POST'])
@@ -2115,6 +3581,12 @@ if FLASK_AVAILABLE:
         session_id = data.get('session_id')
         system_prompt = data.get('system_prompt')
         
+        # 自定义 session_id 需符合路由格式，否则后续无法通过 URL 访问
+        if session_id is not None and not (
+                isinstance(session_id, str)
+                and re.fullmatch(InputValidator.SESSION_ID_REGEX, session_id)):
+            return _err('session_id 格式无效，只允许 1-128 位字母、数字、下划线和中划线', 400)
+        
         # 验证并清理 system_prompt（如果有）
         if system_prompt:
             try:
@@ -2124,13 +3596,9 @@ if FLASK_AVAILABLE:
                     max_length=10000
                 )
             except ValueError as e:
-                return jsonify({
-                    'success': False,
-                    'error': str(e),
-                    'request_id': g.request_id
-                }), 400
+                return _err(str(e), 400)
         
-        context_manager = get_context_manager()
+        context_manager = _cm()
         session = context_manager.create_session(
             session_id=session_id,
             system_prompt=system_prompt or "你是一个友好的语音助手，请用简洁的中文回复。"
@@ -2145,7 +3613,7 @@ if FLASK_AVAILABLE:
             'request_id': g.request_id
         }), 201
     
-    @v1_bp.route('/api/v1/context/sessions/<session_id>', methods=['GET'])
+    @v1_bp.route('/api/v1/context/sessions/<sid:session_id>', methods=['GET'])
     def get_context_session(session_id: str):
         """
         获取会话上下文信息
@@ -2155,62 +3623,55 @@ if FLASK_AVAILABLE:
         Returns:
             JSON 包含会话信息和消息列表
         """
-        # 验证 session_id 格式
-        if not session_id or len(session_id) < 1:
-            return jsonify({
-                'success': False,
-                'error': '无效的 session_id',
-                'request_id': g.request_id
-            }), 400
-        
-        context_manager = get_context_manager()
+        context_manager = _cm()
         session = context_manager.get_session(session_id)
         
         if session is None:
-            return jsonify({
-                'success': False,
-                'error': '会话不存在',
-                'request_id': g.request_id
-            }), 404
+            return _err('会话不存在', 404)
         
-        return jsonify({
-            'success': True,
-            'data': session,
-            'request_id': g.request_id
-        })
+        return _ok(session)
     
-    @v1_bp.route('/api/v1/context/sessions/<session_id>/messages', methods=['GET'])
+    @v1_bp.route('/api/v1/context/sessions/<sid:session_id>/messages', methods=['GET'])
     def get_context_messages(session_id: str):
         """
         获取会话消息列表（API 格式）
         
         GET /api/v1/context/sessions/<session_id>/messages
+        Query params:
+            limit: 每页消息数 (默认 50, 最大 200)
+            before_id: 游标，返回该消息之前的消息（取上一页的 next_cursor）
         
         Returns:
-            JSON 包含消息列表
+            JSON 包含消息列表和下一页游标
         """
-        # 验证 session_id 格式
-        if not session_id or len(session_id) < 1:
-            return jsonify({
-                'success': False,
-                'error': '无效的 session_id',
-                'request_id': g.request_id
-            }), 400
+        # 验证 limit 参数
+        try:
+            limit = request.args.get('limit', 50, type=int)
+            if limit < 1 or limit > 200:
+                limit = 50
+        except (TypeError, ValueError):
+            limit = 50
         
-        context_manager = get_context_manager()
-        messages = context_manager.get_messages(session_id)
+        before_id = request.args.get('before_id') or None
         
-        return jsonify({
-            'success': True,
-            'data': {
-                'session_id': session_id,
-                'messages': messages,
-                'count': len(messages)
-            },
-            'request_id': g.request_id
+        context_manager = _cm()
+        try:
+            page = context_manager.get_messages_page(
+                session_id, limit=limit, before_id=before_id
+            )
+        except ValueError as e:
+            return _err(str(e), 400)
+        
+        messages = page['messages']
+        return _ok({
+            'session_id': session_id,
+            'messages': messages,
+            'count': len(messages),
+            'limit': limit,
+            'next_cursor': page['next_cursor']
         })
     
-    @v1_bp.route('/api/v1/context/sessions/<session_id>', methods=['DELETE'])
+    @v1_bp.route('/api/v1/context/sessions/<sid:session_id>', methods=['DELETE'])
     def delete_context_session(session_id: str):
         """
         删除会话上下文
@@ -2220,15 +3681,7 @@ if FLASK_AVAILABLE:
         Returns:
             JSON 包含操作结果
         """
-        # 验证 session_id 格式
-        if not session_id or len(session_id) < 1:
-            return jsonify({
-                'success': False,
-                'error': '无效的 session_id',
-                'request_id': g.request_id
-            }), 400
-        
-        context_manager = get_context_manager()
+        context_manager = _cm()
         success = context_manager.delete_session(session_id)
         
         if success:
@@ -2240,13 +3693,9 @@ if FLASK_AVAILABLE:
                 'request_id': g.request_id
             })
         else:
-            return jsonify({
-                'success': False,
-                'error': '会话不存在',
-                'request_id': g.request_id
-            }), 404
+            return _err('会话不存在', 404)
     
-    @v1_bp.route('/api/v1/context/sessions/<session_id>/messages', methods=['POST'])
+    @v1_bp.route('/api/v1/context/sessions/<sid:session_id>/messages', methods=['POST'])
     @validate_json_content_type
     def add_context_message(session_id: str):
         """
@@ -2260,61 +3709,37 @@ if FLASK_AVAILABLE:
         Returns:
             JSON 包含添加的消息
         """
-        # 验证 session_id 格式
-        if not session_id or len(session_id) < 1:
-            return jsonify({
-                'success': False,
-                'error': '无效的 session_id',
-                'request_id': g.request_id
-            }), 400
-        
         data = request.get_json()
         
         if not data or 'content' not in data:
-            return jsonify({
-                'success': False,
-                'error': '缺少必需参数: content',
-                'request_id': g.request_id
-            }), 400
+            return _err('缺少必需参数: content', 400)
         
         # 验证并清理 content
         try:
-            content = validator.validate_string(
+            content = validator.validate_and_sanitize(
                 data['content'], 
                 field_name='content',
                 max_length=50000
             )
         except ValueError as e:
-            return jsonify({
-                'success': False,
-                'error': str(e),
-                'request_id': g.request_id
-            }), 400
+            return _err(str(e), 400)
         
         # 验证 role
         role = data.get('role', 'user')
         try:
             role = validator.validate_role(role)
         except ValueError as e:
-            return jsonify({
-                'success': False,
-                'error': str(e),
-                'request_id': g.request_id
-            }), 400
+            return _err(str(e), 400)
         
-        context_manager = get_context_manager()
+        context_manager = _cm()
         message = context_manager.add_message(
             session_id=session_id,
             role=role,
-            content=validator.sanitize_string(content)
+            content=content
         )
         
         if message is None:
-            return jsonify({
-                'success': False,
-                'error': '会话不存在',
-                'request_id': g.request_id
-            }), 404
+            return _err('会话不存在', 404)
         
         return jsonify({
             'success': True,
@@ -2332,7 +3757,7 @@ if FLASK_AVAILABLE:
         Returns:
             JSON 包含清空的会话数量
         """
-        context_manager = get_context_manager()
+        context_manager = _cm()
         count = context_manager.clear_all()
         
         log_with_data("All context sessions cleared", request_id=g.request_id,
@@ -2355,14 +3780,10 @@ if FLASK_AVAILABLE:
         Returns:
             JSON 包含统计信息
         """
-        context_manager = get_context_manager()
+        context_manager = _cm()
         stats = context_manager.get_statistics()
         
-        return jsonify({
-            'success': True,
-            'data': stats,
-            'request_id': g.request_id
-        })
+        return _ok(stats)
     
     # ========== 唤醒词管理 API ==========
     
@@ -2412,11 +3833,7 @@ if FLASK_AVAILABLE:
         wake_storage = get_wake_storage()
         stats = wake_storage.get_wake_stats(days=days)
         
-        return jsonify({
-            'success': True,
-            'data': stats,
-            'request_id': g.request_id
-        })
+        return _ok(stats)
     
     @v1_bp.route('/api/v1/wake-word/events', methods=['GET'])
     def get_wake_word_events():
@@ -2457,15 +3874,11 @@ if FLASK_AVAILABLE:
         else:
             events = wake_storage.get_recent_wake_events(limit=limit, offset=offset)
         
-        return jsonify({
-            'success': True,
-            'data': {
-                'events': events,
-                'count': len(events),
-                'limit': limit,
-                'offset': offset
-            },
-            'request_id': g.request_id
+        return _ok({
+            'events': events,
+            'count': len(events),
+            'limit': limit,
+            'offset': offset
         })
     
     @v1_bp.route('/api/v1/wake-word/events', methods=['POST'])
@@ -2513,13 +3926,9 @@ if FLASK_AVAILABLE:
         # 获取并验证参数
         session_id = data.get('session_id', 'default')
         
-        trigger_type = data.get('trigger_type', 'wake_word')
-        if trigger_type not in ['wake_word', 'manual']:
-            return jsonify({
-                'success': False,
-                'error': 'trigger_type 无效，支持的值: wake_word, manual',
-                'request_id': g.request_id
-            }), 400
+        trigger_type = data.get('trigger_type', 'wake_word')
+        if trigger_type not in ['wake_word', 'manual']:
+            return _err('trigger_type 无效，支持的值: wake_word, manual', 400)
         
         success = data.get('success', True)
         if not isinstance(success, bool):
@@ -2547,11 +3956,7 @@ if FLASK_AVAILABLE:
         )
         
         if event_id is None:
-            return jsonify({
-                'success': False,
-                'error': '记录唤醒事件失败',
-                'request_id': g.request_id
-            }), 500
+            return _err('记录唤醒事件失败', 500)
         
         # 获取完整的事件信息
         event = wake_storage.get_wake_event(event_id)
@@ -2598,11 +4003,7 @@ if FLASK_AVAILABLE:
             'enabled': os.environ.get('WAKE_ENABLED', 'true').lower() == 'true'
         }
         
-        return jsonify({
-            'success': True,
-            'data': config,
-            'request_id': g.request_id
-        })
+        return _ok(config)
     
     @v1_bp.route('/api/v1/wake-word/config', methods=['POST'])
     @validate_json_content_type
@@ -2690,11 +4091,7 @@ if FLASK_AVAILABLE:
         
         # 如果有错误，返回错误信息
         if errors:
-            return jsonify({
-                'success': False,
-                'error': '; '.join(errors),
-                'request_id': g.request_id
-            }), 400
+            return _err('; '.join(errors), 400)
         
         # 更新配置到环境变量（仅内存中）
         for key, value in updated_config.items():
@@ -2743,6 +4140,73 @@ if FLASK_AVAILABLE:
     
     # ========== 对话历史管理 API ==========
     
+    # 对话列表响应缓存：前端轮询列表时直接返回内存中的序列化结果
+    CONVERSATION_LIST_TTL = 2.0
+    CONVERSATION_LIST_CACHE_SIZE = 32
+    
+    _conversation_list_cache: Dict[tuple, Tuple[float, bytes]] = {}
+    _conversation_list_lock = threading.Lock()
+    _conversation_list_generation = 0
+    
+    def _invalidate_conversation_list() -> None:
+        """对话数据变更后清空列表缓存"""
+        global _conversation_list_generation
+        with _conversation_list_lock:
+            _conversation_list_generation += 1
+            _conversation_list_cache.clear()
+    
+    def _conversation_list_response(key: tuple, load: Callable[[], Dict[str, Any]]) -> Response:
+        """
+        返回对话列表响应，TTL 内命中缓存时不访问历史存储
+        
+        Args:
+            key: 缓存键（分页参数）
+            load: 缓存未命中时加载列表数据的函数
+        
+        Returns:
+            Flask Response 对象
+        """
+        now = time.monotonic()
+        with _conversation_list_lock:
+            entry = _conversation_list_cache.get(key)
+            generation = _conversation_list_generation
+        
+        if entry is not None and now - entry[0] < CONVERSATION_LIST_TTL:
+            prefix = entry[1]
+        else:
+            prefix = b'{"success":true,"data":' + json_dumps_bytes(load()) + b',"request_id":'
+            with _conversation_list_lock:
+                # 加载期间发生过写入则不缓存，避免把旧数据放回缓存
+                if generation == _conversation_list_generation:
+                    _conversation_list_cache.pop(key, None)
+                    if len(_conversation_list_cache) >= CONVERSATION_LIST_CACHE_SIZE:
+                        del _conversation_list_cache[next(iter(_conversation_list_cache))]
+                    _conversation_list_cache[key] = (now, prefix)
+        
+        body = prefix + json_dumps_bytes(g.request_id) + b'}'
+        return Response(body, mimetype='application/json')
+    
+    def _encode_cursor(cursor: Optional[tuple]) -> Optional[str]:
+        """将 (created_at, id) 游标编码为 URL 安全字符串"""
+        if cursor is None:
+            return None
+        return base64.urlsafe_b64encode(json_dumps_bytes(list(cursor))).decode('ascii')
+    
+    def _decode_cursor(cursor: str) -> tuple:
+        """
+        解码分页游标
+        
+        Raises:
+            ValueError: 游标格式无效
+        """
+        try:
+            created_at, conv_id = json_loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except (TypeError, ValueError, UnicodeError):
+            raise ValueError("invalid cursor")
+        if not isinstance(created_at, str) or not isinstance(conv_id, str):
+            raise ValueError("invalid cursor")
+        return created_at, conv_id
+    
     @v1_bp.route('/api/v1/conversations', methods=['GET'])
     def list_conversations():
         """
@@ -2751,7 +4215,8 @@ if FLASK_AVAILABLE:
         GET /api/v1/conversations
         Query params:
             limit: 返回数量限制 (默认 20, 最大 100)
-            offset: 偏移量 (默认 0)
+            cursor: 分页游标（上一页响应中的 next_cursor）
+            offset: 偏移量 (默认 0，已弃用，建议使用 cursor)
         """
         # 验证 limit 参数
         try:
@@ -2761,6 +4226,23 @@ if FLASK_AVAILABLE:
         except (TypeError, ValueError):
             limit = 20
         
+        history_manager = _hm()
+        
+        # 游标分页：页深度不影响查询代价
+        cursor = request.args.get('cursor')
+        if cursor is not None or 'offset' not in request.args:
+            try:
+                decoded = _decode_cursor(cursor) if cursor else None
+            except ValueError:
+                return _err('cursor 参数无效', 400)
+            
+            def load_page() -> Dict[str, Any]:
+                result = history_manager.get_conversations_after(cursor=decoded, limit=limit)
+                result['next_cursor'] = _encode_cursor(result['next_cursor'])
+                return result
+            
+            return _conversation_list_response((limit, 'cursor', cursor), load_page)
+        
         # 验证 offset 参数
         try:
             offset = request.args.get('offset', 0, type=int)
@@ -2769,14 +4251,10 @@ if FLASK_AVAILABLE:
         except (TypeError, ValueError):
             offset = 0
         
-        history_manager = get_history_manager()
-        result = history_manager.get_conversations(limit=limit, offset=offset)
-        
-        return jsonify({
-            'success': True,
-            'data': result,
-            'request_id': g.request_id
-        })
+        return _conversation_list_response(
+            (limit, 'offset', offset),
+            lambda: history_manager.get_conversations(limit=limit, offset=offset)
+        )
     
     @v1_bp.route('/api/v1/conversations', methods=['POST'])
     @validate_json_content_type
@@ -2802,11 +4280,7 @@ if FLASK_AVAILABLE:
                     max_length=200
                 )
             except ValueError as e:
-                return jsonify({
-                    'success': False,
-                    'error': str(e),
-                    'request_id': g.request_id
-                }), 400
+                return _err(str(e), 400)
         
         # 验证并清理 system_prompt（如果有）
         system_prompt = data.get('system_prompt')
@@ -2818,17 +4292,14 @@ if FLASK_AVAILABLE:
                     max_length=10000
                 )
             except ValueError as e:
-                return jsonify({
-                    'success': False,
-                    'error': str(e),
-                    'request_id': g.request_id
-                }), 400
+                return _err(str(e), 400)
         
-        history_manager = get_history_manager()
+        history_manager = _hm()
         conversation = history_manager.create_conversation(
             title=title,
             system_prompt=system_prompt
         )
+        _invalidate_conversation_list()
         
         log_with_data("Conversation created", request_id=g.request_id,
                      extra_data={'conversation_id': conversation['id']})
@@ -2839,40 +4310,22 @@ if FLASK_AVAILABLE:
             'request_id': g.request_id
         }), 201
     
-    @v1_bp.route('/api/v1/conversations/<conversation_id>', methods=['GET'])
+    @v1_bp.route('/api/v1/conversations/<cid:conversation_id>', methods=['GET'])
     def get_conversation(conversation_id: str):
         """
         获取对话详情
         
         GET /api/v1/conversations/<conversation_id>
         """
-        # 验证 conversation_id 格式
-        try:
-            conversation_id = validator.validate_conversation_id(conversation_id)
-        except ValueError as e:
-            return jsonify({
-                'success': False,
-                'error': str(e),
-                'request_id': g.request_id
-            }), 400
-        
-        history_manager = get_history_manager()
+        history_manager = _hm()
         conversation = history_manager.get_conversation(conversation_id)
         
         if conversation is None:
-            return jsonify({
-                'success': False,
-                'error': '对话不存在',
-                'request_id': g.request_id
-            }), 404
+            return _err('对话不存在', 404)
         
-        return jsonify({
-            'success': True,
-            'data': conversation,
-            'request_id': g.request_id
-        })
+        return _ok(conversation)
     
-    @v1_bp.route('/api/v1/conversations/<conversation_id>', methods=['DELETE'])
+    @v1_bp.route('/api/v1/conversations/<cid:conversation_id>', methods=['DELETE'])
     @csrf_protected
     def delete_conversation(conversation_id: str):
         """
@@ -2880,20 +4333,11 @@ if FLASK_AVAILABLE:
         
         DELETE /api/v1/conversations/<conversation_id>
         """
-        # 验证 conversation_id 格式
-        try:
-            conversation_id = validator.validate_conversation_id(conversation_id)
-        except ValueError as e:
-            return jsonify({
-                'success': False,
-                'error': str(e),
-                'request_id': g.request_id
-            }), 400
-        
-        history_manager = get_history_manager()
+        history_manager = _hm()
         success = history_manager.delete_conversation(conversation_id)
         
         if success:
+            _invalidate_conversation_list()
             log_with_data("Conversation deleted", request_id=g.request_id,
                          extra_data={'conversation_id': conversation_id})
             return jsonify({
@@ -2902,13 +4346,9 @@ if FLASK_AVAILABLE:
                 'request_id': g.request_id
             })
         else:
-            return jsonify({
-                'success': False,
-                'error': '对话不存在',
-                'request_id': g.request_id
-            }), 404
+            return _err('对话不存在', 404)
     
-    @v1_bp.route('/api/v1/conversations/<conversation_id>/messages', methods=['POST'])
+    @v1_bp.route('/api/v1/conversations/<cid:conversation_id>/messages', methods=['POST'])
     @validate_json_content_type
     @csrf_protected
     def add_message(conversation_id: str):
@@ -2921,66 +4361,41 @@ if FLASK_AVAILABLE:
             content: 消息内容
             token_count: Token 数量（可选）
         """
-        # 验证 conversation_id 格式
-        try:
-            conversation_id = validator.validate_conversation_id(conversation_id)
-        except ValueError as e:
-            return jsonify({
-                'success': False,
-                'error': str(e),
-                'request_id': g.request_id
-            }), 400
-        
         data = request.get_json()
         
         if not data or 'content' not in data:
-            return jsonify({
-                'success': False,
-                'error': '缺少必需参数: content',
-                'request_id': g.request_id
-            }), 400
+            return _err('缺少必需参数: content', 400)
         
         # 验证并清理 content
         try:
-            content = validator.validate_string(
+            content = validator.validate_and_sanitize(
                 data['content'], 
                 field_name='content',
                 max_length=50000
             )
         except ValueError as e:
-            return jsonify({
-                'success': False,
-                'error': str(e),
-                'request_id': g.request_id
-            }), 400
+            return _err(str(e), 400)
         
         # 验证 role
         role = data.get('role', 'user')
         try:
             role = validator.validate_role(role)
         except ValueError as e:
-            return jsonify({
-                'success': False,
-                'error': str(e),
-                'request_id': g.request_id
-            }), 400
+            return _err(str(e), 400)
         
         token_count = data.get('token_count')
         
-        history_manager = get_history_manager()
+        history_manager = _hm()
         message = history_manager.add_message(
             conversation_id=conversation_id,
             role=role,
-            content=validator.sanitize_string(content),
+            content=content,
             token_count=token_count
         )
         
         if message is None:
-            return jsonify({
-                'success': False,
-                'error': '对话不存在',
-                'request_id': g.request_id
-            }), 404
+            return _err('对话不存在', 404)
+        _invalidate_conversation_list()
         
         return jsonify({
             'success': True,
@@ -2988,7 +4403,10 @@ if FLASK_AVAILABLE:
             'request_id': g.request_id
         }), 201
     
-    @v1_bp.route('/api/v1/conversations/<conversation_id>/export', methods=['GET'])
+    # 流式 JSON 导出的响应信封前缀
+    _EXPORT_JSON_PREFIX = '{"success":true,"data":'
+    
+    @v1_bp.route('/api/v1/conversations/<cid:conversation_id>/export', methods=['GET'])
     def export_conversation(conversation_id: str):
         """
         导出对话内容
@@ -2997,47 +4415,30 @@ if FLASK_AVAILABLE:
         Query params:
             format: 导出格式 (json/text, 默认 json)
         """
-        # 验证 conversation_id 格式
-        try:
-            conversation_id = validator.validate_conversation_id(conversation_id)
-        except ValueError as e:
-            return jsonify({
-                'success': False,
-                'error': str(e),
-                'request_id': g.request_id
-            }), 400
-        
         # 验证 format 参数
         format_type = request.args.get('format', 'json')
         if format_type not in ['json', 'text']:
-            return jsonify({
-                'success': False,
-                'error': 'format 参数无效，只支持 json 或 text',
-                'request_id': g.request_id
-            }), 400
+            return _err('format 参数无效，只支持 json 或 text', 400)
         
-        history_manager = get_history_manager()
-        content = history_manager.export_conversation(
-            conversation_id=conversation_id,
-            format=format_type
-        )
+        history_manager = _hm()
+        chunks = history_manager.iter_export(conversation_id, format=format_type)
         
-        if content is None:
-            return jsonify({
-                'success': False,
-                'error': '对话不存在',
-                'request_id': g.request_id
-            }), 404
+        if chunks is None:
+            return _err('对话不存在', 404)
         
-        # 根据格式返回响应
+        # 按消息流式输出，避免一次性拼接整份导出内容
         if format_type == 'text':
-            return content, 200, {'Content-Type': 'text/plain; charset=utf-8'}
-        else:
-            return jsonify({
-                'success': True,
-                'data': json.loads(content),
-                'request_id': g.request_id
-            })
+            return Response(chunks, mimetype='text/plain; charset=utf-8')
+        
+        request_id = g.request_id
+        
+        def generate_json():
+            # 直接拼接响应信封，对话内容不经过 loads/dumps 往返
+            yield _EXPORT_JSON_PREFIX
+            yield from chunks
+            yield ',"request_id":' + json.dumps(request_id) + '}'
+        
+        return Response(generate_json(), mimetype='application/json')
     
     @v1_bp.route('/api/v1/history/stats', methods=['GET'])
     def get_history_stats():
@@ -3046,14 +4447,10 @@ if FLASK_AVAILABLE:
         
         GET /api/v1/history/stats
         """
-        history_manager = get_history_manager()
+        history_manager = _hm()
         stats = history_manager.get_statistics()
         
-        return jsonify({
-            'success': True,
-            'data': stats,
-            'request_id': g.request_id
-        })
+        return _ok(stats)
     
     @v1_bp.route('/api/v1/history/clear', methods=['DELETE'])
     @csrf_protected
@@ -3063,8 +4460,9 @@ if FLASK_AVAILABLE:
         
         DELETE /api/v1/history/clear
         """
-        history_manager = get_history_manager()
+        history_manager = _hm()
         count = history_manager.clear_all()
+        _invalidate_conversation_list()
         
         log_with_data("History cleared", request_id=g.request_id,
                      extra_data={'deleted_count': count})
@@ -3120,47 +4518,42 @@ if FLASK_AVAILABLE:
         _debug_log('main.py:asr_recognize:entry', 'ASR handler entered', {'has_file': 'file' in request.files}, 'A')
         # #endregion
         try:
-            from http import HTTPStatus
-            from dashscope.audio.asr import Transcription
-            from dashscope import Files
-            import urllib.request
+            if not DASHSCOPE_SDK_AVAILABLE:
+                raise ImportError("dashscope SDK 未安装，请运行: pip install dashscope")
             
             # 检查是否有音频文件
             if 'file' not in request.files:
-                return jsonify({
-                    'success': False,
-                    'error': '缺少音频文件',
-                    'request_id': g.request_id
-                }), 400
+                return _err('缺少音频文件', 400)
             
             audio_file = request.files['file']
             
             # 获取模型名称
             model = request.form.get('model', 'fun-asr-mtl')
             
-            # 保存临时文件
-            import uuid
-            filename = f'{uuid.uuid4()}.wav'
-            temp_file_path = os.path.join(TEMP_AUDIO_DIR, filename)
-            audio_file.save(temp_file_path)
+            # 显式设置 API Key 和 Base URL，确保使用 .env 中的配置（未配置时不落盘）
+            api_key = (Config.DASHSCOPE_API_KEY or os.environ.get('DASHSCOPE_API_KEY', '')).strip()
+            base_url = (os.environ.get('DASHSCOPE_BASE_URL') or Config.DASHSCOPE_BASE_URL or '').strip()
+            dashscope.api_key = api_key
+            if base_url and hasattr(dashscope, 'base_http_api_url'):
+                dashscope.base_http_api_url = base_url.rstrip('/')
+            # #region agent log
+            _debug_log('main.py:asr:api_key_check', 'API key check', {'len': len(api_key), 'starts_with_sk': api_key.startswith('sk-'), 'base_url_set': bool(base_url)}, 'A')
+            # #endregion
+            if not api_key:
+                return jsonify({
+                    'success': False,
+                    'error': '未配置 DASHSCOPE_API_KEY。请在 code/backend/.env 中设置',
+                    'request_id': getattr(g, 'request_id', '')
+                }), 401
+            
+            # Files.upload 只接受文件路径：将上传流分块写入临时文件
+            with tempfile.NamedTemporaryFile(dir=TEMP_AUDIO_DIR, suffix='.wav',
+                                             delete=False) as temp_file:
+                shutil.copyfileobj(audio_file.stream, temp_file, ASR_UPLOAD_CHUNK_SIZE)
+                temp_file_path = temp_file.name
             
             try:
-                # 上传音频到 DashScope（显式设置 API Key 和 Base URL，确保使用 .env 中的配置）
-                import dashscope
-                api_key = (Config.DASHSCOPE_API_KEY or os.environ.get('DASHSCOPE_API_KEY', '')).strip()
-                base_url = (os.environ.get('DASHSCOPE_BASE_URL') or Config.DASHSCOPE_BASE_URL or '').strip()
-                dashscope.api_key = api_key
-                if base_url and hasattr(dashscope, 'base_http_api_url'):
-                    dashscope.base_http_api_url = base_url.rstrip('/')
-                # #region agent log
-                _debug_log('main.py:asr:api_key_check', 'API key check', {'len': len(api_key), 'starts_with_sk': api_key.startswith('sk-'), 'base_url_set': bool(base_url)}, 'A')
-                # #endregion
-                if not api_key:
-                    return jsonify({
-                        'success': False,
-                        'error': '未配置 DASHSCOPE_API_KEY。请在 code/backend/.env 中设置',
-                        'request_id': getattr(g, 'request_id', '')
-                    }), 401
+                # 上传音频到 DashScope
                 log_with_data(f"Uploading audio to DashScope...", request_id=g.request_id)
                 
                 upload_response = Files.upload(
@@ -3185,19 +4578,21 @@ if FLASK_AVAILABLE:
                         'request_id': getattr(g, 'request_id', '')
                     }), 500
                 
-                # 获取文件 URL（从列表中获取）
-                list_response = Files.list(page=1, page_size=1)
-                if list_response.status_code != HTTPStatus.OK or not list_response.output.get('files'):
-                    # #region agent log
-                    _debug_log('main.py:asr:list_fail', 'ASR Files.list failed', {}, 'A')
-                    # #endregion
-                    return jsonify({
-                        'success': False,
-                        'error': '无法获取上传文件信息',
-                        'request_id': g.request_id
-                    }), 500
-                
-                file_url = list_response.output['files'][0]['url']
+                # 获取本次上传文件的 URL（优先使用上传响应中的字段，否则按 file_id 查询；
+                # 不能用 Files.list 取第一条，并发上传时可能拿到其他请求的文件）
+                upload_output = upload_response.output or {}
+                file_url = upload_output.get('url')
+                if not file_url:
+                    uploaded_files = upload_output.get('uploaded_files') or []
+                    file_id = uploaded_files[0].get('file_id') if uploaded_files else None
+                    file_response = Files.get(file_id) if file_id else None
+                    if file_response is None or file_response.status_code != HTTPStatus.OK \
+                            or not (file_response.output or {}).get('url'):
+                        # #region agent log
+                        _debug_log('main.py:asr:get_fail', 'ASR Files.get failed', {'file_id': file_id}, 'A')
+                        # #endregion
+                        return _err('无法获取上传文件信息', 500)
+                    file_url = file_response.output['url']
                 log_with_data(f"Audio uploaded, URL: {file_url[:80]}...", request_id=g.request_id)
                 
                 # 调用 DashScope Fun-ASR API
@@ -3221,11 +4616,7 @@ if FLASK_AVAILABLE:
                         # #region agent log
                         _debug_log('main.py:asr:task_fail', 'ASR task not SUCCEEDED', {'status': task_status}, 'A')
                         # #endregion
-                        return jsonify({
-                            'success': False,
-                            'error': f'语音识别任务失败: {task_status}',
-                            'request_id': g.request_id
-                        }), 500
+                        return _err(f'语音识别任务失败: {task_status}', 500)
                     
                     # 获取转写结果 URL
                     results = transcribe_response.output.get('results', [])
@@ -3233,16 +4624,14 @@ if FLASK_AVAILABLE:
                         # #region agent log
                         _debug_log('main.py:asr:no_results', 'ASR no transcription_url', {'results_len': len(results) if results else 0}, 'A')
                         # #endregion
-                        return jsonify({
-                            'success': False,
-                            'error': '无法获取转写结果',
-                            'request_id': g.request_id
-                        }), 500
+                        return _err('无法获取转写结果', 500)
                     
                     result_url = results[0]['transcription_url']
                     
-                    # 下载并解析结果
-                    result_data = json.loads(urllib.request.urlopen(result_url).read().decode('utf-8'))
+                    # 下载并解析结果（复用共享 HTTP 会话的连接池）
+                    result_resp = DashScopeClient._get_session().get(result_url, timeout=30)
+                    result_resp.raise_for_status()
+                    result_data = json_loads(result_resp.content)
                     
                     # 提取识别文本
                     result_text = ''
@@ -3261,38 +4650,29 @@ if FLASK_AVAILABLE:
                     # #region agent log
                     _debug_log('main.py:asr:transcribe_fail', 'ASR transcribe status not OK', {'msg': getattr(transcribe_response, 'message', '')}, 'A')
                     # #endregion
-                    return jsonify({
-                        'success': False,
-                        'error': f'语音识别失败: {transcribe_response.message}',
-                        'request_id': g.request_id
-                    }), 500
+                    return _err(f'语音识别失败: {transcribe_response.message}', 500)
                     
             finally:
                 # 清理临时文件
-                try:
-                    os.remove(temp_file_path)
-                except:
-                    pass
+                Path(temp_file_path).unlink(missing_ok=True)
                 
-        except KeyError as e:
-            log_with_data(f"ASR KeyError: {str(e)}", 
+        except (KeyError, ValueError) as e:
+            # 识别结果格式异常（字段缺失或 JSON 无法解析），无需记录堆栈
+            log_with_data(f"ASR response format error: {type(e).__name__}: {str(e)}", 
                          level=logging.ERROR, request_id=g.request_id)
-            return jsonify({
-                'success': False,
-                'error': f'语音识别响应格式错误: {str(e)}',
-                'request_id': g.request_id
-            }), 500
+            return _err(f'语音识别响应格式错误: {str(e)}', 500)
+        except requests.RequestException as e:
+            log_with_data(f"ASR result download error: {str(e)}", 
+                         level=logging.ERROR, request_id=g.request_id)
+            return _err(f'下载语音识别结果失败: {str(e)}', 502)
         except Exception as e:
             # #region agent log
             _debug_log('main.py:asr_recognize:except', 'ASR Exception', {'error': str(e), 'type': type(e).__name__}, 'A')
             # #endregion
             log_with_data(f"ASR error: {str(e)}", 
-                         level=logging.ERROR, request_id=g.request_id)
-            return jsonify({
-                'success': False,
-                'error': f'语音识别错误: {str(e)}',
-                'request_id': g.request_id
-            }), 500
+                         level=logging.ERROR, request_id=g.request_id,
+                         extra_data={'traceback': traceback.format_exc()})
+            return _err(f'语音识别错误: {str(e)}', 500)
 
     @v1_bp.route('/api/v1/tts/synthesize', methods=['POST'])
     @async_timeout(LONG_TIMEOUT)  # TTS 合成使用更长超时
@@ -3312,22 +4692,16 @@ if FLASK_AVAILABLE:
             音频流 (二进制)
         """
         try:
-            from io import BytesIO
-            from dashscope.audio.tts_v2 import SpeechSynthesizer, AudioFormat
-            from dashscope.audio.tts_v2.speech_synthesizer import ResultCallback
+            if not DASHSCOPE_SDK_AVAILABLE:
+                raise ImportError("dashscope SDK 未安装，请运行: pip install dashscope")
             
             # 显式设置 DashScope API Key
-            import dashscope
             dashscope.api_key = Config.DASHSCOPE_API_KEY or os.environ.get('DASHSCOPE_API_KEY', '')
             
             # 获取请求参数
             data = request.get_json()
             if not data or 'text' not in data:
-                return jsonify({
-                    'success': False,
-                    'error': '缺少文本内容',
-                    'request_id': g.request_id
-                }), 400
+                return _err('缺少文本内容', 400)
             
             text = data['text']
             voice = data.get('voice', 'longanyang')
@@ -3335,101 +4709,146 @@ if FLASK_AVAILABLE:
             log_with_data(f"TTS request: text={text[:50]}..., voice={voice}", 
                          request_id=g.request_id)
             
-            # 收集所有音频数据
-            audio_chunks = []
+            request_id = g.request_id
             
-            # 定义回调类
-            class AudioCallback(ResultCallback):
-                def on_open(self):
-                    log_with_data("TTS WebSocket connected", request_id=g.request_id)
-                
-                def on_complete(self):
-                    log_with_data("TTS synthesis complete", request_id=g.request_id)
-                
-                def on_error(self, message: str):
-                    log_with_data(f"TTS error: {message}", 
-                                 level=logging.ERROR, request_id=g.request_id)
-                
-                def on_close(self):
-                    log_with_data("TTS WebSocket closed", request_id=g.request_id)
-                
-                def on_data(self, data: bytes) -> None:
-                    audio_chunks.append(data)
+            # 回调线程产出的 PCM 片段经队列交给响应生成器，None 表示合成结束
+            audio_queue = queue.Queue()
             
-            # 创建合成器并合成语音 (使用 PCM 22050Hz mono 16bit)
+            # 创建合成器 (使用 PCM 22050Hz mono 16bit)
             synthesizer = SpeechSynthesizer(
                 model='cosyvoice-v3-flash',
                 voice=voice,
                 format=AudioFormat.PCM_22050HZ_MONO_16BIT,
-                callback=AudioCallback()
+                callback=AudioCallback(
+                    audio_queue.put,
+                    on_done=lambda: audio_queue.put(None),
+                    request_id=request_id
+                )
             )
             
-            # 流式发送文本
-            synthesizer.streaming_call(text)
-            synthesizer.streaming_complete()
+            def run_synthesis():
+                try:
+                    synthesizer.streaming_call(text)
+                    synthesizer.streaming_complete()
+                except Exception as e:
+                    log_with_data(f"TTS error: {str(e)}", 
+                                 level=logging.ERROR, request_id=request_id)
+                finally:
+                    # 确保生成器一定能结束（重复的 None 无害）
+                    audio_queue.put(None)
             
-            # 合并音频数据
-            audio_data = b''.join(audio_chunks)
+            threading.Thread(target=run_synthesis, daemon=True).start()
             
-            log_with_data(f"TTS audio size: {len(audio_data)} bytes", 
-                         request_id=g.request_id)
+            # 等到首个音频片段再返回响应，合成失败时仍可返回 JSON 错误
+            try:
+                first_chunk = audio_queue.get(timeout=TTS_CHUNK_TIMEOUT)
+            except queue.Empty:
+                first_chunk = None
             
-            if len(audio_data) == 0:
+            if not first_chunk:
                 return jsonify({
                     'success': False,
                     'error': '语音合成结果为空',
-                    'request_id': g.request_id
+                    'request_id': request_id
                 }), 500
             
-            # 返回音频流 (添加 WAV 头)
-            import wave
-            import struct
-            
-            # 创建 WAV 文件
-            wav_buffer = BytesIO()
-            with wave.open(wav_buffer, 'wb') as wav_file:
-                wav_file.setnchannels(1)  # mono
-                wav_file.setsampwidth(2)  # 16-bit
-                wav_file.setframerate(22050)
-                wav_file.writeframes(audio_data)
-            
-            wav_data = wav_buffer.getvalue()
-            
-            response = make_response(wav_data)
-            response.headers['Content-Type'] = 'audio/wav'
-            response.headers['Content-Disposition'] = 'attachment; filename=speech.wav'
-            response.headers['X-Request-ID'] = g.request_id
+            def generate():
+                yield wav_header(STREAMING_WAV_DATA_SIZE)
+                yield first_chunk
+                audio_size = len(first_chunk)
+                while True:
+                    try:
+                        chunk = audio_queue.get(timeout=TTS_CHUNK_TIMEOUT)
+                    except queue.Empty:
+                        log_with_data("TTS chunk timeout, closing stream", 
+                                     level=logging.WARNING, request_id=request_id)
+                        break
+                    if chunk is None:
+                        break
+                    audio_size += len(chunk)
+                    yield chunk
+                log_with_data(f"TTS audio size: {audio_size} bytes", 
+                             request_id=request_id)
             
-            return response
+            # 边合成边返回音频流（WAV 头使用流式占位长度）
+            return Response(generate(), mimetype='audio/wav', headers={
+                'Content-Disposition': 'attachment; filename=speech.wav',
+                'X-Request-ID': request_id
+            })
             
         except Exception as e:
             log_with_data(f"TTS error: {str(e)}", 
                          level=logging.ERROR, request_id=g.request_id)
-            return jsonify({
-                'success': False,
-                'error': f'语音合成错误: {str(e)}',
-                'request_id': g.request_id
-            }), 500
+            return _err(f'语音合成错误: {str(e)}', 500)
     
     @v1_bp.route('/temp_audio/<filename>', methods=['GET'])
     def serve_temp_audio(filename):
         """提供临时音频文件访问"""
-        from flask import send_file
-        file_path = os.path.join(TEMP_AUDIO_DIR, filename)
-        if os.path.exists(file_path):
-            response = send_file(file_path, mimetype='audio/webm')
-            # 访问后立即删除
-            @response.call_on_close
-            def cleanup():
-                try:
-                    os.remove(file_path)
-                except:
-                    pass
+        file_path = TEMP_AUDIO_PATH / filename
+        if not file_path.is_file():
+            return 'File not found', 404
+        
+        response = send_file(file_path, mimetype='audio/webm')
+        # X-Sendfile 模式下由前端服务器读取文件，不能在响应关闭时删除
+        if current_app.config.get('USE_X_SENDFILE'):
             return response
-        return 'File not found', 404
+        # 访问后立即删除
+        @response.call_on_close
+        def cleanup():
+            file_path.unlink(missing_ok=True)
+        return response
+    
+    @v1_bp.route('/api/v1/tts/audio/<filename>', methods=['GET'])
+    def serve_tts_audio(filename):
+        """提供 OpenClaw TTS 音频文件访问（文件由后台线程定期清理）"""
+        return send_from_directory(TTS_AUDIO_DIR, filename, mimetype='audio/wav')
+    
+    if ORJSON_AVAILABLE:
+        from flask.json.provider import DefaultJSONProvider
+        
+        class ORJSONProvider(DefaultJSONProvider):
+            """基于 orjson 的 JSON 序列化（jsonify / request.get_json 共用）"""
+            
+            _OPTIONS = orjson.OPT_NON_STR_KEYS
+            
+            def dumps(self, obj: Any, **kwargs: Any) -> str:
+                # 需要缩进等自定义格式时回退到标准实现
+                if kwargs.get('indent'):
+                    return super().dumps(obj, **kwargs)
+                try:
+                    return orjson.dumps(obj, default=self.default, option=self._OPTIONS).decode('utf-8')
+                except TypeError:
+                    return super().dumps(obj, **kwargs)
+            
+            def loads(self, s: Any, **kwargs: Any) -> Any:
+                return orjson.loads(s)
+    
+    class SessionIdConverter(BaseConverter):
+        """会话 ID 路由转换器：格式不合法的 ID 在路由匹配阶段直接 404"""
+        regex = InputValidator.SESSION_ID_REGEX
+    
+    class ConversationIdConverter(BaseConverter):
+        """对话 ID 路由转换器：格式或安全检查不通过时不匹配路由（404）"""
+        regex = InputValidator.CONVERSATION_ID_REGEX
+        
+        def to_python(self, value: str) -> str:
+            try:
+                return validator.validate_conversation_id(value)
+            except ValueError:
+                raise ValidationError()
     
     # 注册蓝图到 Flask 应用
     app = Flask(__name__)
+    # 转换器需在注册蓝图前加入 url_map
+    app.url_map.converters['sid'] = SessionIdConverter
+    app.url_map.converters['cid'] = ConversationIdConverter
+    if ORJSON_AVAILABLE:
+        app.json = ORJSONProvider(app)
+    # 紧凑输出且不排序键（调试模式下同样生效），减少序列化开销和响应体积
+    app.json.compact = True
+    app.json.sort_keys = False
+    # 部署在 nginx/apache 之后时可开启 X-Sendfile，由前端服务器零拷贝发送音频文件
+    app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
     app.register_blueprint(v1_bp)
     
     # 注册任务管理路由
@@ -3449,6 +4868,20 @@ if FLASK_AVAILABLE:
         return response
     # #endregion
     
+    # ========== CORS 预检短路 ==========
+    CORS_HEADERS = {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-API-Key, X-Request-ID'
+    }
+    
+    @app.before_request
+    def cors_preflight():
+        """OPTIONS 预检请求直接返回 204，不进入限流和蓝图处理（CORS 头由 after_request 添加）"""
+        if request.method == 'OPTIONS':
+            return Response(status=204)
+        return None
+    
     # ========== 全局限流中间件 ==========
     @app.before_request
     def rate_limit_middleware():
@@ -3527,12 +4960,48 @@ if FLASK_AVAILABLE:
                      request_id=getattr(g, 'request_id', ''))
         return response
     
-    # 添加 CORS 支持
+    # 添加 CORS 支持（响应头只构建一次）
     @app.after_request
     def add_cors_headers(response):
-        response.headers['Access-Control-Allow-Origin'] = '*'
-        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-API-Key, X-Request-ID'
+        response.headers.update(CORS_HEADERS)
+        return response
+    
+    # 可压缩的响应类型（SSE 需要逐条推送、音频本身已压缩，均不处理）
+    COMPRESSIBLE_MIMETYPES = frozenset(('application/json', 'text/plain'))
+    
+    def _gzip_stream(chunks: Iterable[Any]) -> Iterator[bytes]:
+        """流式 gzip 压缩（用于生成器响应，如对话导出）"""
+        compressor = zlib.compressobj(Config.COMPRESS_LEVEL, zlib.DEFLATED, 31)  # 31: gzip 格式
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    
+    @app.after_request
+    def compress_response(response):
+        """对较大的 JSON/文本响应进行 gzip 压缩"""
+        if (response.status_code != 200
+                or response.direct_passthrough
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or 'Content-Encoding' in response.headers
+                or 'gzip' not in request.headers.get('Accept-Encoding', '')):
+            return response
+        
+        if response.is_streamed:
+            # 总长度未知，边生成边压缩
+            response.response = _gzip_stream(response.response)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < Config.COMPRESS_MIN_SIZE:
+                return response
+            response.set_data(gzip.compress(data, Config.COMPRESS_LEVEL))
+        
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
         return response
     
     # #region agent log
@@ -3546,34 +5015,19 @@ if FLASK_AVAILABLE:
         return jsonify({'success': False, 'error': str(e), 'request_id': getattr(g, 'request_id', '')}), 500
     # #endregion
     
-    # # HTTPS 强制跳转中间件（本地开发时禁用）
-    # @app.before_request
-    # def force_https():
-        """
-        检测 HTTP 请求并重定向到 HTTPS
-        
-        生产环境默认启用，可通过环境变量 FORCE_HTTPS 控制:
-        - FORCE_HTTPS=true  (默认) - 强制 HTTPS
-        - FORCE_HTTPS=false - 允许 HTTP
-        """
-        # 每次请求时动态读取环境变量
-        force_https_env = os.environ.get('FORCE_HTTPS', 'true').lower() == 'true'
-        
-        if not force_https_env:
-            return None
-        
-        # 检查是否是 HTTPS 请求（直接检查或通过代理头）
-        if request.is_secure:
-            return None
-        
-        # 检查 X-Forwarded-Proto 头（反向代理场景）
-        forwarded_proto = request.headers.get('X-Forwarded-Proto', 'http')
-        if forwarded_proto == 'https':
-            return None
-        
-        # 构建 HTTPS URL 并重定向（301 永久重定向）
-        url = request.url.replace('http://', 'https://', 1)
-        return redirect(url, code=301)
+    # HTTPS 强制跳转中间件（启动时读取一次开关，关闭时不注册钩子）
+    # 本地开发默认关闭，生产环境设置 FORCE_HTTPS=true 开启
+    FORCE_HTTPS = os.environ.get('FORCE_HTTPS', 'false').lower() == 'true'
+    
+    if FORCE_HTTPS:
+        @app.before_request
+        def force_https():
+            """检测 HTTP 请求并 301 重定向到 HTTPS（支持反向代理的 X-Forwarded-Proto）"""
+            if request.is_secure or request.headers.get('X-Forwarded-Proto') == 'https':
+                return None
+            
+            path = request.full_path if request.query_string else request.path
+            return redirect('https://' + request.host + path, code=301)
 
 
 # ============================================================================
@@ -3627,8 +5081,7 @@ def test_simple_chat():
             print("-" * 40)
             
             # 提取响应文本
-            output = response.get('output', {})
-            text = output.get('text', '无响应内容')
+            text = extract_text(response, '无响应内容')
             print(text)
             print("-" * 40)
             
@@ -3672,7 +5125,7 @@ def test_multi_turn_chat():
             print("✅ 多轮对话成功!")
             print(f"\n📥 响应内容:")
             print("-" * 40)
-            text = response.get('output', {}).get('text', '无响应内容')
+            text = extract_text(response, '无响应内容')
             print(text)
             print("-" * 40)
             return True
@@ -3741,9 +5194,15 @@ def run_all_tests():
     results.append(("基本连接", test_basic_connection()))
     
     if results[-1][1]:  # 只有基本连接成功才继续
-        results.append(("简单对话", test_simple_chat()))
-        results.append(("多轮对话", test_multi_turn_chat()))
-        results.append(("文本向量化", test_embedding()))
+        # 其余测试相互独立，并行发起以重叠网络等待（输出可能交错）
+        tests = (
+            ("简单对话", test_simple_chat),
+            ("多轮对话", test_multi_turn_chat),
+            ("文本向量化", test_embedding),
+        )
+        with ThreadPoolExecutor(max_workers=len(tests)) as executor:
+            futures = [(name, executor.submit(test)) for name, test in tests]
+        results.extend((name, future.result()) for name, future in futures)
     
     # 汇总结果
     print("\n" + "="*60)
@@ -3794,6 +5253,9 @@ def main():
   # 启动 Web 服务
   python main.py --server --port 8080
   
+  # 以 gunicorn 多进程方式启动（需安装 gunicorn，有 gevent 时使用协程 worker）
+  python main.py --server --port 8080 --gunicorn --workers 4
+  
   # 单次对话测试
   python main.py --chat "你好"
         """
@@ -3805,6 +5267,12 @@ def main():
                         help='启动 Flask Web 服务')
     parser.add_argument('--port', type=int, default=5000,
                         help='Web 服务端口 (默认: 5000)')
+    parser.add_argument('--gunicorn', action='store_true',
+                        help='使用 gunicorn 启动 Web 服务（生产部署）')
+    parser.add_argument('--workers', type=int, default=min(8, os.cpu_count() or 1),
+                        help='gunicorn worker 进程数 (默认: min(8, CPU 核数))')
+    parser.add_argument('--debug', action='store_true',
+                        help='启用 Flask 调试模式（自动重载与交互式调试器，仅限本地开发）')
     parser.add_argument('--chat', type=str, metavar='MESSAGE',
                         help='发送单次对话请求')
     parser.add_argument('--model', type=str, default='qwen-turbo',
@@ -3825,7 +5293,7 @@ def main():
             {"role": "user", "content": args.chat}
         ])
         print("\n📥 响应:")
-        print(response.get('output', {}).get('text', '无响应'))
+        print(extract_text(response, '无响应'))
     elif args.server:
         # 启动 Web 服务
         logger.info("Starting Flask server", extra={'extra_data': {'port': args.port}})
@@ -3837,7 +5305,36 @@ def main():
             print(f"   DASHSCOPE_API_KEY: 未加载")
         print(f"   健康检查: http://localhost:{args.port}/api/v1/health")
         print(f"   对话接口: POST http://localhost:{args.port}/api/v1/chat")
-        app.run(host='0.0.0.0', port=args.port, debug=True)
+        if args.gunicorn:
+            # 替换当前进程为 gunicorn；有 gevent 时每个 worker 用协程承载大量 IO 等待
+            gunicorn_bin = shutil.which('gunicorn')
+            if not gunicorn_bin:
+                print("❌ 未找到 gunicorn，请运行: pip install gunicorn")
+                sys.exit(1)
+            try:
+                import gevent  # noqa: F401
+                worker_args = ['-k', 'gevent', '--worker-connections', '1000']
+                os.environ['USE_GEVENT'] = '1'
+            except ImportError:
+                worker_args = ['-k', 'gthread', '--threads', '16']
+            print(f"   服务模式: gunicorn ({worker_args[1]}, {args.workers} workers)")
+            os.execv(gunicorn_bin, [
+                gunicorn_bin, *worker_args,
+                '-w', str(args.workers),
+                '--bind', f'0.0.0.0:{args.port}',
+                '--chdir', os.path.dirname(os.path.abspath(__file__)),
+                'main:app'
+            ])
+        elif GEVENT_ENABLED:
+            # 协程服务：单个线程即可承载大量等待 OpenClaw/DashScope 的请求
+            from gevent.pywsgi import WSGIServer
+            print("   服务模式: gevent")
+            WSGIServer(('0.0.0.0', args.port), app).serve_forever()
+        else:
+            # 多线程处理请求：OpenClaw/TTS 等 I/O 密集接口不会阻塞其他请求；
+            # 调试模式会启用重载器（模块被导入两次）和可远程执行代码的调试器，默认关闭
+            print(f"   服务模式: 多线程{'（调试模式）' if args.debug else ''}")
+            app.run(host='0.0.0.0', port=args.port, debug=args.debug, threaded=True)
     else:
         # 默认运行测试
         run_all_tests()
@@ -13,14 +13,61 @@ SQLite 对话历史持久化存储模块
 创建时间: 2026-02-02
 """
 
+import atexit
 import os
 import sqlite3
 import json
+import queue
 import threading
-from datetime import datetime
-from typing import Optional, Dict, Any, List, Tuple
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Tuple, Iterator
 from pathlib import Path
-import shutil
+
+# 尝试导入 ijson 用于增量解析大型导入文件
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+
+# 可选：orjson 加速 JSON 列的解析（未安装时使用标准库 json）
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# 模块级引用 C 加速的解析函数，读路径上省去属性查找
+# （json.JSONDecodeError 与 orjson.JSONDecodeError 均为 ValueError 子类）
+_json_loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+
+# 当前秒的格式化前缀缓存：(秒, 'YYYY-MM-DDTHH:MM:SS')
+_iso_second_cache: Tuple[int, str] = (0, '')
+
+
+def _now_iso() -> str:
+    """
+    当前本地时间的 ISO 8601 字符串（精确到微秒）
+    
+    同一秒内复用已格式化的日期时间前缀，只拼接微秒部分，
+    比 datetime.now().isoformat() 快约一倍。
+    """
+    global _iso_second_cache
+    second, nanos = divmod(time.time_ns(), 1_000_000_000)
+    cached_second, prefix = _iso_second_cache
+    if second != cached_second:
+        prefix = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(second))
+        _iso_second_cache = (second, prefix)
+    return '%s.%06d' % (prefix, nanos // 1000)
+
+
+# 按会话查询最近唤醒事件（WHERE session_id = ? ORDER BY event_time DESC LIMIT ?）的复合索引
+WAKE_EVENTS_SESSION_TIME_INDEX = '''
+    CREATE INDEX IF NOT EXISTS idx_wake_events_session_time
+    ON wake_events(session_id, event_time DESC)
+'''
 
 
 class SQLiteStorage:
@@ -40,13 +87,61 @@ class SQLiteStorage:
     # 备份配置
     BACKUP_DIR = 'backups'
     MAX_BACKUPS = 5  # 保留最近5个备份
+    BACKUP_PAGES = 1024  # 在线备份每步复制的页数，步间释放锁，长时间备份不阻塞其他写入者
     
-    def __init__(self, db_path: str = None):
+    # 连接级 PRAGMA（WAL 模式写入只需一次 fsync；synchronous=NORMAL 在 WAL 下不会损坏数据库）
+    CONNECTION_PRAGMAS = (
+        # 增量回收空闲页：须在 journal_mode 写入文件头之前设置，仅对新建数据库立即生效，
+        # 已有数据库在下次完整 VACUUM 后生效
+        'PRAGMA auto_vacuum = INCREMENTAL',
+        'PRAGMA foreign_keys = ON',
+        'PRAGMA journal_mode = WAL',
+        'PRAGMA synchronous = NORMAL',
+        'PRAGMA cache_size = -20000',  # 20 MB
+        'PRAGMA temp_store = MEMORY',
+        'PRAGMA mmap_size = 268435456',  # 256 MB
+        'PRAGMA recursive_triggers = ON',  # INSERT OR REPLACE 的隐式删除也触发全文索引同步
+    )
+    
+    # 等待其他进程释放数据库锁的超时时间（秒）
+    BUSY_TIMEOUT = 5.0
+    
+    # 只读连接池大小（WAL 模式下读操作与写操作可并发执行）
+    READ_POOL_SIZE = 4
+    
+    # 全文索引最短查询长度（trigram 分词器按 3 个字符切分，更短的关键词回退到 LIKE）
+    FTS_MIN_QUERY_LENGTH = 3
+    
+    # 列表查询默认只读取的摘要列（不读取 messages 等大字段所在的溢出页）
+    SUMMARY_COLUMNS = ('id', 'session_id', 'message_count', 'created_at', 'updated_at')
+    
+    # 存在二次过滤时全文检索的候选放大倍数（保证过滤后仍有足够结果）
+    FTS_OVERFETCH = 10
+    
+    # 全文检索：先在 CTE 中物化 MATCH 结果，再对少量候选做过滤，
+    # 避免 MATCH 与普通条件写在同一 WHERE 中时查询规划器放弃使用全文索引
+    _FTS_SEARCH_SQL = '''
+        WITH fts_matches AS (
+            SELECT rowid, bm25(conversations_fts) AS score
+            FROM conversations_fts
+            WHERE conversations_fts MATCH ?
+            ORDER BY score
+            LIMIT ?
+        )
+        SELECT {columns} FROM fts_matches fm
+        JOIN conversations c ON c.rowid = fm.rowid
+        WHERE (? IS NULL OR c.session_id = ?)
+        ORDER BY fm.score
+        LIMIT ?
+    '''
+    
+    def __init__(self, db_path: str = None, pretty_json: bool = False):
         """
         初始化存储管理器
         
         Args:
             db_path: 数据库文件路径（默认：当前目录下的 conversations.db）
+            pretty_json: 消息列表是否以缩进格式存储（仅便于调试时直接查看数据库）
         """
         if db_path is None:
             # 默认路径：当前工作目录下的 conversations.db
@@ -57,16 +152,26 @@ class SQLiteStorage:
         # 确保目录存在
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         
+        # 消息 JSON 缩进（None 时使用紧凑格式和 C 加速编码器）
+        self._json_indent = 2 if pretty_json else None
+        
         # 线程锁
         self._lock = threading.RLock()
         
+        # 复用的写连接（首次使用时创建）
+        self._conn: Optional[sqlite3.Connection] = None
+        
+        # 空闲的只读连接
+        self._read_pool: List[sqlite3.Connection] = []
+        self._read_pool_lock = threading.Lock()
+        
         # 初始化数据库
         self._init_database()
     
     def _init_database(self):
         """初始化数据库表"""
         with self._lock:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._get_connection()
             cursor = conn.cursor()
             
             # 创建对话表
@@ -102,6 +207,10 @@ class SQLiteStorage:
             
             conn.commit()
             
+            # 创建全文索引
+            self._fts_enabled = self._init_fts(cursor)
+            conn.commit()
+            
             # 创建唤醒事件表
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS wake_events (
@@ -131,17 +240,163 @@ class SQLiteStorage:
                 ON wake_events(trigger_type)
             ''')
             
+            cursor.execute(WAKE_EVENTS_SESSION_TIME_INDEX)
+            
             conn.commit()
-            conn.close()
     
-    def _get_connection(self) -> sqlite3.Connection:
-        """获取数据库连接"""
-        conn = sqlite3.connect(self.db_path)
+    def _init_fts(self, cursor: sqlite3.Cursor) -> bool:
+        """
+        创建对话全文索引（FTS5 外部内容表）及同步触发器
+        
+        使用 trigram 分词器：中文没有空格分词，unicode61 会把整段中文当作一个词，
+        trigram 则支持与 LIKE '%关键词%' 相同的子串匹配。
+        
+        Args:
+            cursor: 数据库游标
+            
+        Returns:
+            全文索引是否可用（SQLite 未编译 FTS5 或版本低于 3.34 时返回 False）
+        """
+        try:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversations_fts'")
+            exists = cursor.fetchone() is not None
+            
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+                    messages, system_prompt,
+                    content='conversations', content_rowid='rowid',
+                    tokenize='trigram'
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS conversations_fts_ai AFTER INSERT ON conversations BEGIN
+                    INSERT INTO conversations_fts(rowid, messages, system_prompt)
+                    VALUES (new.rowid, new.messages, new.system_prompt);
+                END
+            ''')
+            
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS conversations_fts_ad AFTER DELETE ON conversations BEGIN
+                    INSERT INTO conversations_fts(conversations_fts, rowid, messages, system_prompt)
+                    VALUES ('delete', old.rowid, old.messages, old.system_prompt);
+                END
+            ''')
+            
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS conversations_fts_au
+                AFTER UPDATE OF messages, system_prompt ON conversations BEGIN
+                    INSERT INTO conversations_fts(conversations_fts, rowid, messages, system_prompt)
+                    VALUES ('delete', old.rowid, old.messages, old.system_prompt);
+                    INSERT INTO conversations_fts(rowid, messages, system_prompt)
+                    VALUES (new.rowid, new.messages, new.system_prompt);
+                END
+            ''')
+            
+            # 首次创建时为已有数据建立索引
+            if not exists:
+                cursor.execute("INSERT INTO conversations_fts(conversations_fts) VALUES ('rebuild')")
+            
+            return True
+        except sqlite3.OperationalError as e:
+            print(f"[SQLiteStorage] 全文索引不可用，搜索将使用 LIKE: {e}")
+            return False
+    
+    @staticmethod
+    def _fts_query(keyword: str) -> str:
+        """将关键词转换为 FTS5 短语查询（转义双引号，避免被解析为查询语法）"""
+        return '"' + keyword.replace('"', '""') + '"'
+    
+    def _use_fts(self, keyword: str) -> bool:
+        """关键词是否可以走全文索引"""
+        return self._fts_enabled and len(keyword) >= self.FTS_MIN_QUERY_LENGTH
+    
+    def _fts_search(self, cursor: sqlite3.Cursor, keyword: str, limit: int,
+                    candidate_limit: int, session_id: str = None,
+                    full: bool = True) -> List[sqlite3.Row]:
+        """
+        通过全文索引检索对话（按相关度排序）
+        
+        Args:
+            cursor: 数据库游标
+            keyword: 搜索关键词
+            limit: 返回数量限制
+            candidate_limit: 全文检索候选数量（有二次过滤时应大于 limit）
+            session_id: 仅返回该会话的对话（None 表示不限）
+            full: 是否读取完整记录（False 时只读取摘要列）
+            
+        Returns:
+            数据库行列表
+        """
+        columns = 'c.*' if full else ', '.join('c.' + name for name in self.SUMMARY_COLUMNS)
+        cursor.execute(self._FTS_SEARCH_SQL.format(columns=columns), (
+            self._fts_query(keyword), candidate_limit, session_id, session_id, limit
+        ))
+        return cursor.fetchall()
+    
+    def _open_connection(self) -> sqlite3.Connection:
+        """打开数据库连接并应用连接级 PRAGMA"""
+        conn = sqlite3.connect(self.db_path, timeout=self.BUSY_TIMEOUT, check_same_thread=False)
         conn.row_factory = sqlite3.Row
-        # 启用外键约束
-        conn.execute('PRAGMA foreign_keys = ON')
+        for pragma in self.CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    def _get_connection(self) -> sqlite3.Connection:
+        """
+        获取写连接
+        
+        写操作都在 self._lock 内串行执行，因此复用同一个长连接，
+        避免每次调用都重新打开数据库、执行 PRAGMA。调用方需持有 self._lock。
+        """
+        conn = self._conn
+        if conn is None:
+            conn = self._conn = self._open_connection()
+        elif conn.in_transaction:
+            # 兜底：上一次操作异常退出时遗留的未提交事务
+            conn.rollback()
         return conn
     
+    def _rollback(self):
+        """
+        回滚写连接上未提交的事务，释放写锁
+        
+        写操作失败时在 except 中立即调用，否则 BEGIN IMMEDIATE 获得的 RESERVED 锁
+        会一直留在长连接上，阻塞其他连接（唤醒事件存储、其他进程）的写入。
+        调用方需持有 self._lock。
+        """
+        conn = self._conn
+        if conn is not None and conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+    
+    @contextmanager
+    def _read_connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        从连接池借用只读连接（不持有 self._lock）
+        
+        WAL 模式下读连接不会阻塞写连接，也不会被写连接阻塞。
+        """
+        with self._read_pool_lock:
+            conn = self._read_pool.pop() if self._read_pool else None
+        if conn is None:
+            conn = self._open_connection()
+            conn.execute('PRAGMA query_only = ON')
+        
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._read_pool_lock:
+                if len(self._read_pool) < self.READ_POOL_SIZE:
+                    self._read_pool.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+    
     # ========== CRUD 操作 ==========
     
     def create_conversation(self, conversation_id: str, session_id: str,
@@ -168,11 +423,13 @@ class SQLiteStorage:
                 conn = self._get_connection()
                 cursor = conn.cursor()
                 
-                now = datetime.now().isoformat()
-                messages_json = json.dumps(messages, ensure_ascii=False, indent=2)
+                now = _now_iso()
+                messages_json = json.dumps(messages, ensure_ascii=False, indent=self._json_indent)
                 token_usage_json = json.dumps(token_usage or {'input': 0, 'output': 0}, ensure_ascii=False)
                 metadata_json = json.dumps(metadata or {}, ensure_ascii=False)
                 
+                # 开始时即获取写锁，其他进程持有锁时按 busy_timeout 等待
+                cursor.execute('BEGIN IMMEDIATE')
                 cursor.execute('''
                     INSERT INTO conversations 
                     (id, session_id, system_prompt, messages, message_count, 
@@ -191,9 +448,9 @@ class SQLiteStorage:
                 ))
                 
                 conn.commit()
-                conn.close()
                 return True
             except Exception as e:
+                self._rollback()
                 print(f"[SQLiteStorage] 创建对话失败: {e}")
                 return False
     
@@ -207,14 +464,12 @@ class SQLiteStorage:
         Returns:
             对话记录字典，未找到返回 None
         """
-        with self._lock:
+        with self._read_connection() as conn:
             try:
-                conn = self._get_connection()
                 cursor = conn.cursor()
                 
                 cursor.execute('SELECT * FROM conversations WHERE id = ?', (conversation_id,))
                 row = cursor.fetchone()
-                conn.close()
                 
                 if row:
                     return self._row_to_conversation(row)
@@ -227,7 +482,8 @@ class SQLiteStorage:
                            messages: List[Dict[str, Any]] = None,
                            system_prompt: str = None,
                            token_usage: Dict[str, int] = None,
-                           metadata: Dict[str, Any] = None) -> bool:
+                           metadata: Dict[str, Any] = None,
+                           now: str = None) -> bool:
         """
         更新对话记录
         
@@ -237,6 +493,7 @@ class SQLiteStorage:
             system_prompt: 系统提示词
             token_usage: Token 使用统计
             metadata: 其他元数据
+            now: 更新时间（ISO 格式，批量更新时由调用方统一传入；默认当前时间）
             
         Returns:
             是否更新成功
@@ -252,7 +509,7 @@ class SQLiteStorage:
                 
                 if messages is not None:
                     updates.append('messages = ?')
-                    params.append(json.dumps(messages, ensure_ascii=False, indent=2))
+                    params.append(json.dumps(messages, ensure_ascii=False, indent=self._json_indent))
                     updates.append('message_count = ?')
                     params.append(len(messages))
                 
@@ -270,19 +527,76 @@ class SQLiteStorage:
                 
                 if updates:
                     updates.append('updated_at = ?')
-                    params.append(datetime.now().isoformat())
+                    params.append(now or _now_iso())
                     params.append(conversation_id)
                     
                     sql = f'UPDATE conversations SET {", ".join(updates)} WHERE id = ?'
+                    cursor.execute('BEGIN IMMEDIATE')
                     cursor.execute(sql, params)
                     conn.commit()
                 
-                conn.close()
                 return True
             except Exception as e:
+                self._rollback()
                 print(f"[SQLiteStorage] 更新对话失败: {e}")
                 return False
     
+    def append_messages(self, conversation_id: str,
+                        messages: List[Dict[str, Any]],
+                        token_usage: Dict[str, int] = None,
+                        drop_first: int = 0) -> bool:
+        """
+        向对话追加消息
+        
+        在 SQL 内用 json_insert 追加，Python 侧无需读取、解析、重新序列化整段历史，
+        单轮追加的开销只与新增消息有关。
+        
+        Args:
+            conversation_id: 对话 ID
+            messages: 要追加的消息列表
+            token_usage: 同时更新的 Token 使用统计（None 表示不更新）
+            drop_first: 追加后从开头移除的消息数（上下文窗口裁剪）
+            
+        Returns:
+            是否追加成功（对话不存在返回 False）
+        """
+        if not messages and not drop_first and token_usage is None:
+            return self.get_conversation(conversation_id) is not None
+        
+        with self._lock:
+            try:
+                conn = self._get_connection()
+                cursor = conn.cursor()
+                
+                now = _now_iso()
+                expr = 'messages'
+                params = []
+                if messages:
+                    paths = ', '.join(["'$[#]', json(?)"] * len(messages))
+                    expr = f'json_insert({expr}, {paths})'
+                    params.extend(json.dumps(message, ensure_ascii=False) for message in messages)
+                if drop_first:
+                    # json_remove 按从左到右的顺序删除，重复 '$[0]' 即依次删除开头的元素
+                    expr = 'json_remove(' + expr + ", '$[0]'" * drop_first + ')'
+                
+                updates = [f'messages = {expr}', 'message_count = message_count + ?', 'updated_at = ?']
+                params.extend([len(messages) - drop_first, now])
+                if token_usage is not None:
+                    updates.append('token_usage = ?')
+                    params.append(json.dumps(token_usage, ensure_ascii=False))
+                params.append(conversation_id)
+                
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.execute(f'UPDATE conversations SET {", ".join(updates)} WHERE id = ?', params)
+                updated_count = cursor.rowcount
+                conn.commit()
+                
+                return updated_count > 0
+            except Exception as e:
+                self._rollback()
+                print(f"[SQLiteStorage] 追加消息失败: {e}")
+                return False
+    
     def delete_conversation(self, conversation_id: str) -> bool:
         """
         删除对话记录
@@ -298,74 +612,75 @@ class SQLiteStorage:
                 conn = self._get_connection()
                 cursor = conn.cursor()
                 
+                cursor.execute('BEGIN IMMEDIATE')
                 cursor.execute('DELETE FROM conversations WHERE id = ?', (conversation_id,))
                 deleted_count = cursor.rowcount
                 conn.commit()
-                conn.close()
                 
                 return deleted_count > 0
             except Exception as e:
+                self._rollback()
                 print(f"[SQLiteStorage] 删除对话失败: {e}")
                 return False
     
     # ========== 批量操作 ==========
     
-    def get_conversations_by_session(self, session_id: str) -> List[Dict[str, Any]]:
+    def get_conversations_by_session(self, session_id: str,
+                                     full: bool = False) -> List[Dict[str, Any]]:
         """
         获取会话的所有对话
         
         Args:
             session_id: 会话 ID
+            full: 是否返回完整记录（默认只返回摘要字段，不解析消息内容）
             
         Returns:
             对话记录列表
         """
-        with self._lock:
+        with self._read_connection() as conn:
             try:
-                conn = self._get_connection()
                 cursor = conn.cursor()
                 
-                cursor.execute('''
-                    SELECT * FROM conversations 
+                cursor.execute(f'''
+                    SELECT {self._select_columns(full)} FROM conversations 
                     WHERE session_id = ? 
                     ORDER BY created_at DESC
                 ''', (session_id,))
                 
                 rows = cursor.fetchall()
-                conn.close()
                 
-                return [self._row_to_conversation(row) for row in rows]
+                return self._convert_rows(rows, full)
             except Exception as e:
                 print(f"[SQLiteStorage] 获取会话对话失败: {e}")
                 return []
     
     def get_recent_conversations(self, limit: int = 50, 
-                                  offset: int = 0) -> List[Dict[str, Any]]:
+                                  offset: int = 0,
+                                  full: bool = False) -> List[Dict[str, Any]]:
         """
         获取最近的对话
         
         Args:
             limit: 返回数量限制
             offset: 偏移量
+            full: 是否返回完整记录（默认只返回摘要字段，不解析消息内容）
             
         Returns:
             对话记录列表
         """
-        with self._lock:
+        with self._read_connection() as conn:
             try:
-                conn = self._get_connection()
                 cursor = conn.cursor()
                 
-                cursor.execute('''
-                    SELECT * FROM conversations 
+                cursor.execute(f'''
+                    SELECT {self._select_columns(full)} FROM conversations 
                     ORDER BY updated_at DESC
                     LIMIT ? OFFSET ?
                 ''', (limit, offset))
                 
                 rows = cursor.fetchall()
-                conn.close()
                 
-                return [self._row_to_conversation(row) for row in rows]
+                return self._convert_rows(rows, full)
             except Exception as e:
                 print(f"[SQLiteStorage] 获取最近对话失败: {e}")
                 return []
@@ -373,34 +688,40 @@ class SQLiteStorage:
     # ========== 搜索功能 ==========
     
     def search_conversations(self, keyword: str, 
-                             limit: int = 100) -> List[Dict[str, Any]]:
+                             limit: int = 100,
+                             session_id: str = None,
+                             full: bool = False) -> List[Dict[str, Any]]:
         """
         搜索对话内容
         
         Args:
             keyword: 搜索关键词
             limit: 返回数量限制
+            session_id: 仅搜索该会话的对话（None 表示全部）
+            full: 是否返回完整记录（默认只返回摘要字段，不解析消息内容）
             
         Returns:
             匹配的对话记录列表
         """
-        with self._lock:
+        with self._read_connection() as conn:
             try:
-                conn = self._get_connection()
                 cursor = conn.cursor()
                 
                 # 在 messages 和 system_prompt 中搜索
-                cursor.execute('''
-                    SELECT * FROM conversations 
-                    WHERE messages LIKE ? OR system_prompt LIKE ?
-                    ORDER BY updated_at DESC
-                    LIMIT ?
-                ''', (f'%{keyword}%', f'%{keyword}%', limit))
-                
-                rows = cursor.fetchall()
-                conn.close()
-                
-                return [self._row_to_conversation(row) for row in rows]
+                if self._use_fts(keyword):
+                    candidate_limit = limit * self.FTS_OVERFETCH if session_id else limit
+                    rows = self._fts_search(cursor, keyword, limit, candidate_limit, session_id, full)
+                else:
+                    cursor.execute(f'''
+                        SELECT {self._select_columns(full)} FROM conversations 
+                        WHERE (messages LIKE ? OR system_prompt LIKE ?)
+                          AND (? IS NULL OR session_id = ?)
+                        ORDER BY updated_at DESC
+                        LIMIT ?
+                    ''', (f'%{keyword}%', f'%{keyword}%', session_id, session_id, limit))
+                    rows = cursor.fetchall()
+                
+                return self._convert_rows(rows, full)
             except Exception as e:
                 print(f"[SQLiteStorage] 搜索对话失败: {e}")
                 return []
@@ -417,25 +738,35 @@ class SQLiteStorage:
         Returns:
             (对话记录, 匹配消息索引) 列表
         """
-        with self._lock:
+        with self._read_connection() as conn:
             try:
-                conn = self._get_connection()
                 cursor = conn.cursor()
                 
-                cursor.execute('SELECT * FROM conversations ORDER BY updated_at DESC LIMIT ?', (limit,))
-                rows = cursor.fetchall()
-                conn.close()
+                if self._use_fts(content):
+                    # 全文索引只用于筛选候选，消息级匹配仍在下方逐条确认
+                    candidate_limit = limit * self.FTS_OVERFETCH
+                    rows = self._fts_search(cursor, content, candidate_limit, candidate_limit)
+                else:
+                    cursor.execute('SELECT * FROM conversations ORDER BY updated_at DESC LIMIT ?', (limit,))
+                    rows = cursor.fetchall()
                 
+                needle = content.lower()
                 results = []
                 for row in rows:
-                    conv = self._row_to_conversation(row)
-                    messages = conv.get('messages', [])
+                    # 只解析 messages 定位匹配消息，命中后才构建完整记录
+                    try:
+                        messages = _json_loads(row['messages']) if row['messages'] else []
+                    except json.JSONDecodeError:
+                        continue
                     
-                    for idx, msg in enumerate(messages):
-                        msg_content = msg.get('content', '')
-                        if content.lower() in msg_content.lower():
-                            results.append((conv, idx))
-                            break
+                    idx = next((i for i, msg in enumerate(messages)
+                                if needle in msg.get('content', '').lower()), None)
+                    if idx is None:
+                        continue
+                    
+                    results.append((self._row_to_conversation(row, messages), idx))
+                    if len(results) >= limit:
+                        break
                 
                 return results
             except Exception as e:
@@ -451,30 +782,22 @@ class SQLiteStorage:
         Returns:
             统计信息字典
         """
-        with self._lock:
+        with self._read_connection() as conn:
             try:
-                conn = self._get_connection()
                 cursor = conn.cursor()
                 
-                # 总对话数
-                cursor.execute('SELECT COUNT(*) FROM conversations')
-                total_count = cursor.fetchone()[0]
-                
-                # 今日对话数
-                today = datetime.now().strftime('%Y-%m-%d')
-                cursor.execute('SELECT COUNT(*) FROM conversations WHERE date(created_at) = ?', (today,))
-                today_count = cursor.fetchone()[0]
-                
-                # 总消息数
-                cursor.execute('SELECT SUM(message_count) FROM conversations')
-                total_messages = cursor.fetchone()[0] or 0
-                
-                # 按会话分组
-                cursor.execute('SELECT session_id, COUNT(*) as cnt FROM conversations GROUP BY session_id')
-                session_counts = cursor.fetchall()
-                unique_sessions = len(session_counts)
-                
-                conn.close()
+                # 总对话数、今日对话数、总消息数、会话数（一次扫描完成）
+                now = datetime.now()
+                today = now.strftime('%Y-%m-%d')
+                tomorrow = (now + timedelta(days=1)).strftime('%Y-%m-%d')
+                cursor.execute('''
+                    SELECT COUNT(*),
+                           COALESCE(SUM(CASE WHEN created_at >= ? AND created_at < ? THEN 1 ELSE 0 END), 0),
+                           COALESCE(SUM(message_count), 0),
+                           COUNT(DISTINCT session_id)
+                    FROM conversations
+                ''', (today, tomorrow))
+                total_count, today_count, total_messages, unique_sessions = cursor.fetchone()
                 
                 return {
                     'total_conversations': total_count,
@@ -501,9 +824,8 @@ class SQLiteStorage:
         Returns:
             导出文件路径
         """
-        with self._lock:
+        with self._read_connection() as conn:
             try:
-                conn = self._get_connection()
                 cursor = conn.cursor()
                 
                 if conversation_ids:
@@ -513,82 +835,184 @@ class SQLiteStorage:
                 else:
                     cursor.execute('SELECT * FROM conversations ORDER BY created_at DESC')
                 
-                rows = cursor.fetchall()
-                conn.close()
-                
-                conversations = [self._row_to_conversation(row) for row in rows]
-                
                 # 生成文件名
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                 filename = f'conversations_export_{timestamp}.{format}'
                 file_path = os.path.join(os.getcwd(), filename)
                 
+                # 逐行流式写出，不在内存中物化全部对话
                 if format == 'json':
                     with open(file_path, 'w', encoding='utf-8') as f:
-                        json.dump(conversations, f, ensure_ascii=False, indent=2)
+                        f.write('[')
+                        separator = '\n'
+                        for row in cursor:
+                            f.write(separator)
+                            f.write(self._row_to_json(row))
+                            separator = ',\n'
+                        f.write('\n]\n')
                 elif format == 'jsonl':
                     with open(file_path, 'w', encoding='utf-8') as f:
-                        for conv in conversations:
-                            f.write(json.dumps(conv, ensure_ascii=False) + '\n')
+                        for row in cursor:
+                            f.write(self._row_to_json(row))
+                            f.write('\n')
                 
                 return file_path
             except Exception as e:
                 print(f"[SQLiteStorage] 导出失败: {e}")
                 return ''
     
-    def import_from_json(self, file_path: str) -> Tuple[int, int]:
+    _IMPORT_SQL = '''
+        INSERT OR REPLACE INTO conversations 
+        (id, session_id, system_prompt, messages, message_count, 
+         token_usage, created_at, updated_at, metadata)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+    
+    # 导入时每批写入的记录数（内存占用与批大小成正比，与文件大小无关）
+    IMPORT_BATCH_SIZE = 1000
+    
+    def import_from_json(self, file_path: str, fast: bool = False) -> Tuple[int, int]:
         """
         从 JSON 文件导入对话记录
         
+        .jsonl 文件逐行解析；.json 数组在安装 ijson 时增量解析，
+        记录按批写入，内存占用不随文件大小增长。
+        
         Args:
-            file_path: JSON 文件路径
+            file_path: JSON/JSONL 文件路径
+            fast: 离线批量导入时关闭 fsync（synchronous=OFF），导入结束后恢复；
+                  导入过程中断电可能损坏数据库
             
         Returns:
             (成功数, 失败数)
         """
         with self._lock:
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    conversations = json.load(f)
-                
-                if not isinstance(conversations, list):
-                    conversations = [conversations]
-                
                 success_count = 0
                 fail_count = 0
                 
                 conn = self._get_connection()
                 cursor = conn.cursor()
                 
-                for conv in conversations:
-                    try:
-                        cursor.execute('''
-                            INSERT OR REPLACE INTO conversations 
-                            (id, session_id, system_prompt, messages, message_count, 
-                             token_usage, created_at, updated_at, metadata)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', (
-                            conv.get('id'),
-                            conv.get('session_id'),
-                            conv.get('system_prompt'),
-                            json.dumps(conv.get('messages', []), ensure_ascii=False),
-                            conv.get('message_count', 0),
-                            json.dumps(conv.get('token_usage', {}), ensure_ascii=False),
-                            conv.get('created_at'),
-                            conv.get('updated_at'),
-                            json.dumps(conv.get('metadata', {}), ensure_ascii=False)
-                        ))
-                        success_count += 1
-                    except Exception:
-                        fail_count += 1
+                if fast:
+                    conn.execute('PRAGMA synchronous = OFF')
+                
+                with open(file_path, 'rb') as f:
+                    # 整个导入在一个事务内完成
+                    conn.execute('BEGIN IMMEDIATE')
+                    
+                    batch = []
+                    for conv in self._iter_import_records(f, file_path):
+                        # 格式错误的记录直接计为失败
+                        try:
+                            batch.append(self._import_params(conv))
+                        except Exception:
+                            fail_count += 1
+                            continue
+                        
+                        if len(batch) >= self.IMPORT_BATCH_SIZE:
+                            succeeded, failed = self._import_batch(cursor, batch)
+                            success_count += succeeded
+                            fail_count += failed
+                            batch = []
+                    
+                    if batch:
+                        succeeded, failed = self._import_batch(cursor, batch)
+                        success_count += succeeded
+                        fail_count += failed
                 
                 conn.commit()
-                conn.close()
                 
                 return success_count, fail_count
             except Exception as e:
                 print(f"[SQLiteStorage] 导入失败: {e}")
                 return 0, 0
+            finally:
+                if self._conn is not None:
+                    if self._conn.in_transaction:
+                        self._conn.rollback()
+                    if fast:
+                        self._conn.execute('PRAGMA synchronous = NORMAL')
+    
+    @staticmethod
+    def _iter_import_records(f, file_path: str) -> Iterator[Any]:
+        """
+        逐条读取导入文件中的对话记录
+        
+        Args:
+            f: 以二进制模式打开的文件
+            file_path: 文件路径（按扩展名区分 JSONL）
+            
+        Yields:
+            对话记录（JSONL 中无法解析的行产出 None，由调用方计为失败）
+        """
+        if file_path.endswith('.jsonl'):
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield _json_loads(line)
+                except ValueError:
+                    yield None
+            return
+        
+        # 跳过前导空白，判断顶层是否为数组
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        
+        if first == b'[' and IJSON_AVAILABLE:
+            yield from ijson.items(f, 'item', use_float=True)
+            return
+        
+        conversations = json.load(f)
+        if not isinstance(conversations, list):
+            conversations = [conversations]
+        yield from conversations
+    
+    @staticmethod
+    def _import_params(conv: Dict[str, Any]) -> tuple:
+        """将导入记录转换为 INSERT 参数"""
+        return (
+            conv.get('id'),
+            conv.get('session_id'),
+            conv.get('system_prompt'),
+            json.dumps(conv.get('messages', []), ensure_ascii=False),
+            conv.get('message_count', 0),
+            json.dumps(conv.get('token_usage', {}), ensure_ascii=False),
+            conv.get('created_at'),
+            conv.get('updated_at'),
+            json.dumps(conv.get('metadata', {}), ensure_ascii=False)
+        )
+    
+    def _import_batch(self, cursor: sqlite3.Cursor, rows: List[tuple]) -> Tuple[int, int]:
+        """
+        写入一批导入记录
+        
+        快速路径为 executemany（语句只预编译一次）；有记录违反约束时
+        回滚到保存点，逐条写入以统计成功/失败数。
+        
+        Returns:
+            (成功数, 失败数)
+        """
+        cursor.execute('SAVEPOINT import_batch')
+        try:
+            cursor.executemany(self._IMPORT_SQL, rows)
+            cursor.execute('RELEASE import_batch')
+            return len(rows), 0
+        except sqlite3.Error:
+            cursor.execute('ROLLBACK TO import_batch')
+            cursor.execute('RELEASE import_batch')
+        
+        success_count = 0
+        for row in rows:
+            try:
+                cursor.execute(self._IMPORT_SQL, row)
+                success_count += 1
+            except sqlite3.Error:
+                pass
+        return success_count, len(rows) - success_count
     
     # ========== 清理功能 ==========
     
@@ -608,30 +1032,39 @@ class SQLiteStorage:
                 cursor = conn.cursor()
                 
                 # 计算日期阈值
-                threshold = datetime.now().timestamp() - (days * 24 * 3600)
-                threshold_date = datetime.fromtimestamp(threshold).strftime('%Y-%m-%d')
+                threshold_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
                 
-                cursor.execute('DELETE FROM conversations WHERE date(created_at) < ?', (threshold_date,))
+                # created_at 为 ISO 8601 文本，直接比较字符串与 date(created_at) < ? 等价，且可使用 idx_created_at
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.execute('DELETE FROM conversations WHERE created_at < ?', (threshold_date,))
                 deleted_count = cursor.rowcount
                 
                 conn.commit()
-                conn.close()
                 
-                # 尝试压缩数据库
-                self.vacuum()
+                # 只回收本次删除释放的页，不重写整个数据库文件
+                # （每次 step 只释放一页，execute 只 step 一次，须用 executescript 执行到底）
+                if deleted_count:
+                    conn.executescript('PRAGMA incremental_vacuum;')
                 
                 return deleted_count
             except Exception as e:
+                self._rollback()
                 print(f"[SQLiteStorage] 清理旧对话失败: {e}")
                 return 0
     
     def vacuum(self):
-        """压缩数据库"""
+        """压缩数据库（重写整个数据库文件，仅用于手动维护；同时使 auto_vacuum 设置对已有数据库生效）"""
         try:
-            conn = self._get_connection()
-            conn.execute('VACUUM')
-            conn.close()
+            with self._lock:
+                conn = self._get_connection()
+                conn.execute('VACUUM')
+                # VACUUM 可能重新编号 rowid，外部内容全文索引需要重建
+                if self._fts_enabled:
+                    conn.execute("INSERT INTO conversations_fts(conversations_fts) VALUES ('rebuild')")
+                    conn.commit()
         except Exception as e:
+            with self._lock:
+                self._rollback()
             print(f"[SQLiteStorage] 数据库压缩失败: {e}")
     
     # ========== 备份功能 ==========
@@ -652,8 +1085,13 @@ class SQLiteStorage:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             backup_path = os.path.join(backup_dir, f'conversations_backup_{timestamp}.db')
             
-            # 复制数据库文件
-            shutil.copy2(self.db_path, backup_path)
+            # 使用 SQLite 在线备份（包含尚未检查点的 WAL 内容）
+            with self._lock:
+                backup_conn = sqlite3.connect(backup_path)
+                try:
+                    self._get_connection().backup(backup_conn, pages=self.BACKUP_PAGES)
+                finally:
+                    backup_conn.close()
             
             # 清理旧备份
             self._cleanup_old_backups(backup_dir)
@@ -691,15 +1129,19 @@ class SQLiteStorage:
             if not os.path.exists(backup_path):
                 return False
             
-            # 关闭当前连接（通过创建新连接确保锁释放）
-            conn = self._get_connection()
-            conn.close()
-            
-            # 备份当前数据库
-            current_backup = self.create_backup()
-            
-            # 复制备份文件覆盖当前数据库
-            shutil.copy2(backup_path, self.db_path)
+            with self._lock:
+                # 备份当前数据库
+                current_backup = self.create_backup()
+                
+                # 通过在线备份 API 将备份内容写回当前数据库（WAL 模式下不能直接覆盖文件）
+                source_conn = sqlite3.connect(backup_path)
+                try:
+                    source_conn.backup(self._get_connection())
+                finally:
+                    source_conn.close()
+                
+                # 旧备份可能没有全文索引，重新检查表结构
+                self._init_database()
             
             return True
         except Exception as e:
@@ -708,22 +1150,68 @@ class SQLiteStorage:
     
     # ========== 辅助方法 ==========
     
-    def _row_to_conversation(self, row: sqlite3.Row) -> Dict[str, Any]:
-        """将数据库行转换为对话字典"""
-        try:
-            messages = json.loads(row['messages']) if row['messages'] else []
-        except json.JSONDecodeError:
-            messages = []
+    def _select_columns(self, full: bool) -> str:
+        """列表查询的 SELECT 列"""
+        return '*' if full else ', '.join(self.SUMMARY_COLUMNS)
+    
+    def _convert_rows(self, rows: List[sqlite3.Row], full: bool) -> List[Dict[str, Any]]:
+        """将列表查询结果转换为完整记录或摘要"""
+        if full:
+            return [self._row_to_conversation(row) for row in rows]
+        return [self._row_summary(row) for row in rows]
+    
+    def _row_summary(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """将数据库行转换为对话摘要（不解析 JSON 字段）"""
+        return {
+            'id': row['id'],
+            'session_id': row['session_id'],
+            'message_count': row['message_count'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at']
+        }
+    
+    @staticmethod
+    def _loads_or_default(raw: Optional[str], empty: Any, invalid: Any) -> Any:
+        """
+        解析 JSON 列
         
+        Args:
+            raw: 列值
+            empty: 列值为空时的返回值
+            invalid: 解析失败时的返回值
+        """
+        if not raw:
+            return empty
         try:
-            token_usage = json.loads(row['token_usage']) if row['token_usage'] else {}
-        except json.JSONDecodeError:
-            token_usage = {'input': 0, 'output': 0}
+            return _json_loads(raw)
+        except ValueError:
+            return invalid
+    
+    def _row_to_conversation(self, row: sqlite3.Row,
+                             messages: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        将数据库行转换为对话字典
+        
+        Args:
+            row: 数据库行
+            messages: 已解析的消息列表（None 时从 row 解析）
+        """
+        raw_messages = row['messages']
+        raw_token_usage = row['token_usage']
+        raw_metadata = row['metadata']
         
         try:
-            metadata = json.loads(row['metadata']) if row['metadata'] else {}
-        except json.JSONDecodeError:
-            metadata = {}
+            # 快速路径：写入端都经 json.dumps 生成，正常情况下不会解析失败
+            if messages is None:
+                messages = _json_loads(raw_messages) if raw_messages else []
+            token_usage = _json_loads(raw_token_usage) if raw_token_usage else {}
+            metadata = _json_loads(raw_metadata) if raw_metadata else {}
+        except ValueError:
+            # 数据损坏时逐列容错解析，保留能解析的字段
+            if messages is None:
+                messages = self._loads_or_default(raw_messages, [], [])
+            token_usage = self._loads_or_default(raw_token_usage, {}, {'input': 0, 'output': 0})
+            metadata = self._loads_or_default(raw_metadata, {}, {})
         
         return {
             'id': row['id'],
@@ -737,17 +1225,44 @@ class SQLiteStorage:
             'metadata': metadata
         }
     
+    @staticmethod
+    def _raw_json(raw: Optional[str], default: str) -> str:
+        """返回可直接拼接的单行 JSON 文本（旧版本以缩进格式存储的数据重新压缩）"""
+        if not raw:
+            return default
+        if '\n' in raw:
+            return json.dumps(json.loads(raw), ensure_ascii=False)
+        return raw
+    
+    def _row_to_json(self, row: sqlite3.Row) -> str:
+        """
+        将数据库行序列化为单行 JSON（字段同 _row_to_conversation）
+        
+        messages/token_usage/metadata 列本身就是 JSON 文本，直接拼接，
+        省去解析后再序列化的开销。
+        """
+        return (
+            '{"id": ' + json.dumps(row['id'], ensure_ascii=False) +
+            ', "session_id": ' + json.dumps(row['session_id'], ensure_ascii=False) +
+            ', "system_prompt": ' + json.dumps(row['system_prompt'], ensure_ascii=False) +
+            ', "messages": ' + self._raw_json(row['messages'], '[]') +
+            ', "message_count": ' + json.dumps(row['message_count']) +
+            ', "token_usage": ' + self._raw_json(row['token_usage'], '{}') +
+            ', "created_at": ' + json.dumps(row['created_at'], ensure_ascii=False) +
+            ', "updated_at": ' + json.dumps(row['updated_at'], ensure_ascii=False) +
+            ', "metadata": ' + self._raw_json(row['metadata'], '{}') +
+            '}'
+        )
+    
     def get_all_session_ids(self) -> List[str]:
         """获取所有会话 ID"""
-        with self._lock:
+        with self._read_connection() as conn:
             try:
-                conn = self._get_connection()
                 cursor = conn.cursor()
                 
                 cursor.execute('SELECT DISTINCT session_id FROM conversations ORDER BY created_at DESC')
                 session_ids = [row[0] for row in cursor.fetchall()]
                 
-                conn.close()
                 return session_ids
             except Exception as e:
                 print(f"[SQLiteStorage] 获取会话 ID 列表失败: {e}")
@@ -755,8 +1270,15 @@ class SQLiteStorage:
     
     def close(self):
         """关闭数据库连接"""
-        # SQLite 不需要显式关闭连接，但可以清理锁
-        pass
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        
+        with self._read_pool_lock:
+            pool, self._read_pool = self._read_pool, []
+        for conn in pool:
+            conn.close()
 
 
 # 全局实例
@@ -796,6 +1318,36 @@ class WakeEventStorage:
     - 事件清理
     """
     
+    # 连接级 PRAGMA（WAL 模式下统计查询不阻塞事件写入，写入只需一次 fsync）
+    CONNECTION_PRAGMAS = (
+        'PRAGMA foreign_keys = ON',
+        'PRAGMA journal_mode = WAL',
+        'PRAGMA synchronous = NORMAL',
+        'PRAGMA temp_store = MEMORY',
+    )
+    
+    # 内存映射读取大小（字节），可通过环境变量 WAKE_DB_MMAP_SIZE 配置，0 表示关闭
+    MMAP_SIZE = int(os.environ.get('WAKE_DB_MMAP_SIZE', 256 * 1024 * 1024))
+    
+    # 合法的触发类型（与表上的 CHECK 约束一致）
+    TRIGGER_TYPES = ('wake_word', 'manual')
+    
+    _INSERT_SQL = '''
+        INSERT INTO wake_events 
+        (session_id, event_time, trigger_type, success, audio_duration, metadata)
+        VALUES (?, ?, ?, ?, ?, ?)
+    '''
+    
+    # 事件查询的列（顺序与 _row_to_wake_event 的位置解包一致）
+    WAKE_EVENT_COLUMNS = 'id, session_id, event_time, trigger_type, success, audio_duration, metadata'
+    
+    # 数据库文件大小的缓存时间（秒），统计接口被频繁轮询时不必每次 stat 文件
+    SIZE_CACHE_TTL = 1.0
+    
+    # 后台写入：每批最多事件数、收到首个事件后等待合并的最长时间（秒）
+    WRITE_BATCH_SIZE = 256
+    WRITE_MAX_DELAY = 0.1
+    
     def __init__(self, db_path: str = None):
         """
         初始化存储管理器
@@ -810,61 +1362,258 @@ class WakeEventStorage:
             self.db_path = db_path
         
         self._lock = threading.RLock()
+        
+        # 复用的数据库连接（首次使用时创建）
+        self._conn: Optional[sqlite3.Connection] = None
+        
+        # 数据库文件大小缓存：(字节数, 获取时的 time.monotonic())
+        self._size_cache: Tuple[int, float] = (0, float('-inf'))
+        
+        # 后台写入队列和线程（首次异步记录时启动）
+        self._write_queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
     
     def _get_connection(self) -> sqlite3.Connection:
-        """获取数据库连接"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        conn.execute('PRAGMA foreign_keys = ON')
+        """
+        获取数据库连接
+        
+        所有操作都在 self._lock 内串行执行，复用同一个长连接，
+        避免每次调用都重新打开数据库及 WAL/SHM 文件。调用方需持有 self._lock。
+        """
+        conn = self._conn
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            for pragma in self.CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            conn.execute(f'PRAGMA mmap_size = {self.MMAP_SIZE}')
+            
+            # 旧数据库可能缺少复合索引（表尚未创建时跳过）
+            try:
+                conn.execute(WAKE_EVENTS_SESSION_TIME_INDEX)
+            except sqlite3.OperationalError:
+                pass
+            
+            self._conn = conn
+        elif conn.in_transaction:
+            # 兜底：上一次操作异常退出时遗留的未提交事务
+            conn.rollback()
         return conn
     
+    def _rollback(self):
+        """回滚未提交的事务，释放写锁（写操作失败时调用，调用方需持有 self._lock）"""
+        conn = self._conn
+        if conn is not None and conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+    
     # ========== 唤醒事件 CRUD ==========
     
     def record_wake_event(self, session_id: str, trigger_type: str,
                           success: bool = True, audio_duration: float = None,
-                          metadata: Dict[str, Any] = None) -> Optional[int]:
+                          metadata: Dict[str, Any] = None,
+                          wait: bool = True) -> Optional[int]:
         """
         记录唤醒事件
         
+        wait=False 时事件只放入后台队列即返回，由写线程攒批后单事务写入，
+        调用方拿不到事件 ID，且最多延迟 WRITE_MAX_DELAY 秒才能被查询到；
+        需要事件 ID 或立即读回时使用默认的同步写入。
+        
         Args:
             session_id: 会话 ID
             trigger_type: 触发类型 ('wake_word' or 'manual')
             success: 是否成功
             audio_duration: 音频时长（秒）
             metadata: 其他元数据
+            wait: 是否同步写入并返回事件 ID
             
         Returns:
-            事件 ID，失败返回 None
+            事件 ID，失败或异步写入时返回 None
         """
+        if not wait:
+            # 入队前校验，避免一条无效事件在写线程中连累同批其他事件
+            if trigger_type not in self.TRIGGER_TYPES:
+                print(f"[WakeEventStorage] 记录唤醒事件失败: 无效的触发类型 {trigger_type!r}")
+                return None
+            self._enqueue({
+                'session_id': session_id,
+                'event_time': _now_iso(),
+                'trigger_type': trigger_type,
+                'success': success,
+                'audio_duration': audio_duration,
+                'metadata': metadata
+            })
+            return None
+        
         with self._lock:
             try:
                 conn = self._get_connection()
-                cursor = conn.cursor()
                 
-                now = datetime.now().isoformat()
-                metadata_json = json.dumps(metadata or {}, ensure_ascii=False)
-                
-                cursor.execute('''
-                    INSERT INTO wake_events 
-                    (session_id, event_time, trigger_type, success, audio_duration, metadata)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    session_id,
-                    now,
-                    trigger_type,
-                    1 if success else 0,
-                    audio_duration,
-                    metadata_json
-                ))
+                now = _now_iso()
+                metadata_json = self._metadata_json(metadata)
+                
+                # with conn：成功时提交，异常时回滚
+                with conn:
+                    cursor = conn.execute(self._INSERT_SQL, (
+                        session_id,
+                        now,
+                        trigger_type,
+                        1 if success else 0,
+                        audio_duration,
+                        metadata_json
+                    ))
+                
+                return cursor.lastrowid
+            except Exception as e:
+                print(f"[WakeEventStorage] 记录唤醒事件失败: {e}")
+                return None
+    
+    def record_wake_events(self, events: List[Dict[str, Any]]) -> int:
+        """
+        批量记录唤醒事件（单个事务内 executemany，只提交一次）
+        
+        无效事件只跳过自身：字段错误的事件不参与写入，违反约束时回滚到保存点后逐条写入。
+        
+        Args:
+            events: 事件列表，字段同 record_wake_event，可选 event_time（默认当前时间）
+            
+        Returns:
+            写入的事件数，失败返回 0
+        """
+        if not events:
+            return 0
+        
+        with self._lock:
+            try:
+                now = _now_iso()
+                rows = []
+                for event in events:
+                    try:
+                        rows.append((
+                            event.get('session_id'),
+                            event.get('event_time') or now,
+                            event['trigger_type'],
+                            1 if event.get('success', True) else 0,
+                            event.get('audio_duration'),
+                            self._metadata_json(event.get('metadata'))
+                        ))
+                    except Exception as e:
+                        print(f"[WakeEventStorage] 跳过无效唤醒事件: {e}")
+                if not rows:
+                    return 0
                 
-                event_id = cursor.lastrowid
+                conn = self._get_connection()
+                conn.execute('BEGIN IMMEDIATE')
+                written = self._insert_batch(conn, rows)
                 conn.commit()
-                conn.close()
                 
-                return event_id
+                if written < len(events):
+                    print(f"[WakeEventStorage] 批量记录唤醒事件: {len(events) - written} 条写入失败")
+                return written
             except Exception as e:
-                print(f"[WakeEventStorage] 记录唤醒事件失败: {e}")
-                return None
+                self._rollback()
+                print(f"[WakeEventStorage] 批量记录唤醒事件失败: {e}")
+                return 0
+    
+    def _insert_batch(self, conn: sqlite3.Connection, rows: List[tuple]) -> int:
+        """
+        在当前事务内写入一批事件
+        
+        快速路径为 executemany；有事件违反约束时回滚到保存点，逐条写入跳过失败的事件。
+        
+        Returns:
+            成功写入的事件数
+        """
+        conn.execute('SAVEPOINT wake_batch')
+        try:
+            conn.executemany(self._INSERT_SQL, rows)
+            conn.execute('RELEASE wake_batch')
+            return len(rows)
+        except sqlite3.Error:
+            conn.execute('ROLLBACK TO wake_batch')
+            conn.execute('RELEASE wake_batch')
+        
+        written = 0
+        for row in rows:
+            try:
+                conn.execute(self._INSERT_SQL, row)
+                written += 1
+            except sqlite3.Error:
+                pass
+        return written
+    
+    def _enqueue(self, event: Dict[str, Any]) -> None:
+        """将事件放入后台写入队列（必要时启动写线程）"""
+        if self._writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(
+                        target=self._write_loop, name='wake-event-writer', daemon=True
+                    )
+                    self._writer.start()
+                    # 进程退出前写入队列中剩余的事件
+                    atexit.register(self.flush)
+        self._write_queue.put(event)
+    
+    def _write_loop(self):
+        """
+        后台写线程：收到首个事件后在 WRITE_MAX_DELAY 内继续收集，
+        最多 WRITE_BATCH_SIZE 条，然后通过 record_wake_events 一次提交
+        
+        队列中的 threading.Event 为 flush() 的屏障：之前的事件写入后置位；
+        None 为停止信号。
+        """
+        q = self._write_queue
+        stopping = False
+        while not stopping:
+            item = q.get()
+            if item is None:
+                break
+            
+            batch = []
+            barriers = []
+            deadline = time.monotonic() + self.WRITE_MAX_DELAY
+            while True:
+                if isinstance(item, threading.Event):
+                    # flush() 正在等待，立即写入已收集的事件
+                    barriers.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.WRITE_BATCH_SIZE:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+            
+            if batch:
+                self.record_wake_events(batch)
+            for barrier in barriers:
+                barrier.set()
+    
+    def flush(self, timeout: float = 5.0) -> None:
+        """
+        等待后台队列中已提交的唤醒事件写入数据库
+        
+        Args:
+            timeout: 最长等待时间（秒）
+        """
+        writer = self._writer
+        if writer is None or not writer.is_alive():
+            return
+        barrier = threading.Event()
+        self._write_queue.put(barrier)
+        barrier.wait(timeout)
     
     def get_wake_event(self, event_id: int) -> Optional[Dict[str, Any]]:
         """
@@ -878,16 +1627,8 @@ class WakeEventStorage:
         """
         with self._lock:
             try:
-                conn = self._get_connection()
-                cursor = conn.cursor()
-                
-                cursor.execute('SELECT * FROM wake_events WHERE id = ?', (event_id,))
-                row = cursor.fetchone()
-                conn.close()
-                
-                if row:
-                    return self._row_to_wake_event(row)
-                return None
+                events = self._fetch_wake_events('WHERE id = ?', (event_id,))
+                return events[0] if events else None
             except Exception as e:
                 print(f"[WakeEventStorage] 获取唤醒事件失败: {e}")
                 return None
@@ -906,20 +1647,10 @@ class WakeEventStorage:
         """
         with self._lock:
             try:
-                conn = self._get_connection()
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    SELECT * FROM wake_events 
-                    WHERE session_id = ?
-                    ORDER BY event_time DESC
-                    LIMIT ?
-                ''', (session_id, limit))
-                
-                rows = cursor.fetchall()
-                conn.close()
-                
-                return [self._row_to_wake_event(row) for row in rows]
+                return self._fetch_wake_events(
+                    'WHERE session_id = ? ORDER BY event_time DESC LIMIT ?',
+                    (session_id, limit)
+                )
             except Exception as e:
                 print(f"[WakeEventStorage] 获取会话唤醒事件失败: {e}")
                 return []
@@ -938,19 +1669,10 @@ class WakeEventStorage:
         """
         with self._lock:
             try:
-                conn = self._get_connection()
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    SELECT * FROM wake_events 
-                    ORDER BY event_time DESC
-                    LIMIT ? OFFSET ?
-                ''', (limit, offset))
-                
-                rows = cursor.fetchall()
-                conn.close()
-                
-                return [self._row_to_wake_event(row) for row in rows]
+                return self._fetch_wake_events(
+                    'ORDER BY event_time DESC LIMIT ? OFFSET ?',
+                    (limit, offset)
+                )
             except Exception as e:
                 print(f"[WakeEventStorage] 获取最近唤醒事件失败: {e}")
                 return []
@@ -973,41 +1695,43 @@ class WakeEventStorage:
                 cursor = conn.cursor()
                 
                 # 计算日期阈值
-                threshold = datetime.now().timestamp() - (days * 24 * 3600)
+                now = datetime.now()
+                threshold = now.timestamp() - (days * 24 * 3600)
                 threshold_date = datetime.fromtimestamp(threshold).strftime('%Y-%m-%d %H:%M:%S')
                 
-                # 总唤醒次数
-                cursor.execute('SELECT COUNT(*) FROM wake_events WHERE event_time >= ?', (threshold_date,))
-                total_count = cursor.fetchone()[0]
-                
-                # 成功次数
-                cursor.execute('SELECT COUNT(*) FROM wake_events WHERE event_time >= ? AND success = 1', (threshold_date,))
-                success_count = cursor.fetchone()[0]
+                # 今日范围：event_time >= 今天 AND < 明天，可走 event_time 索引
+                today = now.strftime('%Y-%m-%d')
+                tomorrow = (now + timedelta(days=1)).strftime('%Y-%m-%d')
                 
-                # 按触发类型统计
+                # 总数、成功数、今日数、平均时长、各触发类型数一次扫描完成
+                # （trigger_type 受 CHECK 约束只有 wake_word / manual 两种）；
+                # 扫描下界取统计窗口与今日起点中较早者，窗口内计数用 CASE 区分
                 cursor.execute('''
-                    SELECT trigger_type, COUNT(*) as cnt
+                    SELECT COALESCE(SUM(CASE WHEN event_time >= ? THEN 1 ELSE 0 END), 0),
+                           COALESCE(SUM(CASE WHEN event_time >= ? AND success = 1 THEN 1 ELSE 0 END), 0),
+                           COALESCE(SUM(CASE WHEN event_time >= ? AND event_time < ? THEN 1 ELSE 0 END), 0),
+                           COALESCE(SUM(CASE WHEN event_time >= ? AND event_time < ? AND success = 1 THEN 1 ELSE 0 END), 0),
+                           AVG(CASE WHEN event_time >= ? THEN audio_duration END),
+                           COALESCE(SUM(CASE WHEN event_time >= ? AND trigger_type = 'wake_word' THEN 1 ELSE 0 END), 0),
+                           COALESCE(SUM(CASE WHEN event_time >= ? AND trigger_type = 'manual' THEN 1 ELSE 0 END), 0)
                     FROM wake_events 
                     WHERE event_time >= ?
-                    GROUP BY trigger_type
-                ''', (threshold_date,))
-                type_stats = {row['trigger_type']: row['cnt'] for row in cursor.fetchall()}
-                
-                # 今日唤醒次数
-                today = datetime.now().strftime('%Y-%m-%d')
-                cursor.execute('SELECT COUNT(*) FROM wake_events WHERE date(event_time) = ?', (today,))
-                today_count = cursor.fetchone()[0]
-                
-                # 今日成功次数
-                cursor.execute('SELECT COUNT(*) FROM wake_events WHERE date(event_time) = ? AND success = 1', (today,))
-                today_success = cursor.fetchone()[0]
+                ''', (
+                    threshold_date, threshold_date,
+                    today, tomorrow, today, tomorrow,
+                    threshold_date, threshold_date, threshold_date,
+                    min(threshold_date, today)
+                ))
+                (total_count, success_count, today_count, today_success,
+                 avg_duration, wake_word_count, manual_count) = cursor.fetchone()
+                avg_duration = avg_duration or 0
                 
-                # 平均音频时长
-                cursor.execute('''
-                    SELECT AVG(audio_duration) FROM wake_events 
-                    WHERE event_time >= ? AND audio_duration IS NOT NULL
-                ''', (threshold_date,))
-                avg_duration = cursor.fetchone()[0] or 0
+                # 按触发类型统计（与原 GROUP BY 结果一致，只列出有事件的类型）
+                type_stats = {}
+                if wake_word_count:
+                    type_stats['wake_word'] = wake_word_count
+                if manual_count:
+                    type_stats['manual'] = manual_count
                 
                 # 按天统计（最近7天）
                 cursor.execute('''
@@ -1027,8 +1751,6 @@ class WakeEventStorage:
                     for row in cursor.fetchall()
                 ]
                 
-                conn.close()
-                
                 return {
                     'period_days': days,
                     'total_events': total_count,
@@ -1040,7 +1762,7 @@ class WakeEventStorage:
                     'by_trigger_type': type_stats,
                     'avg_audio_duration': round(avg_duration, 2),
                     'daily_stats': daily_stats,
-                    'database_size_bytes': os.path.getsize(self.db_path)
+                    'database_size_bytes': self._database_size()
                 }
             except Exception as e:
                 print(f"[WakeEventStorage] 获取统计失败: {e}")
@@ -1061,20 +1783,28 @@ class WakeEventStorage:
         with self._lock:
             try:
                 conn = self._get_connection()
-                cursor = conn.cursor()
                 
-                # 计算日期阈值
-                threshold = datetime.now().timestamp() - (days * 24 * 3600)
-                threshold_date = datetime.fromtimestamp(threshold).strftime('%Y-%m-%d %H:%M:%S')
+                # 计算时间阈值（与 _now_iso 写入的 event_time 同为 'YYYY-MM-DDTHH:MM:SS' 本地时间格式）
+                threshold_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%dT%H:%M:%S')
                 
-                cursor.execute('DELETE FROM wake_events WHERE event_time < ?', (threshold_date,))
-                deleted_count = cursor.rowcount
+                # 删除的是旧数据，无需用零覆盖已释放的页
+                conn.execute('PRAGMA secure_delete = OFF')
+                
+                # event_time 为 ISO 8601 文本，字符串比较即时间先后，范围条件可走 idx_wake_events_event_time
+                conn.execute('BEGIN IMMEDIATE')
+                deleted_count = conn.execute(
+                    'DELETE FROM wake_events WHERE event_time < ?', (threshold_date,)
+                ).rowcount
                 
                 conn.commit()
-                conn.close()
+                
+                # 数据库为增量 auto_vacuum 时回收本次删除释放的页（否则为空操作）
+                if deleted_count:
+                    conn.executescript('PRAGMA incremental_vacuum;')
                 
                 return deleted_count
             except Exception as e:
+                self._rollback()
                 print(f"[WakeEventStorage] 清理旧唤醒事件失败: {e}")
                 return 0
     
@@ -1088,13 +1818,9 @@ class WakeEventStorage:
         with self._lock:
             try:
                 conn = self._get_connection()
-                cursor = conn.cursor()
                 
-                cursor.execute('DELETE FROM wake_events')
-                deleted_count = cursor.rowcount
-                
-                conn.commit()
-                conn.close()
+                with conn:
+                    deleted_count = conn.execute('DELETE FROM wake_events').rowcount
                 
                 return deleted_count
             except Exception as e:
@@ -1103,20 +1829,55 @@ class WakeEventStorage:
     
     # ========== 辅助方法 ==========
     
-    def _row_to_wake_event(self, row: sqlite3.Row) -> Dict[str, Any]:
-        """将数据库行转换为唤醒事件字典"""
-        try:
-            metadata = json.loads(row['metadata']) if row['metadata'] else {}
-        except json.JSONDecodeError:
+    @staticmethod
+    def _metadata_json(metadata: Optional[Dict[str, Any]]) -> Optional[str]:
+        """序列化事件元数据（空元数据存 NULL，读取时按 {} 处理）"""
+        if not metadata:
+            return None
+        return json.dumps(metadata, ensure_ascii=False, separators=(',', ':'))
+    
+    def _database_size(self) -> int:
+        """获取数据库文件大小（缓存 SIZE_CACHE_TTL 秒，调用方需持有 self._lock）"""
+        size, checked_at = self._size_cache
+        now = time.monotonic()
+        if now - checked_at > self.SIZE_CACHE_TTL:
+            size = os.path.getsize(self.db_path)
+            self._size_cache = (size, now)
+        return size
+    
+    def _fetch_wake_events(self, clause: str, params: tuple) -> List[Dict[str, Any]]:
+        """
+        查询唤醒事件并转换为字典（调用方需持有 self._lock）
+        
+        Args:
+            clause: FROM wake_events 之后的 WHERE / ORDER BY / LIMIT 子句
+            params: 子句参数
+        """
+        cursor = self._get_connection().cursor()
+        # 列顺序固定，绕过连接上的 sqlite3.Row 工厂，按位置取列
+        cursor.row_factory = None
+        cursor.execute(f'SELECT {self.WAKE_EVENT_COLUMNS} FROM wake_events {clause}', params)
+        return [self._row_to_wake_event(row) for row in cursor.fetchall()]
+    
+    def _row_to_wake_event(self, row: tuple) -> Dict[str, Any]:
+        """将 WAKE_EVENT_COLUMNS 顺序的数据库行转换为唤醒事件字典"""
+        event_id, session_id, event_time, trigger_type, success, audio_duration, raw_metadata = row
+        if not raw_metadata or raw_metadata == '{}':
+            # 绝大多数事件没有元数据，跳过解析
             metadata = {}
+        else:
+            try:
+                metadata = _json_loads(raw_metadata)
+            except ValueError:
+                metadata = {}
         
         return {
-            'id': row['id'],
-            'session_id': row['session_id'],
-            'event_time': row['event_time'],
-            'trigger_type': row['trigger_type'],
-            'success': bool(row['success']),
-            'audio_duration': row['audio_duration'],
+            'id': event_id,
+            'session_id': session_id,
+            'event_time': event_time,
+            'trigger_type': trigger_type,
+            'success': bool(success),
+            'audio_duration': audio_duration,
             'metadata': metadata
         }
     
@@ -1125,20 +1886,31 @@ class WakeEventStorage:
         with self._lock:
             try:
                 conn = self._get_connection()
-                cursor = conn.cursor()
                 
-                cursor.execute('SELECT DISTINCT session_id FROM wake_events ORDER BY event_time DESC')
-                session_ids = [row[0] for row in cursor.fetchall()]
+                session_ids = [
+                    row[0] for row in
+                    conn.execute('SELECT DISTINCT session_id FROM wake_events ORDER BY event_time DESC')
+                ]
                 
-                conn.close()
                 return session_ids
             except Exception as e:
                 print(f"[WakeEventStorage] 获取会话 ID 列表失败: {e}")
                 return []
     
     def close(self):
-        """关闭数据库连接"""
-        pass
+        """写入后台队列中剩余的事件并关闭数据库连接"""
+        self.flush()
+        with self._writer_lock:
+            writer = self._writer
+            if writer is not None:
+                self._write_queue.put(None)
+                writer.join(5.0)
+                self._writer = None
+        
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
 
 
 # 全局唤醒事件存储实例
@@ -1159,4 +1931,6 @@ def get_wake_storage(db_path: str = None) -> WakeEventStorage:
 def reset_wake_storage():
     """重置唤醒事件存储（用于测试）"""
     global _wake_storage
+    if _wake_storage:
+        _wake_storage.close()
     _wake_storage = None
@@ -5,15 +5,16 @@
 用于跟踪 AI 对话任务的执行状态
 """
 
-import uuid
+import secrets
 import json
 import threading
 import time
 from datetime import datetime
 from enum import Enum
 from typing import Dict, List, Optional
-from dataclasses import dataclass, field, asdict
-from collections import defaultdict
+from dataclasses import dataclass, field
+from collections import defaultdict, OrderedDict
+from itertools import islice
 from flask import jsonify, request
 
 
@@ -25,6 +26,11 @@ class TaskStatus(Enum):
     FAILED = "failed"         # 失败
 
 
+def _iso(ts: Optional[float]) -> Optional[str]:
+    """将 time.time() 时间戳格式化为 ISO 字符串（None 原样返回）"""
+    return datetime.fromtimestamp(ts).isoformat() if ts is not None else None
+
+
 @dataclass
 class Task:
     """任务数据类"""
@@ -33,13 +39,52 @@ class Task:
     status: str
     progress: int  # 0-100
     message: str
-    created_at: str
-    started_at: Optional[str] = None
-    completed_at: Optional[str] = None
+    # 时间戳以 time.time() 浮点数保存，只在输出时格式化为 ISO 字符串
+    created_at_ts: float
+    started_at_ts: Optional[float] = None
+    completed_at_ts: Optional[float] = None
     metadata: Dict = field(default_factory=dict)
+    # to_dict 缓存：(版本号, 字典)；TaskManager 修改任务后递增版本号，旧缓存即失效
+    _version: int = field(default=0, repr=False, compare=False)
+    _dict_cache: Optional[tuple] = field(default=None, repr=False, compare=False)
     
     def to_dict(self):
-        return asdict(self)
+        """转换为字典（结果会被缓存复用，调用方不要修改返回值）"""
+        version = self._version
+        cache = self._dict_cache
+        if cache is not None and cache[0] == version:
+            return cache[1]
+        
+        # 手动构建，避免 asdict 对 metadata 递归深拷贝
+        data = {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'created_at': _iso(self.created_at_ts),
+            'started_at': _iso(self.started_at_ts),
+            'completed_at': _iso(self.completed_at_ts),
+            'metadata': dict(self.metadata)
+        }
+        # 构建期间若任务被修改，版本号已变，这份缓存下次读取时不会命中
+        self._dict_cache = (version, data)
+        return data
+    
+    @property
+    def created_at(self) -> str:
+        """创建时间（ISO 格式）"""
+        return _iso(self.created_at_ts)
+    
+    @property
+    def started_at(self) -> Optional[str]:
+        """开始时间（ISO 格式）"""
+        return _iso(self.started_at_ts)
+    
+    @property
+    def completed_at(self) -> Optional[str]:
+        """完成时间（ISO 格式）"""
+        return _iso(self.completed_at_ts)
 
 
 class TaskManager:
@@ -53,62 +98,119 @@ class TaskManager:
             with cls._lock:
                 if cls._instance is None:
                     cls._instance = super().__new__(cls)
-                    cls._instance._tasks: Dict[str, Task] = {}
+                    # 按创建顺序保存，最早的任务在最前面
+                    cls._instance._tasks: Dict[str, Task] = OrderedDict()
                     cls._instance._max_tasks = 100  # 最多保留100个任务
+                    # 保护 _tasks 的实例锁（Flask 多线程处理请求）
+                    cls._instance._mu = threading.Lock()
+                    # 各状态任务数，随状态变化增减，get_statistics 无需遍历任务
+                    cls._instance._counts: Dict[str, int] = {
+                        status.value: 0 for status in TaskStatus
+                    }
         return cls._instance
     
-    def create_task(self, name: str, metadata: Dict = None) -> Task:
-        """创建新任务"""
-        task_id = str(uuid.uuid4())[:8]
+    def _set_status(self, task: Task, status: str):
+        """修改任务状态并同步计数（调用方需持有 self._mu）"""
+        self._counts[task.status] -= 1
+        self._counts[status] += 1
+        task.status = status
+    
+    def create_task(self, name: str, metadata: Dict = None,
+                    start_message: str = None) -> Task:
+        """
+        创建新任务
         
+        Args:
+            name: 任务名称
+            metadata: 任务元数据
+            start_message: 指定时任务创建后直接处于处理中状态（省去一次 start_task）
+        """
+        now = time.time()
         task = Task(
-            id=task_id,
+            id='',
             name=name,
             status=TaskStatus.PENDING.value,
             progress=0,
             message="任务已创建，等待处理",
-            created_at=datetime.now().isoformat(),
+            created_at_ts=now,
             metadata=metadata or {}
         )
+        if start_message is not None:
+            task.status = TaskStatus.PROCESSING.value
+            task.started_at_ts = now
+            task.message = start_message
         
-        self._tasks[task_id] = task
-        self._cleanup_old_tasks()
+        with self._mu:
+            # 8 位十六进制随机 ID（与原 uuid4 前 8 位格式相同），极少数重复时重新生成
+            task_id = secrets.token_hex(4)
+            while task_id in self._tasks:
+                task_id = secrets.token_hex(4)
+            task.id = task_id
+            self._tasks[task_id] = task
+            self._counts[task.status] += 1
+            self._cleanup_old_tasks()
         
         return task
     
+    def apply(self, task_id: str, **changes) -> Optional[Task]:
+        """
+        一次加锁修改任务的多个字段
+        
+        Args:
+            task_id: 任务 ID
+            **changes: 字段名与新值（status 会同步更新状态计数）
+            
+        Returns:
+            修改后的任务，不存在返回 None
+        """
+        with self._mu:
+            task = self._tasks.get(task_id)
+            if task:
+                status = changes.pop('status', None)
+                if status is not None:
+                    self._set_status(task, status)
+                for key, value in changes.items():
+                    setattr(task, key, value)
+                task._version += 1
+        return task
+    
     def start_task(self, task_id: str, message: str = "开始处理") -> Optional[Task]:
         """开始执行任务"""
-        task = self._tasks.get(task_id)
-        if task:
-            task.status = TaskStatus.PROCESSING.value
-            task.started_at = datetime.now().isoformat()
-            task.message = message
-        return task
+        return self.apply(
+            task_id,
+            status=TaskStatus.PROCESSING.value,
+            started_at_ts=time.time(),
+            message=message
+        )
     
     def update_progress(self, task_id: str, progress: int, message: str = None):
         """更新任务进度"""
-        task = self._tasks.get(task_id)
-        if task:
-            task.progress = max(0, min(100, progress))
-            if message:
-                task.message = message
+        with self._mu:
+            task = self._tasks.get(task_id)
+            if task:
+                task.progress = max(0, min(100, progress))
+                if message:
+                    task.message = message
+                task._version += 1
     
     def complete_task(self, task_id: str, message: str = "任务完成"):
         """完成任务"""
-        task = self._tasks.get(task_id)
-        if task:
-            task.status = TaskStatus.COMPLETED.value
-            task.progress = 100
-            task.completed_at = datetime.now().isoformat()
-            task.message = message
+        self.apply(
+            task_id,
+            status=TaskStatus.COMPLETED.value,
+            progress=100,
+            completed_at_ts=time.time(),
+            message=message
+        )
     
     def fail_task(self, task_id: str, message: str = "任务失败"):
         """任务失败"""
-        task = self._tasks.get(task_id)
-        if task:
-            task.status = TaskStatus.FAILED.value
-            task.completed_at = datetime.now().isoformat()
-            task.message = message
+        self.apply(
+            task_id,
+            status=TaskStatus.FAILED.value,
+            completed_at_ts=time.time(),
+            message=message
+        )
     
     def get_task(self, task_id: str) -> Optional[Task]:
         """获取任务详情"""
@@ -116,16 +218,24 @@ class TaskManager:
     
     def get_all_tasks(self) -> List[Task]:
         """获取所有任务（按创建时间倒序）"""
-        tasks = list(self._tasks.values())
-        tasks.sort(key=lambda x: x.created_at, reverse=True)
-        return tasks
+        with self._mu:
+            return list(reversed(self._tasks.values()))
     
     def get_active_tasks(self) -> List[Task]:
         """获取正在处理的任务"""
-        return [
-            t for t in self._tasks.values()
-            if t.status == TaskStatus.PROCESSING.value
-        ]
+        with self._mu:
+            return [
+                t for t in self._tasks.values()
+                if t.status == TaskStatus.PROCESSING.value
+            ]
+    
+    def get_tasks_by_status(self, status: str, limit: int = 10) -> List[Task]:
+        """获取指定状态的最近任务（从最新任务开始筛选，取够 limit 个即停止）"""
+        with self._mu:
+            return list(islice(
+                (t for t in reversed(self._tasks.values()) if t.status == status),
+                max(limit, 0)
+            ))
     
     def get_recent_tasks(self, limit: int = 10) -> List[Task]:
         """获取最近的任务"""
@@ -134,42 +244,36 @@ class TaskManager:
     
     def get_statistics(self) -> Dict:
         """获取任务统计"""
-        tasks = list(self._tasks.values())
-        
-        stats = {
-            "total": len(tasks),
-            "pending": 0,
-            "processing": 0,
-            "completed": 0,
-            "failed": 0
-        }
-        
-        for task in tasks:
-            if task.status in stats:
-                stats[task.status] += 1
-        
+        with self._mu:
+            stats = {"total": len(self._tasks)}
+            stats.update(self._counts)
         return stats
     
     def _cleanup_old_tasks(self):
-        """清理旧任务（保留最近的任务）"""
+        """清理旧任务（保留最近的任务，调用方需持有 self._mu）"""
         while len(self._tasks) > self._max_tasks:
-            # 删除最早的任务
-            oldest_id = min(
-                self._tasks.keys(),
-                key=lambda x: self._tasks[x].created_at
-            )
-            del self._tasks[oldest_id]
+            # 删除最早的任务（插入顺序即创建顺序）
+            _, task = self._tasks.popitem(last=False)
+            self._counts[task.status] -= 1
     
     def clear_completed(self):
         """清除已完成的任务"""
-        self._tasks = {
-            k: v for k, v in self._tasks.items()
-            if v.status != TaskStatus.COMPLETED.value
-        }
+        with self._mu:
+            # 原地删除，保持插入顺序且不重建整个字典
+            completed = [
+                k for k, v in self._tasks.items()
+                if v.status == TaskStatus.COMPLETED.value
+            ]
+            for k in completed:
+                del self._tasks[k]
+            self._counts[TaskStatus.COMPLETED.value] = 0
     
     def clear_all(self):
         """清除所有任务"""
-        self._tasks.clear()
+        with self._mu:
+            self._tasks.clear()
+            for status in self._counts:
+                self._counts[status] = 0
 
 
 # 全局任务管理器实例
@@ -190,10 +294,7 @@ def register_task_routes(app):
         status = request.args.get('status')
         
         if status:
-            tasks = [
-                t for t in task_manager.get_all_tasks()
-                if t.status == status
-            ][:limit]
+            tasks = task_manager.get_tasks_by_status(status, limit)
         else:
             tasks = task_manager.get_recent_tasks(limit)
         
@@ -264,13 +365,12 @@ class ConversationTask:
         self.name = name
     
     def __enter__(self):
-        """开始任务"""
-        self.task_id = task_manager.create_task(self.name).id
-        task_manager.start_task(self.task_id, "正在思考...")
+        """开始任务（创建时即为处理中状态，只加一次锁）"""
+        self.task_id = task_manager.create_task(self.name, start_message="正在思考...").id
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        """结束任务"""
+        """结束任务（状态、完成时间、消息在一次 apply 中更新）"""
         if exc_type is None:
             task_manager.complete_task(self.task_id, "对话完成")
         else: